@@ -0,0 +1,57 @@
+"""Time the import of each groupy module in a fresh interpreter.
+
+Fails if importing a module loads one of the heavy optional dependencies,
+which are only imported inside the functions that need them, or if it
+takes longer than the time budget.
+
+Usage: python bench_import_time.py [budget_in_seconds]
+"""
+from __future__ import print_function
+
+import os
+import subprocess
+import sys
+
+MODULES = ['groupy.box', 'groupy.general', 'groupy.mdio', 'groupy.gbb',
+           'groupy.system', 'groupy.monolayers', 'groupy.visualization',
+           'groupy.rdf', 'groupy.transport', 'groupy.density_maps']
+
+HEAVY = ['matplotlib', 'mpl_toolkits.mplot3d', 'scipy.stats',
+         'scipy.integrate', 'scipy.optimize', 'scipy.spatial', 'scitools']
+
+# runs in the child interpreter, numpy is imported first so that its
+# import time is not charged to groupy
+SCRIPT = """
+import sys, time
+import numpy
+start = time.time()
+__import__({module!r})
+elapsed = time.time() - start
+heavy = [name for name in {heavy!r} if name in sys.modules]
+print(elapsed)
+print(','.join(heavy))
+"""
+
+budget = float(sys.argv[1]) if len(sys.argv) > 1 else 0.5
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+env = dict(os.environ)
+env['PYTHONPATH'] = os.pathsep.join(
+    [root] + [p for p in [env.get('PYTHONPATH')] if p])
+
+failed = False
+for module in MODULES:
+    out = subprocess.check_output(
+        [sys.executable, '-c', SCRIPT.format(module=module, heavy=HEAVY)],
+        env=env).decode().splitlines()
+    elapsed = float(out[0])
+    heavy = out[1] if len(out) > 1 else ''
+    status = 'ok'
+    if heavy:
+        status = 'loads ' + heavy
+        failed = True
+    elif elapsed > budget:
+        status = 'over budget'
+        failed = True
+    print('{0:<24s} {1:8.3f} s  {2}'.format(module, elapsed, status))
+
+sys.exit(1 if failed else 0)
@@ -0,0 +1,51 @@
+"""Time Gbb.load_xml_prototype on a large synthetic HOOMD xml file.
+
+Usage: python bench_xml_prototype.py [n_atoms]
+"""
+from __future__ import print_function
+
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from groupy.gbb import Gbb
+
+n_atoms = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+n_bonds = n_atoms - 1
+
+# --- write a membrane-sized prototype ---
+xyz = np.random.uniform(-50, 50, size=(n_atoms, 3))
+fd, file_name = tempfile.mkstemp(suffix='.xml')
+with os.fdopen(fd, 'w') as f:
+    f.write('<?xml version="1.0" encoding="UTF-8"?>\n<hoomd_xml>\n')
+    f.write('<configuration time_step="0">\n')
+    f.write('<position num="%d">\n' % n_atoms)
+    np.savetxt(f, xyz, fmt='%.4f')
+    f.write('</position>\n<type>\n')
+    f.write('C\n' * n_atoms)
+    f.write('</type>\n<mass>\n')
+    f.write('12.011\n' * n_atoms)
+    f.write('</mass>\n<charge>\n')
+    f.write('0.0\n' * n_atoms)
+    f.write('</charge>\n<bond>\n')
+    np.savetxt(f, np.column_stack((np.ones(n_bonds, dtype=int),
+                                   np.arange(n_bonds),
+                                   np.arange(1, n_bonds + 1))), fmt='%d')
+    f.write('</bond>\n</configuration>\n</hoomd_xml>\n')
+print('Wrote {0} atoms ({1:.1f} MB)'.format(
+      n_atoms, os.path.getsize(file_name) / 1024.0 ** 2))
+
+# --- time it ---
+try:
+    start = time.time()
+    gbb = Gbb()
+    gbb.load_xml_prototype(file_name)
+    elapsed = time.time() - start
+    assert gbb.xyz.shape == (n_atoms, 3)
+    assert gbb.bonds.shape == (n_bonds, 3)
+    print('load_xml_prototype: {0:.2f} s'.format(elapsed))
+finally:
+    os.remove(file_name)
@@ -1,3 +1,7 @@
+from __future__ import print_function
+
+import matplotlib.pyplot as plt
+
 from groupy.general import *
 from groupy.monolayers import *
 
@@ -10,7 +14,7 @@ n_planes = 100  # number of flux planes
 # atom indices of regions
 botsub_ids = range(3200)
 botfilm_ids = range(3200, 4180)
-water_ids = range(4180, 6880) + range(11060, 13760)
+water_ids = list(range(4180, 6880)) + list(range(11060, 13760))
 topsub_ids = range(6880, 10080)
 topfilm_ids = range(10080, 11060)
 
@@ -52,8 +56,8 @@ for i in range(fluxes.shape[1]):
 # show fluxes at respective z-coords
 fig = plt.figure()
 plt.plot(avg_fluxes, planes)
-plt.xlabel(ur'Flux (molecules/nm$\mathregular{^2\cdot}$ ps)')
-plt.ylabel(ur'z (\u00c5)')
+plt.xlabel(r'Flux (molecules/nm$\mathregular{^2\cdot}$ ps)')
+plt.ylabel(u'z (\u00c5)')
 fig_name = 'example_outputs/flux_vs_z.pdf'
 fig.savefig(fig_name, bbox_inches='tight')
-print "Saved '" + fig_name + "'"
+print("Saved '" + fig_name + "'")
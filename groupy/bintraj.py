@@ -0,0 +1,406 @@
+"""Binary trajectory formats.
+
+DCD files (as written by CHARMM, NAMD and LAMMPS 'dump dcd') have a fixed
+record size per frame, so they are read through a memory map and any frame is
+addressed directly.
+
+GCZ files are groupy's compressed format. Each frame is quantized to a fixed
+precision, delta coded along the atom index, byte shuffled and zlib
+compressed, similar in spirit to GROMACS xtc. Frames are self-contained
+records, so files can be appended to and concatenated with 'cat'.
+"""
+from __future__ import division, print_function
+
+import struct
+import zlib
+
+import numpy as np
+
+from groupy.box import Box
+from groupy.mdio import _IndexedTrajectory
+
+_DCD_HEADER_SIZE = 84
+_DCD_VERSION = 24
+
+
+def _dcd_frame_dtype(n_atoms, has_cell, endian='<'):
+    """Structured dtype of one DCD frame including the Fortran record markers.
+    """
+    fields = list()
+    if has_cell:
+        fields += [('cell_head', endian + 'i4'),
+                   ('cell', endian + 'f8', (6,)),
+                   ('cell_tail', endian + 'i4')]
+    for axis in 'xyz':
+        fields += [(axis + '_head', endian + 'i4'),
+                   (axis, endian + 'f4', (n_atoms,)),
+                   (axis + '_tail', endian + 'i4')]
+    return np.dtype(fields)
+
+
+def _cell_lengths(cell):
+    """Box lengths from the CHARMM unit cell (A, gamma, B, beta, alpha, C)."""
+    return np.asarray(cell)[..., [0, 2, 5]]
+
+
+class DcdTrajectory():
+    """Memory mapped DCD trajectory, frames are (n_atoms, 3) float32 arrays.
+
+    Only files without fixed atoms are supported. The number of frames is
+    taken from the file size since LAMMPS does not fill in the frame count.
+
+    Example:
+        with DcdTrajectory('traj.dcd') as traj:
+            for xyz in traj[::10]:
+                ...
+            last_box = traj.box(-1)
+    """
+    def __init__(self, file_name):
+        """Read the header and map the frames.
+
+        Args:
+            file_name (str): name of the .dcd file
+        """
+        self.file_name = file_name
+        with open(file_name, 'rb') as f:
+            marker = f.read(4)
+            if struct.unpack('<i', marker)[0] == _DCD_HEADER_SIZE:
+                endian = '<'
+            elif struct.unpack('>i', marker)[0] == _DCD_HEADER_SIZE:
+                endian = '>'
+            else:
+                raise IOError("'{0}' is not a DCD file".format(file_name))
+            header = f.read(_DCD_HEADER_SIZE + 4)
+            if header[:4] != b'CORD':
+                raise IOError("'{0}' is not a DCD file".format(file_name))
+            icntrl = struct.unpack(endian + '20i', header[4:84])
+            self.timestep = icntrl[1]
+            self.interval = icntrl[2]
+            self.delta = struct.unpack(endian + 'f', header[40:44])[0]
+            self.has_cell = bool(icntrl[10])
+            if icntrl[8] != 0:
+                raise NotImplementedError('DCD files with fixed atoms')
+            if icntrl[11] != 0:
+                raise NotImplementedError('DCD files with 4D coordinates')
+
+            size = struct.unpack(endian + 'i', f.read(4))[0]
+            title = f.read(size)
+            f.read(4)
+            n_titles = struct.unpack(endian + 'i', title[:4])[0]
+            self.title = [title[4 + 80 * i:84 + 80 * i].decode('ascii', 'replace')
+                          .rstrip('\x00 ') for i in range(n_titles)]
+
+            f.read(4)
+            self.n_atoms = struct.unpack(endian + 'i', f.read(4))[0]
+            f.read(4)
+            self.offset = f.tell()
+
+        self.dtype = _dcd_frame_dtype(self.n_atoms, self.has_cell, endian)
+        self.frames = self._map()
+
+    def _map(self):
+        """Map all complete frames."""
+        with open(self.file_name, 'rb') as f:
+            f.seek(0, 2)
+            n_frames = (f.tell() - self.offset) // self.dtype.itemsize
+        if n_frames > 0:
+            return np.memmap(self.file_name, dtype=self.dtype, mode='r',
+                             offset=self.offset, shape=(n_frames,))
+        return np.empty(shape=(0,), dtype=self.dtype)
+
+    def refresh(self):
+        """Map the frames completed since the file was opened.
+
+        Returns:
+            n_new (int): number of new frames
+        """
+        n_frames = len(self)
+        self.frames = self._map()
+        return len(self) - n_frames
+
+    def __len__(self):
+        return self.frames.shape[0]
+
+    def __getitem__(self, index):
+        """Coordinates of one frame, or a (n_frames, n_atoms, 3) array for a
+        slice."""
+        frames = self.frames[index]
+        return np.stack((frames['x'], frames['y'], frames['z']), axis=-1)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def box(self, index):
+        """Box of a frame, centered on the origin.
+
+        Returns None if the file has no unit cell or the cell of the frame is
+        zero, e.g. for frames written without a box.
+        """
+        if not self.has_cell:
+            return None
+        lengths = _cell_lengths(self.frames[index]['cell'])
+        if not np.any(lengths):
+            return None
+        return Box(lengths=lengths)
+
+    def timesteps(self):
+        """Timestep of each frame."""
+        return self.timestep + self.interval * np.arange(len(self))
+
+    def close(self):
+        # the map is released once no frames returned by it are alive
+        self.frames = np.empty(shape=(0,), dtype=self.dtype)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class DcdWriter():
+    """Write a DCD trajectory frame by frame.
+
+    The frame count in the header is filled in when the file is closed. If
+    frames are written with their timesteps, the first timestep and the
+    interval are taken from the first two frames.
+    """
+    def __init__(self, file_name, n_atoms, timestep=0, interval=1, delta=1.0,
+                 title='Created by groupy'):
+        """Open the file and write the header.
+
+        Args:
+            file_name (str): name of the .dcd file
+            n_atoms (int): number of atoms per frame
+            timestep (int): timestep of the first frame
+            interval (int): timesteps between frames
+            delta (float): length of a timestep
+            title (str): title record, truncated to 80 characters
+        """
+        self.file_name = file_name
+        self.n_atoms = n_atoms
+        self.timestep = timestep
+        self.interval = interval
+        self.n_frames = 0
+        self._steps = list()
+        self.dtype = _dcd_frame_dtype(n_atoms, True)
+        self._frame = np.zeros(shape=(1,), dtype=self.dtype)
+        self._frame['cell_head'] = self._frame['cell_tail'] = 48
+        for axis in 'xyz':
+            self._frame[axis + '_head'] = 4 * n_atoms
+            self._frame[axis + '_tail'] = 4 * n_atoms
+        self._file = open(file_name, 'wb')
+
+        icntrl = [0] * 20
+        icntrl[1] = timestep
+        icntrl[2] = interval
+        icntrl[10] = 1  # unit cell in every frame
+        icntrl[19] = _DCD_VERSION
+        header = struct.pack('<i4s9i', _DCD_HEADER_SIZE, b'CORD', *icntrl[:9])
+        header += struct.pack('<f', delta)
+        header += struct.pack('<10ii', *(icntrl[10:] + [_DCD_HEADER_SIZE]))
+        title = title.encode('ascii')[:80].ljust(80)
+        header += struct.pack('<ii80si', 84, 1, title, 84)
+        header += struct.pack('<iii', 4, n_atoms, 4)
+        self._file.write(header)
+
+    def write_frame(self, xyz, box=None, step=None):
+        """Append a frame.
+
+        Args:
+            xyz (np.ndarray): (n_atoms, 3) coordinates
+            box (Box): simulation box, its lengths are stored in the unit cell
+            step (int): timestep of the frame
+        """
+        xyz = np.asarray(xyz)
+        assert xyz.shape == (self.n_atoms, 3)
+        if step is not None and len(self._steps) < 2:
+            self._steps.append(step)
+        frame = self._frame
+        if box is not None:
+            frame['cell'][0] = [box.lengths[0], 90.0, box.lengths[1],
+                                90.0, 90.0, box.lengths[2]]
+        else:
+            # a zero cell is read back as no box
+            frame['cell'][0] = 0.0
+        for k, axis in enumerate('xyz'):
+            frame[axis][0] = xyz[:, k]
+        self._file.write(self._frame.tobytes())
+        self.n_frames += 1
+
+    def close(self):
+        if self._file.closed:
+            return
+        if self._steps:
+            self.timestep = self._steps[0]
+        if len(self._steps) == 2 and self._steps[1] > self._steps[0]:
+            self.interval = self._steps[1] - self._steps[0]
+        last = self.timestep + self.interval * max(self.n_frames - 1, 0)
+        self._file.seek(8)
+        self._file.write(struct.pack('<4i', self.n_frames, self.timestep,
+                                     self.interval, last))
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+# magic, n_atoms, step, precision, box lengths, byte width, payload size
+_GCZ_HEADER = struct.Struct('<4siqd3dii')
+_GCZ_MAGIC = b'GCZ1'
+
+
+def _zigzag(values):
+    """Map signed integers onto unsigned ones, small magnitudes first."""
+    return ((values << 1) ^ (values >> 63)).astype(np.uint64)
+
+
+def _unzigzag(values):
+    values = values.astype(np.int64)
+    return (values >> 1) ^ -(values & 1)
+
+
+def encode_gcz_frame(xyz, step=0, box=None, precision=1000.0, level=6):
+    """Compress one frame into a self-contained GCZ record.
+
+    Args:
+        xyz (np.ndarray): (n_atoms, 3) coordinates
+        step (int): timestep of the frame
+        box (Box): simulation box
+        precision (float): coordinates are stored to 1 / precision
+        level (int): zlib compression level
+    Returns:
+        record (bytes):
+    """
+    xyz = np.asarray(xyz, dtype=np.float64).reshape(-1, 3)
+    n_atoms = xyz.shape[0]
+    quantized = np.round(xyz * precision).astype(np.int64)
+    # neighbouring atoms are usually close, so their differences are small
+    deltas = quantized.copy()
+    deltas[1:] -= quantized[:-1]
+    values = _zigzag(deltas)
+    width = 1
+    max_value = int(values.max()) if n_atoms else 0
+    while width < 8 and max_value >= 1 << (8 * width):
+        width *= 2
+    values = values.astype('<u%d' % width)
+    # byte shuffle: all low bytes, then all next bytes, ...
+    shuffled = values.view(np.uint8).reshape(-1, width).T.tobytes()
+    payload = zlib.compress(shuffled, level)
+    lengths = box.lengths if box is not None else (0.0, 0.0, 0.0)
+    header = _GCZ_HEADER.pack(_GCZ_MAGIC, n_atoms, step, precision,
+                              lengths[0], lengths[1], lengths[2],
+                              width, len(payload))
+    return header + payload
+
+
+def _read_gcz_header(f):
+    """Unpack the header of the record at the current position.
+
+    Returns None at the end of the file.
+    """
+    data = f.read(_GCZ_HEADER.size)
+    if len(data) < _GCZ_HEADER.size:
+        return None
+    header = _GCZ_HEADER.unpack(data)
+    if header[0] != _GCZ_MAGIC:
+        raise IOError('Corrupt GCZ record')
+    return header
+
+
+def _decode_gcz_frame(f):
+    """Read one GCZ record from the current position.
+
+    Returns:
+        xyz (np.ndarray): (n_atoms, 3) float64 coordinates
+        step (int): timestep of the frame
+        box (Box): simulation box, None if it was not stored
+    """
+    (_, n_atoms, step, precision, lx, ly, lz,
+     width, n_bytes) = _read_gcz_header(f)
+    shuffled = np.frombuffer(zlib.decompress(f.read(n_bytes)), dtype=np.uint8)
+    values = shuffled.reshape(width, -1).T.copy().view('<u%d' % width)
+    deltas = _unzigzag(values.reshape(n_atoms, 3))
+    xyz = np.cumsum(deltas, axis=0) / precision
+    box = Box(lengths=np.array([lx, ly, lz])) if lx or ly or lz else None
+    return xyz, step, box
+
+
+class GczWriter():
+    """Write a compressed trajectory frame by frame.
+
+    Example:
+        with GczWriter('traj.gcz', precision=100.0) as traj:
+            for step, xyz in enumerate(frames):
+                traj.write_frame(xyz, step=step, box=box)
+    """
+    def __init__(self, file_name, precision=1000.0, level=6, mode='wb'):
+        """Open the trajectory file.
+
+        Args:
+            file_name (str): name of the .gcz file
+            precision (float): coordinates are stored to 1 / precision
+            level (int): zlib compression level
+            mode (str): 'wb' to overwrite or 'ab' to append
+        """
+        self.file_name = file_name
+        self.precision = precision
+        self.level = level
+        self.n_frames = 0
+        self._file = open(file_name, mode)
+
+    def write_frame(self, xyz, step=None, box=None):
+        """Append a frame.
+
+        Args:
+            xyz (np.ndarray): (n_atoms, 3) coordinates
+            step (int): timestep, defaults to the frame number
+            box (Box): simulation box
+        """
+        if step is None:
+            step = self.n_frames
+        self._file.write(encode_gcz_frame(xyz, step, box, self.precision,
+                                          self.level))
+        self.n_frames += 1
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class GczTrajectory(_IndexedTrajectory):
+    """Compressed trajectory, frames are (xyz, step, box) tuples.
+    """
+    def _index(self, start):
+        offsets = list()
+        f = self._file
+        f.seek(0, 2)
+        size = f.tell()
+        f.seek(start)
+        self._end = start
+        while True:
+            offset = f.tell()
+            try:
+                header = _read_gcz_header(f)
+            except IOError:
+                break
+            if header is None:
+                break
+            f.seek(header[-1], 1)
+            if f.tell() > size:
+                break  # truncated last record
+            offsets.append(offset)
+            self._end = f.tell()
+        return offsets
+
+    def _read_frame(self, f):
+        return _decode_gcz_frame(f)
@@ -1,5 +1,4 @@
 import numpy as np
-import pdb
 
 class Box():
     """Class to hold box information.
@@ -23,7 +22,7 @@ class Box():
                      lengths[2]/2])
                     
         # TODO: make this better
-        elif np.any(mins) and np.any(maxs):
+        elif mins is not None and maxs is not None:
             self.mins = mins
             self.maxs = maxs
             self.lengths = np.array(
@@ -1,5 +1,6 @@
 from __future__ import print_function
 
+from collections import namedtuple
 from copy import deepcopy
 from random import seed, randint, shuffle
 
@@ -8,7 +9,6 @@ import numpy as np
 from groupy.gbb import Gbb
 from groupy.box import Box
 from groupy.lattice import Lattice
-import pdb
 
 
 class Bilayer():
@@ -145,7 +145,6 @@ class Bilayer():
 
     @property
     def n_each_lipid_per_layer(self):
-        import pdb
         if self._n_each_lipid_per_layer:
             return self._n_each_lipid_per_layer
 
@@ -205,11 +204,18 @@ class Bilayer():
                 lipids_placed += 1
         return layer, lipid_labels
 
-    def add_solvent(self):
+    def solvent_lattice(self):
+        """Find the lattice points of the solvent slabs above and below.
+
+        Also grows the box in z to include both solvent slabs.
+
+        Returns:
+            top_points (np.ndarray): positions of solvent in the top slab
+            bottom_points (np.ndarray): positions of solvent in the bottom slab
+        """
         # just do this in a very basic manner for now
         # TODO: add in smart solvate like mBuild
         # first find the xy area of the box
-        solvent_list = []
         box_area = self.box.lengths[0] * self.box.lengths[1]
         MW_solvent = np.sum(self.solvent.masses)
         water_box_z = self.n_solvent_per_layer * MW_solvent / (
@@ -254,13 +260,240 @@ class Bilayer():
         bottom_water_points = Lattice()
         bottom_water_points.grid_mask_3d(n_water_x, n_water_y, n_water_z,
                 box=bottom_water_box)
+        return (top_water_points.points[:self.n_solvent_per_layer],
+                bottom_water_points.points[:self.n_solvent_per_layer])
+
+    def add_solvent(self):
+        solvent_list = []
+        top_water_points, bottom_water_points = self.solvent_lattice()
         self.solvent.shift_com_to_origin()
-        for point in top_water_points.points[:self.n_solvent_per_layer]:
+        for point in top_water_points:
             t = deepcopy(self.solvent)
             t.translate(point)
             solvent_list.append(t)
-        for point in bottom_water_points.points[:self.n_solvent_per_layer]:
+        for point in bottom_water_points:
             t = deepcopy(self.solvent)
             t.translate(point)
             solvent_list.append(t)
         return solvent_list
+
+
+# one prototype placed at many positions, optionally flipped about x
+Placement = namedtuple('Placement', ['gbb', 'xyz', 'positions', 'flip'])
+
+# flipping a molecule is a rotation by pi about the x-axis
+FLIP_SIGNS = np.array([1.0, -1.0, -1.0])
+
+
+def centered_xyz(gbb, z_shift=0.0):
+    """Prototype coordinates with the center of mass at (0, 0, z_shift).
+
+    Unlike Gbb.shift_com_to_origin, this leaves the prototype untouched.
+    """
+    com = np.sum(gbb.xyz.T * gbb.masses, axis=1) / np.sum(gbb.masses)
+    xyz = gbb.xyz - com
+    xyz[:, 2] += z_shift
+    return xyz
+
+
+def place_copies(xyz, positions, flip=None, out=None):
+    """Place copies of a prototype at many positions at once.
+
+    Args:
+        xyz (np.ndarray): (n_atoms, 3) prototype coordinates
+        positions (np.ndarray): (n_copies, 3) translation of each copy
+        flip (np.ndarray): (n_copies,) bools, rotate these copies by pi about
+            the x-axis before translating them
+        out (np.ndarray): (n_copies, n_atoms, 3) array to write into
+    Returns:
+        out (np.ndarray): (n_copies, n_atoms, 3) coordinates of all copies
+    """
+    positions = np.asarray(positions, dtype=float)
+    if out is None:
+        out = np.empty(shape=(positions.shape[0], xyz.shape[0], 3))
+    if flip is None or not np.any(flip):
+        np.add(xyz[np.newaxis], positions[:, np.newaxis], out=out)
+    else:
+        signs = np.where(np.asarray(flip)[:, np.newaxis], FLIP_SIGNS, 1.0)
+        np.multiply(xyz[np.newaxis], signs[:, np.newaxis], out=out)
+        out += positions[:, np.newaxis]
+    return out
+
+
+class FastBilayer(Bilayer):
+    """Bilayer builder for very large systems.
+
+    Each prototype is stored once, together with the lattice positions and
+    orientations of its copies. Coordinates are generated by broadcasting
+    the prototype against the positions, either into one contiguous array
+    (build=True) or in blocks with iter_blocks() for streaming writers.
+
+    Molecules are ordered like in Bilayer: top leaflet by lipid type, bottom
+    leaflet by lipid type, then solvent above and below the bilayer.
+    """
+
+    def __init__(self, lipids, n_x=10, n_y=10,
+                 area_per_lipid=1.0, solvent=None, solvent_per_lipid=None,
+                 random_seed=12345,
+                 mirror=True, solvent_density=1.0/1.661,
+                 lipid_positions=None, build=True):
+        """Constructor. Takes the same arguments as Bilayer.
+
+        Args
+        ----
+            build : bool
+                If True, fill xyz, types, masses, charges and resids with
+                the whole system
+        """
+        self.lipids = lipids
+        self.solvent = solvent
+        self.apl = area_per_lipid
+        self.n_x = n_x
+        self.n_y = n_y
+        self.mirror = mirror
+        self.random_seed = random_seed
+        self.n_solvent_per_lipid = solvent_per_lipid or 0
+        self.solvent_density = solvent_density
+        self.lipid_positions = lipid_positions
+
+        self.n_lipids_per_layer = self.n_x * self.n_y
+        self.n_solvent_per_layer = self.n_lipids_per_layer * self.n_solvent_per_lipid
+        self.area = n_x * n_y * self.apl
+        self.box = Box(lengths=np.array(
+            [np.sqrt(self.area),
+             np.sqrt(self.area),
+             1.0]))
+        self.mask = Lattice()
+        self.mask.grid_mask_2d(n_x, n_y, box=self.box)
+
+        self._n_each_lipid_per_layer = list()
+        self.check_fractions()
+        if lipid_positions:
+            assert(len(lipids) == len(lipid_positions))
+            placed = np.zeros(self.n_lipids_per_layer, dtype=bool)
+            for comp_pos in lipid_positions:
+                placed[comp_pos] = True
+            assert placed.all(), 'Not all lattice positions accounted for'
+
+        self.placements = list()
+        seed(self.random_seed)
+        if lipid_positions:
+            top_labels = None
+            bottom_labels = None
+        else:
+            top_labels = list(range(self.n_lipids_per_layer))
+            shuffle(top_labels)
+            if self.mirror:
+                bottom_labels = top_labels
+            else:
+                bottom_labels = list(range(self.n_lipids_per_layer))
+                shuffle(bottom_labels)
+        self.placements += self.layer_placements(top_labels)
+        self.placements += self.layer_placements(bottom_labels,
+                                                 flip_orientation=True)
+
+        self.top_bound = -np.inf
+        self.bottom_bound = np.inf
+        for placement in self.placements:
+            z_max = placement.xyz[:, 2].max()
+            z_min = placement.xyz[:, 2].min()
+            tops = placement.positions[:, 2] + np.where(
+                    placement.flip, -z_min, z_max)
+            bottoms = placement.positions[:, 2] + np.where(
+                    placement.flip, -z_max, z_min)
+            if tops.size > 0:
+                self.top_bound = max(self.top_bound, tops.max())
+                self.bottom_bound = min(self.bottom_bound, bottoms.min())
+
+        if self.n_solvent_per_layer > 0:
+            top_points, bottom_points = self.solvent_lattice()
+            positions = np.vstack((top_points, bottom_points))
+            self.placements.append(Placement(self.solvent,
+                    centered_xyz(self.solvent), positions,
+                    np.zeros(positions.shape[0], dtype=bool)))
+
+        self.system_info = [[len(p.positions), p.xyz.shape[0],
+                             getattr(p.gbb, 'name', '')]
+                            for p in self.placements]
+        if build:
+            self.build()
+
+    def layer_placements(self, lipid_labels=None, flip_orientation=False):
+        """Positions of every lipid type in one leaflet.
+
+        Args:
+            lipid_labels (list(int)): lattice index of each lipid in the order
+                they are placed; if None, use lipid_positions
+            flip_orientation (bool): if True, flip the lipids about the x-axis
+        Returns:
+            placements (list(Placement)): one placement per lipid type
+        """
+        placements = []
+        start = 0
+        for i, n_of_lipid_type in enumerate(self.n_each_lipid_per_layer):
+            if lipid_labels is None:
+                assert(len(self.lipid_positions[i]) == n_of_lipid_type)
+                indices = self.lipid_positions[i]
+            else:
+                indices = lipid_labels[start:start + n_of_lipid_type]
+            start += n_of_lipid_type
+            lipid = self.lipids[i]
+            placements.append(Placement(lipid[0],
+                    centered_xyz(lipid[0], lipid[2]),
+                    self.mask.points[indices],
+                    np.full(n_of_lipid_type, flip_orientation, dtype=bool)))
+        return placements
+
+    def n_atoms(self):
+        return sum(n_mol * n_apm for n_mol, n_apm, _ in self.system_info)
+
+    def n_molecules(self):
+        return sum(n_mol for n_mol, _, _ in self.system_info)
+
+    def iter_blocks(self, max_atoms=1000000):
+        """Generate the coordinates of the system in blocks of whole molecules.
+
+        Args:
+            max_atoms (int): upper bound on the number of atoms per block
+                (at least one molecule is always yielded)
+        Yields:
+            i (int): index of the placement the molecules belong to
+            xyz (np.ndarray): (n_copies, n_atoms, 3) coordinates
+        """
+        for i, placement in enumerate(self.placements):
+            n_copies = len(placement.positions)
+            step = max(1, max_atoms // max(1, placement.xyz.shape[0]))
+            for start in range(0, n_copies, step):
+                stop = min(start + step, n_copies)
+                yield i, place_copies(placement.xyz,
+                        placement.positions[start:stop],
+                        placement.flip[start:stop])
+
+    def build(self):
+        """Fill contiguous per-atom arrays for the whole system.
+        """
+        n_atoms = self.n_atoms()
+        self.xyz = np.empty(shape=(n_atoms, 3))
+        self.resids = np.empty(shape=n_atoms, dtype='u4')
+        types = list()
+        masses = list()
+        charges = list()
+        atom_start = 0
+        mol_start = 0
+        for placement in self.placements:
+            n_copies = len(placement.positions)
+            n_apm = placement.xyz.shape[0]
+            atom_stop = atom_start + n_copies * n_apm
+            out = self.xyz[atom_start:atom_stop].reshape(n_copies, n_apm, 3)
+            place_copies(placement.xyz, placement.positions, placement.flip,
+                         out=out)
+            self.resids[atom_start:atom_stop] = np.repeat(
+                    np.arange(mol_start + 1, mol_start + n_copies + 1), n_apm)
+            types.append(np.tile(np.ravel(placement.gbb.types), n_copies))
+            masses.append(np.tile(np.ravel(placement.gbb.masses), n_copies))
+            charges.append(np.tile(np.ravel(placement.gbb.charges), n_copies))
+            atom_start = atom_stop
+            mol_start += n_copies
+        self.types = np.concatenate(types)
+        self.masses = np.concatenate(masses)
+        self.charges = np.concatenate(charges)
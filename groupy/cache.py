@@ -0,0 +1,157 @@
+"""On-disk cache of parsed prototype files."""
+from __future__ import print_function
+
+import hashlib
+import os
+import tempfile
+import zipfile
+
+import numpy as np
+
+DEFAULT_CACHE_DIR = os.environ.get('GROUPY_CACHE_DIR',
+        os.path.join(os.path.expanduser('~'), '.groupy', 'cache'))
+DEFAULT_MAX_BYTES = 1024 ** 3
+
+_default_cache = None
+
+
+class PrototypeCache():
+    """Binary cache of arrays parsed from text files.
+
+    Entries are .npz files keyed by the absolute path, size and modification
+    time of the source file, so editing a prototype invalidates its entry.
+    When the cache grows beyond max_bytes, the least recently used entries
+    are deleted.
+    """
+    def __init__(self, cache_dir=None, max_bytes=DEFAULT_MAX_BYTES):
+        """Constructor.
+
+        Args:
+            cache_dir (str): directory holding the cache entries, defaults to
+                $GROUPY_CACHE_DIR or ~/.groupy/cache
+            max_bytes (int): size limit of the cache directory
+        """
+        self.cache_dir = cache_dir or DEFAULT_CACHE_DIR
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir)
+
+    def entry(self, file_name, tag=''):
+        """Path of the cache entry for a file.
+
+        Args:
+            file_name (str): name of the source file
+            tag (str): distinguishes different parsers of the same file
+        """
+        stat = os.stat(file_name)
+        mtime = getattr(stat, 'st_mtime_ns', stat.st_mtime)
+        key = '{0}|{1}|{2}|{3}'.format(os.path.abspath(file_name),
+                                       stat.st_size, mtime, tag)
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, digest + '.npz')
+
+    def load(self, file_name, parser, tag=''):
+        """Return the parsed arrays of a file, parsing it only on a miss.
+
+        Args:
+            file_name (str): name of the source file
+            parser (callable): parser(file_name) returns a dict of arrays
+            tag (str): distinguishes different parsers of the same file
+        Returns:
+            arrays (dict): {name: np.ndarray}
+        """
+        path = self.entry(file_name, tag)
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                arrays = dict((key, data[key]) for key in data.files)
+            os.utime(path, None)  # mark as recently used
+            self.hits += 1
+            return arrays
+        except (IOError, OSError, ValueError, zipfile.BadZipfile):
+            pass
+
+        arrays = parser(file_name)
+        self.misses += 1
+        self.store(path, arrays)
+        self.evict()
+        return arrays
+
+    def store(self, path, arrays):
+        """Atomically write arrays to a cache entry."""
+        fd, tmp = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(f, **arrays)
+            os.rename(tmp, path)
+        except Exception:
+            os.remove(tmp)
+            raise
+
+    def entries(self):
+        """Cache entries as (last use, size, path), least recently used first.
+        """
+        entries = list()
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith('.npz'):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return sorted(entries)
+
+    def evict(self):
+        """Delete least recently used entries until the cache fits max_bytes.
+        """
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+    def clear(self):
+        """Delete all cache entries."""
+        for _, _, path in self.entries():
+            os.remove(path)
+
+
+def get_cache(cache):
+    """Resolve the 'cache' argument of the Gbb loaders.
+
+    Args:
+        cache: a PrototypeCache, True for the default cache, or None/False
+    Returns:
+        cache (PrototypeCache or None):
+    """
+    global _default_cache
+    if cache is True:
+        if _default_cache is None:
+            _default_cache = PrototypeCache()
+        return _default_cache
+    return cache or None
+
+
+def cached_parse(file_name, parser, cache=None, tag=''):
+    """Parse a file through the cache if one is given.
+
+    Args:
+        file_name (str): name of the source file
+        parser (callable): parser(file_name) returns a dict of arrays
+        cache: a PrototypeCache, True for the default cache, or None/False
+        tag (str): distinguishes different parsers of the same file
+    Returns:
+        arrays (dict): {name: np.ndarray}
+    """
+    cache = get_cache(cache)
+    if cache is None:
+        return parser(file_name)
+    return cache.load(file_name, parser, tag)
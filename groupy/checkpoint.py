@@ -0,0 +1,111 @@
+"""Checkpoints of long running trajectory analyses."""
+from __future__ import print_function
+
+import os
+import tempfile
+
+import numpy as np
+
+
+class Checkpoint():
+    """Periodically save the state of an analysis that reads a trajectory.
+
+    The state is a set of named arrays and scalars plus the position in the
+    trajectory file after the last processed frame. It is written to an .npz
+    file through a temporary file and a rename, so a job killed while saving
+    leaves the previous checkpoint intact. Resuming from it seeks to the next
+    unprocessed frame and continues with the restored state, which gives the
+    same results as an uninterrupted run.
+
+    Example:
+        checkpoint = Checkpoint('flux.ckpt.npz', every=500)
+        with open(file_name, 'r') as trj:
+            state = checkpoint.restore(trj) or initial_state
+            while True:
+                ...
+                checkpoint.update(trj, n_frames, **state)
+    """
+    def __init__(self, file_name, every=100):
+        """Constructor.
+
+        Args:
+            file_name (str): name of the checkpoint file
+            every (int): save after every this many frames
+        """
+        if not file_name.endswith('.npz'):
+            file_name += '.npz'
+        self.file_name = file_name
+        self.every = every
+
+    def load(self):
+        """Read the saved state.
+
+        Returns:
+            state (dict): saved arrays, 0-d arrays are turned into scalars,
+                None if there is no checkpoint
+        """
+        if not os.path.isfile(self.file_name):
+            return None
+        state = dict()
+        with np.load(self.file_name, allow_pickle=False) as data:
+            for key in data.files:
+                value = data[key]
+                state[key] = value[()] if value.ndim == 0 else value
+        return state
+
+    def restore(self, trj):
+        """Load the saved state and seek 'trj' to the next unprocessed frame.
+
+        Args:
+            trj (file): open trajectory file
+        Returns:
+            state (dict): saved state without the file offset, None if there
+                is no checkpoint
+        """
+        state = self.load()
+        if state is None:
+            return None
+        trj.seek(int(state.pop('offset')))
+        print("Resuming from '{0}'".format(self.file_name))
+        return state
+
+    def save(self, trj, **state):
+        """Atomically write the state and the current position in 'trj'.
+
+        Args:
+            trj (file): open trajectory file, positioned after the last
+                processed frame
+            **state: arrays and scalars to save
+        """
+        state['offset'] = trj.tell()
+        directory = os.path.dirname(os.path.abspath(self.file_name))
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(f, **state)
+            os.rename(tmp, self.file_name)
+        except Exception:
+            os.remove(tmp)
+            raise
+
+    def update(self, trj, n_read, **state):
+        """Save the state if 'n_read' frames is a multiple of 'every'."""
+        if n_read % self.every == 0:
+            self.save(trj, **state)
+
+    def remove(self):
+        if os.path.isfile(self.file_name):
+            os.remove(self.file_name)
+
+
+def get_checkpoint(checkpoint):
+    """Resolve the 'checkpoint' argument of the analysis functions.
+
+    Args:
+        checkpoint: a Checkpoint, the name of a checkpoint file, or None
+    Returns:
+        checkpoint (Checkpoint or None):
+    """
+    if checkpoint is None or isinstance(checkpoint, Checkpoint):
+        return checkpoint
+    return Checkpoint(checkpoint)
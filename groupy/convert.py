@@ -0,0 +1,330 @@
+"""Convert trajectories between lammpstrj, xyz, gro, dcd and gcz files.
+
+Usage:
+    groupy-convert traj.lammpstrj traj.dcd
+    groupy-convert traj.lammpstrj traj.gcz --frames 100::10 --types 1,2 \
+        --precision 2 --workers 8
+
+With more than one worker the selected frames are split into contiguous
+ranges, each range is converted into a part file by its own process and the
+parts are concatenated into the output file at the end.
+"""
+from __future__ import division, print_function
+
+import argparse
+import multiprocessing
+import os
+import shutil
+import struct
+
+import numpy as np
+
+from groupy.bintraj import DcdTrajectory, DcdWriter, GczTrajectory, GczWriter
+from groupy.box import Box
+from groupy.mdio import (GroTrajectory, LammpstrjTrajectory, TrajectoryWriter,
+                         XyzTrajectory)
+
+FORMATS = {'.lammpstrj': 'lammpstrj',
+           '.dump': 'lammpstrj',
+           '.trj': 'lammpstrj',
+           '.xyz': 'xyz',
+           '.gro': 'gro',
+           '.dcd': 'dcd',
+           '.gcz': 'gcz'}
+
+_READERS = {'lammpstrj': LammpstrjTrajectory,
+            'xyz': XyzTrajectory,
+            'gro': GroTrajectory,
+            'gcz': GczTrajectory}
+
+
+def guess_format(file_name):
+    """Trajectory format from the file extension."""
+    ext = os.path.splitext(file_name)[1].lower()
+    try:
+        return FORMATS[ext]
+    except KeyError:
+        raise ValueError("Unknown trajectory format of '{0}'".format(file_name))
+
+
+def open_trajectory(file_name, fmt=None, offsets=None):
+    """Open a trajectory for random access.
+
+    Args:
+        file_name (str): name of trajectory file
+        fmt (str): format, guessed from the extension by default
+        offsets (list(int)): frame offsets of an earlier index of the same
+            text or gcz file
+    Returns:
+        traj: a trajectory object supporting len() and indexing
+    """
+    fmt = fmt or guess_format(file_name)
+    if fmt == 'dcd':
+        return DcdTrajectory(file_name)
+    return _READERS[fmt](file_name, offsets=offsets)
+
+
+def read_frame(traj, fmt, index):
+    """Read a frame of any format as (xyz, types, step, box).
+
+    'types' is None for dcd and gcz files, 'box' is None if the file does
+    not store one.
+    """
+    if fmt == 'lammpstrj':
+        return traj[index]
+    elif fmt == 'xyz':
+        xyz, types = traj[index]
+        return xyz, types, index, None
+    elif fmt == 'gro':
+        _, _, types, xyz, _, dims = traj[index]
+        box = Box(mins=dims[:, 0], maxs=dims[:, 1]) if dims.any() else None
+        return xyz, np.char.decode(types), index, box
+    elif fmt == 'dcd':
+        return traj[index], None, traj.timestep + traj.interval * index, \
+            traj.box(index)
+    elif fmt == 'gcz':
+        xyz, step, box = traj[index]
+        return xyz, None, step, box
+    raise ValueError("Unknown trajectory format '{0}'".format(fmt))
+
+
+class FrameWriter():
+    """Write (xyz, types, step, box) frames to a file of any format.
+    """
+    def __init__(self, file_name, fmt=None, precision=None, timestep=0,
+                 interval=1):
+        """Open the output file.
+
+        Args:
+            file_name (str): name of trajectory file
+            fmt (str): format, guessed from the extension by default
+            precision (int): decimals of the coordinates, ignored for dcd
+            timestep (int): first timestep of a dcd header
+            interval (int): timesteps between frames of a dcd header, used if
+                fewer than two frames are written
+        """
+        self.fmt = fmt or guess_format(file_name)
+        self.file_name = file_name
+        self.precision = precision
+        self.timestep = timestep
+        self.interval = interval
+        self._writer = None
+        if self.fmt in ('lammpstrj', 'xyz', 'gro'):
+            self._writer = TrajectoryWriter(file_name, fmt=self.fmt,
+                                            precision=precision)
+        elif self.fmt == 'gcz':
+            self._writer = GczWriter(file_name, precision=10.0 ** (
+                3 if precision is None else precision))
+        elif self.fmt != 'dcd':
+            raise ValueError("Unknown trajectory format '{0}'".format(fmt))
+
+    def write_frame(self, xyz, types, step, box):
+        if self.fmt == 'dcd':
+            if self._writer is None:
+                self._writer = DcdWriter(self.file_name, xyz.shape[0],
+                                         timestep=self.timestep,
+                                         interval=self.interval)
+            self._writer.write_frame(xyz, box=box, step=step)
+        elif self.fmt == 'gcz':
+            self._writer.write_frame(xyz, step=step, box=box)
+        else:
+            if types is None:
+                types = np.ones(xyz.shape[0], dtype=int)
+            if self.fmt == 'lammpstrj':
+                if types.dtype.kind not in 'iu':
+                    types = np.unique(types, return_inverse=True)[1] + 1
+                if box is None:
+                    box = Box(mins=xyz.min(axis=0), maxs=xyz.max(axis=0))
+            self._writer.write_frame(xyz, types, step=step, box=box)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def parse_atoms(spec):
+    """Parse an atom selection like '0:100,250,-10:' into a list of slices.
+
+    Bounds follow Python slicing, so negative indices count from the last
+    atom. The slices are resolved against the number of atoms of a frame by
+    select_atoms().
+    """
+    return [_parse_slice(item) for item in spec.split(',')]
+
+
+def _atom_indices(atoms, n_atoms):
+    """Indices of a selection of slices, or of an index array, in a frame."""
+    if isinstance(atoms, list) and all(isinstance(a, slice) for a in atoms):
+        indices = np.arange(n_atoms)
+        return np.concatenate([indices[a] for a in atoms])
+    return atoms
+
+
+def select_atoms(xyz, types, atoms=None, type_names=None):
+    """Apply the atom index and atom type selections to a frame.
+
+    'atoms' is an index array or a list of slices as made by parse_atoms().
+    """
+    if atoms is not None:
+        atoms = _atom_indices(atoms, xyz.shape[0])
+        xyz = xyz[atoms]
+        types = types[atoms] if types is not None else None
+    if type_names is not None:
+        if types is None:
+            raise ValueError('Input format does not store atom types')
+        mask = np.in1d(np.asarray(types).astype(str), type_names)
+        xyz = xyz[mask]
+        types = types[mask]
+    return xyz, types
+
+
+def _convert_range(args):
+    """Convert a list of frames, run by each worker."""
+    (in_file, in_fmt, offsets, indices, out_file, out_fmt, precision,
+     atoms, type_names, timestep, interval) = args
+    traj = open_trajectory(in_file, in_fmt, offsets)
+    with FrameWriter(out_file, out_fmt, precision, timestep,
+                     interval) as writer:
+        for i in indices:
+            xyz, types, step, box = read_frame(traj, in_fmt, i)
+            xyz, types = select_atoms(xyz, types, atoms, type_names)
+            writer.write_frame(xyz, types, step, box)
+    traj.close()
+    return out_file
+
+
+def _concatenate(parts, out_file, out_fmt, timestep=0, interval=1):
+    """Join the part files of the workers into the output file.
+
+    The header of a dcd file gets the total frame count and the first
+    timestep and interval of the whole frame selection.
+    """
+    if out_fmt == 'dcd':
+        # keep the header of the first part and sum up the frame counts
+        n_frames = 0
+        offsets = list()
+        for part in parts:
+            with DcdTrajectory(part) as traj:
+                n_frames += len(traj)
+                offsets.append(traj.offset)
+        shutil.copyfile(parts[0], out_file)
+        with open(out_file, 'r+b') as out:
+            out.seek(0, 2)
+            for part, offset in zip(parts[1:], offsets[1:]):
+                with open(part, 'rb') as f:
+                    f.seek(offset)
+                    shutil.copyfileobj(f, out)
+            out.seek(8)
+            out.write(struct.pack('<4i', n_frames, timestep, interval,
+                                  timestep + interval * (n_frames - 1)))
+    else:
+        with open(out_file, 'wb') as out:
+            for part in parts:
+                with open(part, 'rb') as f:
+                    shutil.copyfileobj(f, out)
+    for part in parts:
+        os.remove(part)
+
+
+def convert(in_file, out_file, in_fmt=None, out_fmt=None, frames=slice(None),
+            atoms=None, type_names=None, precision=None, workers=1):
+    """Convert a trajectory.
+
+    Args:
+        in_file (str): name of input trajectory
+        out_file (str): name of output trajectory
+        in_fmt (str): input format, guessed from the extension by default
+        out_fmt (str): output format, guessed from the extension by default
+        frames (slice): frames to convert
+        atoms (np.ndarray): indices of the atoms to keep, or a list of slices
+            as made by parse_atoms()
+        type_names (list(str)): atom types to keep
+        precision (int): decimals of the output coordinates
+        workers (int): number of processes
+    Returns:
+        n_frames (int): number of frames written
+    """
+    in_fmt = in_fmt or guess_format(in_file)
+    out_fmt = out_fmt or guess_format(out_file)
+    traj = open_trajectory(in_file, in_fmt)
+    indices = np.arange(len(traj))[frames]
+    offsets = getattr(traj, 'offsets', None)
+    # timesteps of the whole selection, parts may hold a single frame
+    timestep, interval = 0, 1
+    if len(indices) > 0:
+        timestep = int(read_frame(traj, in_fmt, indices[0])[2])
+    if len(indices) > 1:
+        interval = int(read_frame(traj, in_fmt, indices[1])[2]) - timestep
+        interval = interval if interval > 0 else 1
+    traj.close()
+
+    workers = max(1, min(workers, len(indices)))
+    chunks = np.array_split(indices, workers)
+    if workers == 1:
+        _convert_range((in_file, in_fmt, offsets, indices, out_file,
+                        out_fmt, precision, atoms, type_names, timestep,
+                        interval))
+    else:
+        jobs = [(in_file, in_fmt, offsets, chunk,
+                 '{0}.part{1}'.format(out_file, i), out_fmt, precision,
+                 atoms, type_names, timestep, interval)
+                for i, chunk in enumerate(chunks)]
+        pool = multiprocessing.Pool(workers)
+        try:
+            parts = pool.map(_convert_range, jobs)
+        finally:
+            pool.close()
+            pool.join()
+        _concatenate(parts, out_file, out_fmt, timestep, interval)
+    print("Wrote file '" + out_file + "'")
+    return len(indices)
+
+
+def _parse_slice(spec):
+    """Parse 'start:stop:step' into a slice."""
+    values = [int(x) if x else None for x in spec.split(':')]
+    if len(values) == 1:
+        # 'or None' keeps -1 from becoming the empty slice(-1, 0)
+        return slice(values[0], values[0] + 1 or None)
+    return slice(*values)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Convert trajectories between lammpstrj, xyz, gro, dcd '
+                    'and gcz files.')
+    parser.add_argument('input', help='input trajectory')
+    parser.add_argument('output', help='output trajectory')
+    parser.add_argument('--from', dest='in_fmt', choices=sorted(_READERS) +
+                        ['dcd'], help='input format (default: by extension)')
+    parser.add_argument('--to', dest='out_fmt', choices=sorted(_READERS) +
+                        ['dcd'], help='output format (default: by extension)')
+    parser.add_argument('--frames', default=':',
+                        help="frames to convert as 'start:stop:step'")
+    parser.add_argument('--atoms',
+                        help="atom indices to keep, e.g. '0:100,250'")
+    parser.add_argument('--types', help="atom types to keep, e.g. '1,2'")
+    parser.add_argument('--precision', type=int,
+                        help='decimals of the output coordinates')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='number of processes')
+    args = parser.parse_args(argv)
+
+    convert(args.input, args.output,
+            in_fmt=args.in_fmt,
+            out_fmt=args.out_fmt,
+            frames=_parse_slice(args.frames),
+            atoms=parse_atoms(args.atoms) if args.atoms else None,
+            type_names=args.types.split(',') if args.types else None,
+            precision=args.precision,
+            workers=args.workers)
+
+
+if __name__ == '__main__':
+    main()
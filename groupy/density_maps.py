@@ -0,0 +1,163 @@
+"""2D and cylindrical density maps of atom groups."""
+from __future__ import division, print_function
+
+import multiprocessing
+
+import numpy as np
+
+from groupy.masses import as_mass_table
+from groupy.mdio import LammpstrjTrajectory
+
+# axes spanned by the planar maps, the remaining axis is averaged over
+PLANES = {'xy': (0, 1), 'xz': (0, 2), 'yz': (1, 2)}
+
+UNITS = 1.660538  # au/ang^3 to g/cm^3
+
+
+def _map_coords(xyz, box, kind, center):
+    """The two map coordinates of every atom.
+
+    Planar maps use coordinates wrapped into the box. Cylindrical maps use
+    the minimum image distance from the pore axis, which runs along z
+    through 'center' = (x, y).
+    """
+    if kind == 'rz':
+        d = xyz[:, :2] - center
+        d -= box.lengths[:2] * np.round(d / box.lengths[:2])
+        return np.sqrt((d ** 2).sum(axis=1)), xyz[:, 2]
+    wrapped = box.mins + np.mod(xyz - box.mins, box.lengths)
+    i, j = PLANES[kind]
+    return wrapped[:, i], wrapped[:, j]
+
+
+def _bin_indices(values, edges):
+    """Index of the uniform bin of each value, -1 outside of the edges."""
+    n_bins = len(edges) - 1
+    idx = np.floor((values - edges[0]) * (n_bins / (edges[-1] - edges[0])))
+    idx = idx.astype(np.intp)
+    idx[(idx < 0) | (idx >= n_bins)] = -1
+    return idx
+
+
+def _accumulate(args):
+    """Sum the maps of a range of frames, run by each worker."""
+    (file_name, offsets, indices, system_info, groups, masses, kind, edges,
+     center) = args
+    shape = (len(edges[0]) - 1, len(edges[1]) - 1)
+    sums = np.zeros(shape=(len(groups),) + shape)
+    with LammpstrjTrajectory(file_name, offsets=offsets) as traj:
+        for i in indices:
+            xyz, types, _, box = traj[i]
+            for k, group in enumerate(groups):
+                atoms = system_info[group]
+                a, b = _map_coords(xyz[atoms], box, kind, center)
+                ia = _bin_indices(a, edges[0])
+                ib = _bin_indices(b, edges[1])
+                inside = (ia >= 0) & (ib >= 0)
+                if masses is None:
+                    weights = np.ones(inside.sum())
+                else:
+                    weights = masses.masses(types[atoms][inside])
+                if kind != 'rz':
+                    # slab of the bin through the whole box
+                    third = 3 - sum(PLANES[kind])
+                    weights = weights / box.lengths[third]
+                flat = np.ravel_multi_index((ia[inside], ib[inside]), shape)
+                sums[k] += np.bincount(flat, weights=weights,
+                                       minlength=sums[k].size).reshape(shape)
+    return sums
+
+
+def density_map(file_name, system_info, groups, kind='xz', bins=(50, 50),
+        ranges=None, masses=None, center=None, max_frames=np.inf, workers=1):
+    """Calculate time averaged 2D density maps of several groups.
+
+    Planar maps ('xy', 'xz', 'yz') average over the third axis. Cylindrical
+    maps ('rz') bin the distance from a pore axis along z and z itself.
+    Frames are split into contiguous ranges that are reduced in parallel by
+    'workers' processes.
+
+    Args:
+        file_name (str): name of trajectory to read
+        system_info (dict): dictionary containing indices of groups in system
+        groups (list): list of keys in system_info
+        kind (str): 'xy', 'xz', 'yz' or 'rz'
+        bins (tuple): number of bins along the two map axes
+        ranges (tuple): ((min, max), (min, max)) of the two map axes,
+            defaults to the box of the first frame
+        masses (MassTable): masses of the atom types, if None number densities
+            are calculated
+        center (tuple): (x, y) of the pore axis, defaults to the box center
+        max_frames (int): maximum number of frames to read
+        workers (int): number of processes
+    Returns:
+        maps (dict): {group: (bins[0], bins[1]) array} of densities in g/cm^3,
+            or in atoms/A^3 if no masses are given
+        edges (tuple): bin edges of the two map axes
+    """
+    if kind not in PLANES and kind != 'rz':
+        raise ValueError("Unknown map kind '{0}'".format(kind))
+    if masses is not None:
+        masses = as_mass_table(masses)
+
+    with LammpstrjTrajectory(file_name) as traj:
+        offsets = traj.offsets
+        _, _, _, box = traj[0]
+    if center is None:
+        center = 0.5 * (box.mins[:2] + box.maxs[:2])
+    center = np.asarray(center, dtype=float)
+    if ranges is None:
+        if kind == 'rz':
+            ranges = ((0.0, 0.5 * min(box.lengths[:2])),
+                      (box.mins[2], box.maxs[2]))
+        else:
+            i, j = PLANES[kind]
+            ranges = ((box.mins[i], box.maxs[i]), (box.mins[j], box.maxs[j]))
+    edges = tuple(np.linspace(lo, hi, n + 1)
+                  for (lo, hi), n in zip(ranges, bins))
+
+    n_frames = int(min(len(offsets), max_frames))
+    workers = max(1, min(workers, n_frames))
+    jobs = [(file_name, offsets, chunk, system_info, groups, masses, kind,
+             edges, center)
+            for chunk in np.array_split(np.arange(n_frames), workers)]
+    if workers == 1:
+        sums = _accumulate(jobs[0])
+    else:
+        pool = multiprocessing.Pool(workers)
+        try:
+            sums = sum(pool.map(_accumulate, jobs))
+        finally:
+            pool.close()
+            pool.join()
+
+    # volumes of the bins, planar slabs are already divided by their depth
+    if kind == 'rz':
+        r = edges[0]
+        volumes = np.outer(np.pi * (r[1:] ** 2 - r[:-1] ** 2), np.diff(edges[1]))
+    else:
+        volumes = np.outer(np.diff(edges[0]), np.diff(edges[1]))
+    scale = (UNITS if masses is not None else 1.0) / (volumes * n_frames)
+    maps = dict((group, sums[k] * scale) for k, group in enumerate(groups))
+    return maps, edges
+
+
+def save_density_map(file_name, maps, edges):
+    """Save density maps and their bin edges to a compressed .npz file."""
+    arrays = dict(('map_' + group, density) for group, density in maps.items())
+    np.savez_compressed(file_name, edges_0=edges[0], edges_1=edges[1],
+                        **arrays)
+
+
+def load_density_map(file_name):
+    """Load density maps saved with save_density_map().
+
+    Returns:
+        maps (dict): {group: density map}
+        edges (tuple): bin edges of the two map axes
+    """
+    with np.load(file_name, allow_pickle=False) as data:
+        maps = dict((key[4:], data[key]) for key in data.files
+                    if key.startswith('map_'))
+        edges = (data['edges_0'], data['edges_1'])
+    return maps, edges
@@ -3,6 +3,8 @@ import math
 
 import numpy as np
 
+from groupy.box import Box
+from groupy.cache import cached_parse
 from groupy.mdio import read_gro, read_xyz, read_lammps_data
 from groupy.general import anint
 
@@ -71,8 +73,6 @@ class Gbb():
             charge: charge of new atom
         """
 
-        import pdb
-        #pdb.set_trace()
         pos = np.reshape(pos, (1, 3))
         self.xyz = np.append(self.xyz, pos, axis=0)
         if atype:
@@ -399,72 +399,75 @@ class Gbb():
         """
 
     # --- io ---
-    def load_prototypes(self, base_name, prototypes):
+    def load_prototypes(self, base_name, prototypes, cache=None):
         if 'mass' in prototypes:
-            self.load_mass(base_name + '_mass.txt')
+            self.load_mass(base_name + '_mass.txt', cache=cache)
         if 'charge' in prototypes:
-            self.load_charge(base_name + '_charge.txt')
+            self.load_charge(base_name + '_charge.txt', cache=cache)
         if 'coord' in prototypes:
-            self.load_coord(base_name + '_coord.txt')
+            self.load_coord(base_name + '_coord.txt', cache=cache)
         if 'bond' in prototypes:
-            self.load_bond(base_name + '_bond.txt')
+            self.load_bond(base_name + '_bond.txt', cache=cache)
         if 'angle' in prototypes:
-            self.load_angle(base_name + '_angle.txt')
+            self.load_angle(base_name + '_angle.txt', cache=cache)
         if 'dihedral' in prototypes:
-            self.load_dihedral(base_name + '_dihedral.txt')
+            self.load_dihedral(base_name + '_dihedral.txt', cache=cache)
         if 'pair_types' in prototypes:
-            self.load_pair_types(base_name + '_pair_types.txt')
+            self.load_pair_types(base_name + '_pair_types.txt', cache=cache)
         if 'bond_types' in prototypes:
-            self.load_bond_types(base_name + '_bond_types.txt')
+            self.load_bond_types(base_name + '_bond_types.txt', cache=cache)
         if 'angle_types' in prototypes:
-            self.load_angle_types(base_name + '_angle_types.txt')
+            self.load_angle_types(base_name + '_angle_types.txt', cache=cache)
         if 'dihedral_types' in prototypes:
-            self.load_dihedral_types(base_name + '_dihedral_types.txt')
+            self.load_dihedral_types(base_name + '_dihedral_types.txt',
+                                     cache=cache)
 
-    def load_mass(self, file_name):
-        self.masses = np.loadtxt(file_name)
+    def load_mass(self, file_name, cache=None):
+        self.masses = _loadtxt(file_name, cache=cache)
 
-    def load_bond(self, file_name):
-        self.bonds = np.loadtxt(file_name, dtype='int')
+    def load_bond(self, file_name, cache=None):
+        self.bonds = _loadtxt(file_name, dtype='int', cache=cache)
 
-    def load_angle(self, file_name):
-        self.angles = np.loadtxt(file_name, dtype='int')
+    def load_angle(self, file_name, cache=None):
+        self.angles = _loadtxt(file_name, dtype='int', cache=cache)
 
-    def load_dihedral(self, file_name):
-        self.dihedrals = np.loadtxt(file_name, dtype='int')
+    def load_dihedral(self, file_name, cache=None):
+        self.dihedrals = _loadtxt(file_name, dtype='int', cache=cache)
 
-    def load_improper(self, file_name):
-        self.impropers = np.loadtxt(file_name, dtype='int')
+    def load_improper(self, file_name, cache=None):
+        self.impropers = _loadtxt(file_name, dtype='int', cache=cache)
 
-    def load_pair_types(self, file_name):
-        data = np.loadtxt(file_name)
+    def load_pair_types(self, file_name, cache=None):
+        data = _loadtxt(file_name, cache=cache)
         self.pair_types = dict(zip(data[:, 0].astype(int), 
             zip(data[:, 1], data[:, 2])))
 
-    def load_bond_types(self, file_name):
-        data = np.loadtxt(file_name)
+    def load_bond_types(self, file_name, cache=None):
+        data = _loadtxt(file_name, cache=cache)
         self.bond_types = dict(zip(data[:, 0].astype(int), 
             zip(data[:, 1], data[:, 2])))
 
-    def load_angle_types(self, file_name):
-        data = np.loadtxt(file_name)
+    def load_angle_types(self, file_name, cache=None):
+        data = _loadtxt(file_name, cache=cache)
         self.angle_types = dict(zip(data[:, 0].astype(int), 
             zip(data[:, 1], data[:, 2])))
 
-    def load_dihedral_types(self, file_name):
-        data = np.loadtxt(file_name)
+    def load_dihedral_types(self, file_name, cache=None):
+        data = _loadtxt(file_name, cache=cache)
         self.dihedral_types = dict(zip(data[:, 0].astype(int), 
             zip(data[:, 1], data[:, 2], data[:, 3], data[:, 4])))
 
-    def load_charge(self, file_name):
-        self.charges = np.loadtxt(file_name)
+    def load_charge(self, file_name, cache=None):
+        self.charges = _loadtxt(file_name, cache=cache)
 
-    def load_xyz(self, file_name):
-        self.xyz, self.types = read_xyz(file_name)
+    def load_xyz(self, file_name, cache=None):
+        data = cached_parse(file_name, _parse_xyz, cache, tag='xyz')
+        self.xyz = data['xyz']
+        self.types = data['types'].astype('object')
         self.n_atoms = self.xyz.shape[0]
 
-    def load_coord(self, file_name):
-        coords = np.loadtxt(file_name)
+    def load_coord(self, file_name, cache=None):
+        coords = _loadtxt(file_name, cache=cache)
         self.types = coords[:, 0].astype(int)
         self.xyz = coords[:, 1:]
 
@@ -473,57 +476,34 @@ class Gbb():
         self.n_atoms = self.xyz.shape[0]
         return box
 
-    def load_lammps_data(self, data_file, verbose=False):
-        lmp_data, box = read_lammps_data(data_file)
-        self.xyz = lmp_data['xyz']
-        self.types = lmp_data['types']
-        self.masses = lmp_data['masses']
-        self.charges = lmp_data['charges']
-        self.bonds = lmp_data['bonds']
-        self.angles = lmp_data['angles']
-        self.dihedrals = lmp_data['dihedrals']
-        self.pair_types = lmp_data['pair_types']
-        self.bond_types = lmp_data['bond_types']
-        self.angle_types = lmp_data['angle_types']
-        self.dihedral_types = lmp_data['dihedral_types']
+    def load_lammps_data(self, data_file, verbose=False, cache=None):
+        data = cached_parse(data_file, _parse_lammps_data, cache,
+                            tag='lammps_data')
+        self.xyz = data['xyz']
+        self.types = data['types']
+        self.masses = data['masses']
+        self.charges = data['charges']
+        self.bonds = data['bonds']
+        self.angles = data['angles']
+        self.dihedrals = data['dihedrals']
+        self.pair_types = _array_to_types(data['pair_types'], as_tuple=True)
+        self.bond_types = _array_to_types(data['bond_types'])
+        self.angle_types = _array_to_types(data['angle_types'])
+        self.dihedral_types = _array_to_types(data['dihedral_types'])
         self.n_atoms = self.xyz.shape[0]
-        return box
+        return Box(mins=data['box_mins'], maxs=data['box_maxs'])
 
     def load_xml_prototype(self, filename, skip_coords=False, skip_types=False,
-                           skip_masses=False):
+                           skip_masses=False, cache=None):
         """Load positions, bonds, masses, etc... from an xml file.
         
         """
-        from xml.etree import cElementTree
-
-        tree = cElementTree.parse(filename)
-        config = tree.getroot().find('configuration')
-        position = config.find('position')
-        bond = config.find('bond')
-        angle = config.find('angle')
-        dihedral = config.find('dihedral')
-        improper = config.find('improper')
-        mass = config.find('mass')
-        charge = config.find('charge')
-        atom_type = config.find('type')
-
-        import pdb
-        # atom properties
-        xyz = list()
-        for pos in position.text.splitlines()[1:]:
-            xyz.append([float(x) for x in pos.split()[:3]])
-
-        masses = list()
-        for m in mass.text.splitlines()[1:]:
-            masses.append([float(x) for x in m.split()[:1]])
-
-        charges = list()
-        for q in charge.text.splitlines()[1:]:
-            charges.append([float(x) for x in q.split()[:1]])
-
-        types = list()
-        for t in atom_type.text.splitlines()[1:]:
-            types.append([str(x) for x in t.split()[:1]])
+        data = cached_parse(filename, _parse_xml_prototype, cache,
+                            tag='xml_prototype')
+        xyz = data['xyz']
+        masses = data['masses']
+        charges = data['charges']
+        types = data['types']
 
         # make sure there's the same amount of pos, mass and charges
         warn = 'Different number of positions, masses, types and charges '
@@ -533,48 +513,127 @@ class Gbb():
         else:
             assert(len(masses) == len(charges))
         assert(len(masses) == len(types))
-        self.charges = np.asarray(charges)
-        self.charges = np.reshape(self.charges, (self.charges.shape[0]))
-        self.masses = np.asarray(masses)
+        self.charges = np.reshape(charges, (charges.shape[0]))
+        self.masses = masses
         if not skip_masses:
             self.masses = np.reshape(self.masses, (self.masses.shape[0]))
         if not skip_coords:
-            self.xyz = np.asarray(xyz)
+            self.xyz = xyz
         if not skip_types:
-            self.types = np.asarray(types)
-        self.charges = np.reshape(self.charges, (self.charges.shape[0]))
+            self.types = types
         self.types = np.reshape(self.types, (self.types.shape[0]))
 
-        # try bonded interactions
-        # TODO: make more robust for comments
-        try:
-            bonds = list()
-            for top in bond.text.splitlines()[1:]:
-                bonds.append([int(x) for x in top.split()[:3]])
-            self.bonds = np.asarray(bonds)
-        except AttributeError:
-            pass
-
-        try:
-            angles = list()
-            for top in angle.text.splitlines()[1:]:
-                angles.append([int(x) for x in top.split()[:4]])
-            self.angles = np.asarray(angles)
-        except AttributeError:
-            pass
-
-        try:
-            dihedrals = list()
-            for top in dihedral.text.splitlines()[1:]:
-                dihedrals.append([int(x) for x in top.split()[:5]])
-            self.dihedrals = np.asarray(dihedrals)
-        except AttributeError:
-            pass
-
-        try:
-            impropers = list()
-            for top in improper.text.splitlines()[1:]:
-                impropers.append([int(x) for x in top.split()[:5]])
-            self.impropers = np.asarray(impropers)
-        except AttributeError:
-            pass
+        # bonded interactions, if the prototype has them
+        for kind in ('bonds', 'angles', 'dihedrals', 'impropers'):
+            if kind in data:
+                setattr(self, kind, data[kind])
+
+
+def _loadtxt(file_name, dtype='float', cache=None):
+    """np.loadtxt through the prototype cache."""
+    def parser(name):
+        return {'data': np.loadtxt(name, dtype=dtype)}
+    return cached_parse(file_name, parser, cache,
+                        tag='loadtxt-' + str(dtype))['data']
+
+
+def _types_to_array(types):
+    """Pack a {type: coefficients} dict into a float array.
+
+    Rows are [type, coefficients...], padded with NaN if the number of
+    coefficients differs between types.
+    """
+    if not types:
+        return np.empty(shape=(0, 1))
+    width = max(len(value) for value in types.values())
+    array = np.full((len(types), width + 1), np.nan)
+    for row, key in enumerate(sorted(types)):
+        array[row, 0] = key
+        array[row, 1:len(types[key]) + 1] = types[key]
+    return array
+
+
+def _array_to_types(array, as_tuple=False):
+    """Inverse of _types_to_array."""
+    types = dict()
+    for row in array:
+        values = [x for x in row[1:].tolist() if x == x]  # drop NaN padding
+        types[int(row[0])] = tuple(values) if as_tuple else values
+    return types
+
+
+def _parse_xyz(file_name):
+    xyz, types = read_xyz(file_name)
+    return {'xyz': xyz, 'types': types.astype(str)}
+
+
+def _parse_lammps_data(data_file):
+    lmp_data, box = read_lammps_data(data_file)
+    data = dict((key, lmp_data[key]) for key in
+                ('xyz', 'types', 'masses', 'charges', 'bonds', 'angles',
+                 'dihedrals'))
+    for key in ('pair_types', 'bond_types', 'angle_types', 'dihedral_types'):
+        data[key] = _types_to_array(lmp_data[key])
+    data['box_mins'] = box.mins
+    data['box_maxs'] = box.maxs
+    return data
+
+
+def _parse_xml_block(text, width, dtype=float):
+    """Parse the text of a HOOMD xml element into an (n, width) array.
+
+    Only the first 'width' columns of each line are kept.
+    """
+    text = text.strip()
+    if not text:
+        return np.empty(shape=(0, width), dtype=dtype)
+    n_cols = len(text.split('\n', 1)[0].split())
+    tokens = text.split()
+    try:
+        values = np.array(tokens, dtype=dtype)
+    except ValueError:
+        values = None
+    if values is None or values.size != len(tokens) \
+            or values.size % n_cols != 0:
+        # ragged or unparsable lines, parse them one by one so that bad
+        # values raise
+        rows = [line.split()[:width] for line in text.splitlines()
+                if line.strip()]
+        return np.array(rows, dtype=dtype)
+    return values.reshape(-1, n_cols)[:, :width]
+
+
+def _parse_xml_prototype(filename):
+    """Parse the configuration of a HOOMD xml file into arrays.
+
+    The file is streamed with iterparse and every element is discarded once
+    its text has been converted, so the tree is never fully built.
+    """
+    try:
+        from xml.etree import cElementTree as ElementTree
+    except ImportError:
+        from xml.etree import ElementTree
+
+    # tag: (key in the returned dict, columns, dtype)
+    blocks = {'position': ('xyz', 3, float),
+              'mass': ('masses', 1, float),
+              'charge': ('charges', 1, float),
+              'type': ('types', 1, str),
+              'bond': ('bonds', 3, int),
+              'angle': ('angles', 4, int),
+              'dihedral': ('dihedrals', 5, int),
+              'improper': ('impropers', 5, int)}
+
+    data = dict()
+    for _, element in ElementTree.iterparse(filename, events=('end',)):
+        if element.tag in blocks:
+            key, width, dtype = blocks[element.tag]
+            if key not in data and element.text is not None:
+                data[key] = _parse_xml_block(element.text, width, dtype)
+        element.clear()
+
+    for key in ('xyz', 'masses', 'charges', 'types'):
+        if key not in data:
+            raise ValueError("No '{0}' in prototype file: {1}".format(
+                             key, filename))
+    return data
@@ -1,12 +1,10 @@
 """General, handy functions."""
 from __future__ import print_function
 
-import pdb
 import math
 import copy
 
 import numpy as np
-from  scipy.spatial import cKDTree
 
 from groupy.box import Box
 
@@ -82,6 +80,7 @@ def add_to_box(gbb, gbb_list, n, box, dims=[True, True, True], r_cut=2.0, name='
 def get_points_in_range(array, point, radius, max_items=50):
     """
     """
+    from scipy.spatial import cKDTree
     tree = cKDTree(array)
 
     distances, indices = tree.query(point, max_items)
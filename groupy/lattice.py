@@ -1,5 +1,14 @@
+from __future__ import division, print_function
+
 import numpy as np
 
+# basis of the conventional FCC unit cell in fractional coordinates
+FCC_BASIS = np.array([[0.0, 0.0, 0.0],
+                      [0.5, 0.5, 0.0],
+                      [0.5, 0.0, 0.5],
+                      [0.0, 0.5, 0.5]])
+
+
 class Lattice():
     """Class to hold lattice points
 
@@ -8,56 +17,145 @@ class Lattice():
     def __init__(self):
         self.points = np.empty(shape=(0,3), dtype=float)
 
+    def _fit_fractional(self, frac, center='origin', box=None, flat=False):
+        """Turn fractional coordinates in [0, 1) into lattice points.
+
+        Args:
+            frac (np.ndarray): (n, 3) fractional coordinates
+            center (str): if 'origin', center the points on the origin
+            box (Box): if given, scale the points to fill the box
+            flat (bool): if True, put all points in the z = 0 plane
+        """
+        if box:
+            points = box.mins + box.lengths * frac
+        elif center == 'origin':
+            points = frac - 0.5
+        else:
+            points = frac
+        if flat:
+            points[:, 2] = 0.0
+        self.points = points
 
     def grid_mask_2d(self, n, m, center='origin', box=None):
         """ """
-        mask = np.zeros(shape=(n*m, 3), dtype=float)
-        for i in range(n):
-            for j in range(m):
-                mask[i*m + j, 0] = float(i) / float(n) + 0.5/n
-                if center == 'origin':
-                    mask[i*m + j, 0] -= 0.5
-                mask[i*m + j, 1] = float(j) / float(m) + 0.5/m
-                if center == 'origin':
-                    mask[i*m + j, 1] -= 0.5
-
-
-        # fit points nicely into box
-        if box:
-            mask = np.multiply(box.lengths, mask)
-            mask[:] += box.mins - np.array(
-                            [np.amin(mask[:, 0]),
-                             np.amin(mask[:, 1]),
-                             np.amin(mask[:, 2])]) + np.array(
-                            [0.5*box.lengths[0]/float(n),
-                             0.5*box.lengths[1]/float(m),
-                             0.0])
-            mask[:, 2] = 0.0
-        self.points = mask
+        i, j = np.indices((n, m)).reshape(2, -1)
+        frac = np.zeros(shape=(n*m, 3), dtype=float)
+        frac[:, 0] = (i + 0.5) / n
+        frac[:, 1] = (j + 0.5) / m
+        self._fit_fractional(frac, center=center, box=box, flat=True)
 
     def grid_mask_3d(self, n, m, l, center='origin', box=None):
         """ """
-        mask = np.zeros(shape=(n*m*l, 3), dtype=float)
-        for i in range(n):
-            for j in range(m):
-                for k in range(l):
-                    mask[i*m*l + j*l + k, 0] = float(i) / n + 0.5/n
-                    if center == 'origin':
-                        mask[i*m*l + j*l + k, 0] -= 0.5
-                    mask[i*m*l + j*l + k, 1] = float(j) / m + 0.5/m
-                    if center == 'origin':
-                        mask[i*m*l + j*l + k, 1] -= 0.5
-                    mask[i*m*l + j*l + k, 2] = float(k) / l + 0.5/l
-                    if center == 'origin':
-                        mask[i*m*l + j*l + k, 2] -= 0.5
-        import pdb
-        if box:
-            mask = np.multiply(box.lengths, mask)
-            mask[:] += box.mins - np.array(
-                            [np.amin(mask[:, 0]),
-                             np.amin(mask[:, 1]),
-                             np.amin(mask[:, 2])]) + np.array([
-                             0.5*box.lengths[0]/float(n),
-                             0.5*box.lengths[1]/float(m),
-                             0.5*box.lengths[2]/float(l)])
-        self.points = mask
+        i, j, k = np.indices((n, m, l)).reshape(3, -1)
+        frac = np.empty(shape=(n*m*l, 3), dtype=float)
+        frac[:, 0] = (i + 0.5) / n
+        frac[:, 1] = (j + 0.5) / m
+        frac[:, 2] = (k + 0.5) / l
+        self._fit_fractional(frac, center=center, box=box)
+
+    def hexagonal_mask_2d(self, n, m, center='origin', box=None):
+        """Hexagonal lattice of n points per row and m rows.
+
+        Every other row is shifted by half a lattice spacing. The lattice is
+        only regular if the box aspect ratio is Ly / Lx = (sqrt(3) / 2) * m / n,
+        with m even so that it is periodic in y.
+        """
+        i, j = np.indices((n, m)).reshape(2, -1)
+        frac = np.zeros(shape=(n*m, 3), dtype=float)
+        frac[:, 0] = (i + 0.25 + 0.5 * (j % 2)) / n
+        frac[:, 1] = (j + 0.5) / m
+        self._fit_fractional(frac, center=center, box=box, flat=True)
+
+    def fcc_mask_3d(self, n, m, l, center='origin', box=None):
+        """FCC lattice of n x m x l conventional unit cells (4 points each).
+        """
+        cells = np.indices((n, m, l)).reshape(3, -1).T
+        frac = (cells[:, np.newaxis, :] + 0.25 + FCC_BASIS) / np.array([n, m, l])
+        self._fit_fractional(frac.reshape(-1, 3), center=center, box=box)
+
+    def rsa_mask_2d(self, n, r_min, box, random_seed=None, batch_size=None,
+                    max_attempts=None):
+        """Random sequential adsorption of up to n points in the xy-plane.
+
+        Points are placed uniformly at random and rejected if they fall within
+        r_min of an already accepted point (minimum image in x and y).
+        Candidates are tested in vectorized batches against a cell grid with
+        at most one point per cell. A candidate that overlaps an earlier
+        candidate of the same batch is rejected, so batches are kept small
+        compared to the number of points already placed.
+
+        Args:
+            n (int): number of points to place
+            r_min (float): minimum distance between points
+            box (Box): box whose x and y extent to fill, points are at z = 0
+            random_seed (int): seed for the random number generator
+            batch_size (int): number of candidates per batch
+            max_attempts (int): give up after this many candidates
+        """
+        rng = np.random.RandomState(random_seed)
+        lengths = np.asarray(box.lengths[:2], dtype=float)
+        # cells no wider than r_min / sqrt(2) hold at most one point
+        n_cells = np.ceil(lengths * np.sqrt(2.0) / r_min).astype(int)
+        cell_size = lengths / n_cells
+        reach = int(np.ceil(r_min / cell_size.min()))
+        assert (n_cells >= 2 * reach + 1).all(), 'Box too small for r_min'
+        grid = np.full(n_cells, -1, dtype=np.intp)
+
+        offsets = np.indices((2 * reach + 1, 2 * reach + 1)).reshape(2, -1).T
+        offsets = offsets - reach
+        offsets = offsets[(offsets != 0).any(axis=1)]
+
+        if max_attempts is None:
+            max_attempts = 100 * n
+        points = np.empty(shape=(n, 2))
+        n_placed = 0
+        n_tried = 0
+        while n_placed < n and n_tried < max_attempts:
+            size = batch_size or max(64, n_placed // 4)
+            size = min(size, max_attempts - n_tried)
+            n_tried += size
+            cand = rng.uniform(size=(size, 2)) * lengths
+            cell = np.minimum((cand / cell_size).astype(int), n_cells - 1)
+
+            # keep the first candidate that lands in each empty cell
+            ok = grid[cell[:, 0], cell[:, 1]] == -1
+            flat = np.ravel_multi_index(cell.T, n_cells)
+            _, first = np.unique(flat, return_index=True)
+            in_first = np.zeros(size, dtype=bool)
+            in_first[first] = True
+            ok &= in_first
+            cand = cand[ok]
+            cell = cell[ok]
+            if cand.shape[0] == 0:
+                continue
+
+            # candidates of this batch, laid out on a scratch grid
+            batch = np.full(n_cells, -1, dtype=np.intp)
+            batch[cell[:, 0], cell[:, 1]] = np.arange(cand.shape[0])
+            ok = np.ones(cand.shape[0], dtype=bool)
+            for offset in offsets:
+                nb = (cell + offset) % n_cells
+                for source, coords, later_only in (
+                        (grid, points, False), (batch, cand, True)):
+                    idx = source[nb[:, 0], nb[:, 1]]
+                    has = idx >= 0
+                    if later_only:
+                        has &= idx < np.arange(cand.shape[0])
+                    if not has.any():
+                        continue
+                    d = np.abs(coords[idx[has]] - cand[has])
+                    d = np.minimum(d, lengths - d)
+                    too_close = (d ** 2).sum(axis=1) < r_min ** 2
+                    ok[np.where(has)[0][too_close]] = False
+
+            cand = cand[ok][:n - n_placed]
+            cell = cell[ok][:n - n_placed]
+            new = np.arange(n_placed, n_placed + cand.shape[0])
+            points[new] = cand
+            grid[cell[:, 0], cell[:, 1]] = new
+            n_placed += cand.shape[0]
+
+        if n_placed < n:
+            print('Warning: placed only {0} of {1} points'.format(n_placed, n))
+        self.points = np.zeros(shape=(n_placed, 3))
+        self.points[:, :2] = box.mins[:2] + points[:n_placed]
@@ -0,0 +1,123 @@
+"""Lookup of atom masses by atom type."""
+from __future__ import print_function
+
+import numpy as np
+
+from groupy.mdio import read_lammps_data
+
+
+class MassTable():
+    """Map atom types to masses.
+
+    Integer types, as in LAMMPS, are compiled into a dense array indexed by
+    type so that a whole frame is looked up with one fancy-index operation.
+    Other types (e.g. element names) are looked up through a sorted key array.
+
+    Example:
+        table = MassTable()
+        table.load_lammps_data('system.lammpsdata')
+        frame_masses = table.masses(types)
+    """
+    def __init__(self, type_mass=None):
+        """Constructor.
+
+        Args:
+            type_mass (dict): {atom_type: mass}
+        """
+        self.type_mass = dict()
+        self.lookup = np.empty(shape=(0,))
+        self._keys = np.empty(shape=(0,))
+        self._values = np.empty(shape=(0,))
+        if type_mass:
+            self.update(type_mass)
+
+    def update(self, type_mass):
+        """Add or overwrite masses and recompile the lookup.
+
+        Args:
+            type_mass (dict): {atom_type: mass}
+        """
+        self.type_mass.update(type_mass)
+        keys = np.array(sorted(self.type_mass))
+        values = np.array([self.type_mass[key] for key in keys], dtype=float)
+        if keys.dtype.kind in 'iu' and keys.min() >= 0:
+            # NaN marks types without a mass
+            self.lookup = np.full(keys.max() + 1, np.nan)
+            self.lookup[keys] = values
+        else:
+            self.lookup = None
+        self._keys = keys
+        self._values = values
+
+    def load_types(self, types, masses):
+        """Add the masses of per-atom type and mass arrays.
+
+        Args:
+            types (np.ndarray): (n_atoms,) atom types
+            masses (np.ndarray): (n_atoms,) atom masses
+        """
+        types = np.asarray(types).ravel()
+        masses = np.asarray(masses, dtype=float).ravel()
+        unique, first = np.unique(types, return_index=True)
+        self.update(dict(zip(unique.tolist(), masses[first].tolist())))
+
+    def load_lammps_data(self, data_file):
+        """Add the masses of the atom types in a LAMMPS data file."""
+        data, _ = read_lammps_data(data_file)
+        self.load_types(data['types'], data['masses'])
+
+    def load_system(self, system):
+        """Add the masses of the atom types in a System."""
+        if not system.type_mass:
+            system.find_number_of_types()
+        self.update(system.type_mass)
+
+    def masses(self, types):
+        """Masses of an array of atom types.
+
+        Raises:
+            KeyError: if a type has no mass
+        """
+        types = np.asarray(types)
+        if self.lookup is not None and types.dtype.kind in 'iu':
+            if types.size and (types.min() < 0
+                               or types.max() >= len(self.lookup)):
+                bad = types[(types < 0) | (types >= len(self.lookup))]
+                raise KeyError('No mass for atom type {0}'.format(bad[0]))
+            masses = self.lookup[types]
+            if np.isnan(masses).any():
+                raise KeyError('No mass for atom type {0}'.format(
+                    types[np.isnan(masses)][0]))
+            return masses
+        idx = np.searchsorted(self._keys, types)
+        idx = np.minimum(idx, len(self._keys) - 1)
+        missing = self._keys[idx] != types
+        if np.any(missing):
+            raise KeyError('No mass for atom type {0}'.format(
+                types[missing].ravel()[0]))
+        return self._values[idx]
+
+    def __getitem__(self, atom_type):
+        return self.type_mass[atom_type]
+
+    def __len__(self):
+        return len(self.type_mass)
+
+
+def as_mass_table(masses, type_offset=0):
+    """Turn the 'masses' argument of the density analyses into a MassTable.
+
+    Args:
+        masses: a MassTable, a {atom_type: mass} dict, or an array where
+            masses[atom_type - type_offset] is the mass of atom_type
+        type_offset (int): offset of array indices from atom types
+    Returns:
+        table (MassTable):
+    """
+    if isinstance(masses, MassTable):
+        return masses
+    if isinstance(masses, dict):
+        return MassTable(masses)
+    masses = np.asarray(masses, dtype=float).ravel()
+    return MassTable(dict((i + type_offset, mass)
+                          for i, mass in enumerate(masses)))
@@ -2,13 +2,46 @@ from __future__ import print_function
 
 import warnings
 import re
-import pdb
+import time
+from itertools import islice
 
 import numpy as np
 
 from groupy.box import Box
 
 
+def _format_rows(fmt, columns):
+    """Format equally long columns into a block of text in one call.
+
+    Args:
+        fmt (str): format of a single line, e.g. '%d %.3f\\n'
+        columns (list): one 1D array or list per field in 'fmt'
+    Returns:
+        text (str): 'fmt' applied to every row
+    Raises:
+        ValueError: if the columns differ in length
+    """
+    n_rows = len(columns[0])
+    lengths = [len(column) for column in columns]
+    if any(length != n_rows for length in lengths):
+        raise ValueError('Columns of different lengths: {0}'.format(lengths))
+    if n_rows == 0:
+        return ''
+    n_cols = len(columns)
+    values = [None] * (n_rows * n_cols)
+    for k, column in enumerate(columns):
+        values[k::n_cols] = np.asarray(column).tolist()
+    return (fmt * n_rows) % tuple(values)
+
+
+def _as_str(values):
+    """Decode byte strings (e.g. from read_gro) so they format as text."""
+    values = np.asarray(values)
+    if values.dtype.kind == 'S':
+        return np.char.decode(values)
+    return values
+
+
 def read_frame_lammpstrj(trj, read_velocities=False, read_zforces=False, idmin=0):
     """Load a frame from a LAMMPS dump file.
 
@@ -75,19 +108,89 @@ def read_frame_lammpstrj(trj, read_velocities=False, read_zforces=False, idmin=0
 
 
 def read_xyz(file_name):
-    """Load an xyz file into a coordinate and a type array."""
+    """Load the first frame of an xyz file into a coordinate and a type array.
+
+    Use XyzTrajectory to read multi-frame files.
+    """
+    with open(file_name, 'rb') as f:
+        return _read_xyz_frame(f)
+
+
+def _read_xyz_frame(f):
+    """Read one xyz frame from a file opened in binary mode.
 
-    with open(file_name, 'r') as f:
-        n_atoms = int(f.readline())  # num atoms
-        f.readline()  # discard comment line
+    Returns:
+        xyz (np.ndarray): (n_atoms, 3) float64 coordinates
+        types (np.ndarray): (n_atoms,) object array of atom types
+    """
+    n_atoms = int(f.readline())  # num atoms
+    f.readline()  # discard comment line
+    lines = list(islice(f, n_atoms))
+    if len(lines) < n_atoms:
+        raise IOError('Incomplete xyz frame')
+    if n_atoms == 0:
+        return np.empty(shape=(0, 3)), np.empty(shape=(0,), dtype='object')
+
+    fields = b''.join(lines).decode().split()
+    n_fields = len(lines[0].split())
+    if len(fields) == n_fields * n_atoms:
+        fields = np.array(fields, dtype='object').reshape(n_atoms, n_fields)
+    else:
+        # ragged, e.g. only some lines carry extra columns
+        fields = np.array([line.decode().split()[:4] for line in lines],
+                          dtype='object')
+    types = fields[:, 0].copy()
+    xyz = fields[:, 1:4].astype(np.float64)
+    return xyz, types
+
+
+def _format_xyz_frame(xyz, types, comment='', precision=3):
+    """Format one frame of an xyz file."""
+    return ('%d\n%s\n' % (xyz.shape[0], comment)
+            + _format_rows('%s' + ' %%8.%df' % precision * 3 + '\n',
+                           [_as_str(types), xyz[:, 0], xyz[:, 1], xyz[:, 2]]))
 
-        xyz = np.empty(shape=(n_atoms, 3))
-        types = np.empty(shape=(n_atoms), dtype='object')
-        for i in range(n_atoms):
-            temp = f.readline().split()
-            types[i] = temp[0]  # atom type
-            xyz[i] = [float(x) for x in temp[1:4]]  # coordinates
-        return xyz, types
+
+def _format_gro_frame(xyz, types, box, title='system', resids=None,
+                      resnames=None, precision=3):
+    """Format one frame of a .gro file.
+
+    Residue and atom numbers wrap around at 100000 as in GROMACS. Residue
+    names default to the atom types.
+    """
+    n_atoms = xyz.shape[0]
+    if resids is None:
+        resids = np.ones(n_atoms, dtype=int)
+    if resnames is None:
+        resnames = types
+    width = precision + 5
+    body = _format_rows('%5d%-5s%5s%5d' + '%%%d.%df' % (width, precision) * 3
+                        + '\n',
+                        [np.asarray(resids) % 100000,
+                         _as_str(resnames), _as_str(types),
+                         np.arange(1, n_atoms + 1) % 100000,
+                         xyz[:, 0], xyz[:, 1], xyz[:, 2]])
+    lengths = box.lengths if box is not None else np.zeros(3)
+    return ('%s\n%d\n' % (title, n_atoms) + body
+            + '%10.5f%10.5f%10.5f\n' % tuple(lengths))
+
+
+def _format_lammpstrj_frame(xyz, types, step, box, fmt='5col', precision=4):
+    """Format one frame of a LAMMPS dump file."""
+    item_line = {'5col': 'ITEM: ATOMS id type x y z\n'}
+    header = ['ITEM: TIMESTEP\n',
+              '%d\n' % step,
+              'ITEM: NUMBER OF ATOMS\n',
+              '%d\n' % len(xyz),
+              'ITEM: BOX BOUNDS\n']
+    for i in range(3):
+        header.append('%.6f %.6f\n' % (box.mins[i], box.maxs[i]))
+    header.append(item_line[fmt])
+    if fmt == '5col':
+        body = _format_rows('%d %d' + ' %%.%df' % precision * 3 + '\n',
+                            [np.arange(1, len(xyz) + 1), types,
+                             xyz[:, 0], xyz[:, 1], xyz[:, 2]])
+    return ''.join(header) + body
 
 
 def write_xyz(xyz, types, file_name, comment=''):
@@ -96,39 +199,378 @@ def write_xyz(xyz, types, file_name, comment=''):
     assert xyz.shape[0] == types.shape[0]
 
     with open(file_name, 'w') as f:
-        f.write(str(xyz.shape[0]) + '\n')  # num atoms
-        f.write(comment + '\n')  # comment line
-
-        for i, atom in enumerate(types):
-            #        type   x     y     z
-            f.write('%s %8.3f %8.3f %8.3f\n' %
-                    (atom, xyz[i, 0], xyz[i, 1], xyz[i, 2]))
+        f.write(_format_xyz_frame(xyz, types, comment))
     print("Wrote file '" + file_name + "'")
 
 def write_lammpstrj_frame(xyz, types, step=1, box=Box(None), fmt='5col',
         filename='traj.lammpstrj', mode='a'):
     assert len(xyz) == len(types)
-    item_line = {'5col': 'ITEM: ATOMS id type x y z\n'}
     with open(filename, mode) as f:
-        f.write('ITEM: TIMESTEP\n')
-        f.write('%d\n' % step)
-        f.write('ITEM: NUMBER OF ATOMS\n')
-        f.write('%d\n' % len(xyz))
-        f.write('ITEM: BOX BOUNDS\n')
-        for i in range(3):
-            f.write('%.6f %.6f\n' % (box.mins[i], box.maxs[i]))
-        f.write(item_line[fmt])
-        for i, pos in enumerate(xyz):
-            if fmt == '5col':
-                f.write('%d %d %.4f %.4f %.4f\n' %
-                        (i+1, types[i], pos[0], pos[1], pos[2]))
+        f.write(_format_lammpstrj_frame(np.asarray(xyz), np.asarray(types),
+                                        step, box, fmt))
+
+
+class TrajectoryWriter():
+    """Keep a trajectory file open and buffered while frames are appended.
+
+    Use this instead of repeated write_lammpstrj_frame() or write_xyz() calls,
+    which reopen the file for every frame. Frames of .gro files are written
+    without residue information.
+
+    Example:
+        with TrajectoryWriter('out.lammpstrj') as traj:
+            for xyz, types, step, box in frames:
+                traj.write_frame(xyz, types, step=step, box=box)
+    """
+    def __init__(self, filename, fmt='lammpstrj', mode='w',
+                 buffer_size=4 * 1024 ** 2, precision=None):
+        """Open the trajectory file.
+
+        Args:
+            filename (str): name of trajectory file
+            fmt (str): 'lammpstrj', 'xyz' or 'gro'
+            mode (str): 'w' to overwrite or 'a' to append
+            buffer_size (int): size of the write buffer in bytes
+            precision (int): decimals of the coordinates, defaults to 4 for
+                lammpstrj and 3 for xyz and gro
+        """
+        if fmt not in ('lammpstrj', 'xyz', 'gro'):
+            raise ValueError("Unknown trajectory format '{0}'".format(fmt))
+        self.filename = filename
+        self.fmt = fmt
+        self.precision = precision
+        self.n_frames = 0
+        self._file = open(filename, mode, buffering=buffer_size)
+
+    def write_frame(self, xyz, types, step=None, box=None, comment=''):
+        """Append a frame.
+
+        Args:
+            xyz (np.ndarray): (n_atoms, 3) coordinates
+            types (np.ndarray): (n_atoms,) atom types
+            step (int): timestep, defaults to the frame number
+            box (Box): simulation box, required for lammpstrj
+            comment (str): comment line of xyz frames or title of gro frames
+        """
+        xyz = np.asarray(xyz)
+        assert len(xyz) == len(types)
+        if step is None:
+            step = self.n_frames
+        kwargs = dict()
+        if self.precision is not None:
+            kwargs['precision'] = self.precision
+        if self.fmt == 'lammpstrj':
+            self._file.write(_format_lammpstrj_frame(xyz, np.asarray(types),
+                                                     step, box, **kwargs))
+        elif self.fmt == 'gro':
+            title = comment or 'step %d' % step
+            self._file.write(_format_gro_frame(xyz, types, box, title,
+                                               **kwargs))
+        else:
+            self._file.write(_format_xyz_frame(xyz, types, comment, **kwargs))
+        self.n_frames += 1
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
 
 
+class _IndexedTrajectory():
+    """Random access to the frames of a text trajectory.
+
+    The file is scanned once to record the byte offset of every frame, after
+    which any frame is read by seeking straight to it. A frame is only
+    indexed once all of its lines are complete, so files that are still being
+    written can be opened and later extended with refresh() or follow().
+    Subclasses implement _frame_lines() and _read_frame().
+    """
+    def __init__(self, file_name, offsets=None):
+        """Index the trajectory.
+
+        Args:
+            file_name (str): name of trajectory file
+            offsets (list(int)): frame offsets of an earlier index of the same
+                file, skips the scan
+        """
+        self.file_name = file_name
+        self._file = open(file_name, 'rb')
+        if offsets is None:
+            offsets = self._index(0)
+        else:
+            # resume behind the last known frame
+            offsets = list(offsets)
+            if offsets:
+                offsets.extend(self._index(offsets[-1])[1:])
+        self.offsets = offsets
+
+    def _frame_lines(self, f):
+        """Read the header of the frame at the current position and return
+        the number of lines that follow it, or None at the end of the file.
+        """
+        raise NotImplementedError
+
+    def _read_frame(self, f):
+        """Parse the frame at the current position."""
+        raise NotImplementedError
+
+    def _index(self, start):
+        """Byte offsets of the complete frames from 'start' onwards.
+
+        Also remembers where the last complete frame ends in self._end.
+        """
+        offsets = list()
+        f = self._file
+        f.seek(start)
+        self._end = start
+        while True:
+            offset = f.tell()
+            try:
+                n_lines = self._frame_lines(f)
+            except ValueError:
+                break  # partially written header
+            if n_lines is None:
+                break
+            n_read = 0
+            line = b'\n'
+            for line in islice(f, n_lines):
+                n_read += 1
+            if n_read < n_lines or not line.endswith(b'\n'):
+                break  # incomplete last frame
+            offsets.append(offset)
+            self._end = f.tell()
+        return offsets
+
+    def refresh(self):
+        """Index the frames completed since the last scan.
+
+        Returns:
+            n_new (int): number of new frames
+        """
+        new = self._index(self._end)
+        self.offsets.extend(new)
+        return len(new)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        self._file.seek(self.offsets[index])
+        return self._read_frame(self._file)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def follow(traj, start=0, poll_interval=1.0, timeout=None):
+    """Yield the frames of a trajectory that is still being written.
+
+    Frames are yielded as soon as they are complete. Only the new part of the
+    file is scanned on every poll, so accumulators can be updated
+    incrementally without rereading earlier frames.
+
+    Example:
+        traj = LammpstrjTrajectory('dump.lammpstrj')
+        for xyz, types, step, box in follow(traj, timeout=600):
+            histogram.update(xyz)
+
+    Args:
+        traj: an indexed trajectory with a refresh() method
+        start (int): index of the first frame to yield
+        poll_interval (float): seconds to wait for new frames
+        timeout (float): stop after this many seconds without a new frame,
+            None to follow forever
+    """
+    i = start
+    waited = 0.0
+    while True:
+        while i < len(traj):
+            yield traj[i]
+            i += 1
+        if traj.refresh():
+            waited = 0.0
+            continue
+        if timeout is not None and waited >= timeout:
+            return
+        time.sleep(poll_interval)
+        waited += poll_interval
+
+
+class XyzTrajectory(_IndexedTrajectory):
+    """Multi-frame xyz file, frames are (xyz, types) tuples.
+
+    Example:
+        with XyzTrajectory('traj.xyz') as traj:
+            xyz, types = traj[-1]
+            for xyz, types in traj[::10]:
+                ...
+    """
+    def _frame_lines(self, f):
+        line = f.readline()
+        if not line.strip():
+            return None
+        f.readline()  # comment
+        return int(line)
+
+    def _read_frame(self, f):
+        return _read_xyz_frame(f)
+
+
+class GroTrajectory(_IndexedTrajectory):
+    """Multi-frame .gro file, frames are tuples as returned by read_gro().
+    """
+    def _frame_lines(self, f):
+        if not f.readline():
+            return None
+        return int(f.readline()) + 1  # atoms and box line
+
+    def _read_frame(self, f):
+        return _read_gro_frame(f)
+
+
+class LammpstrjTrajectory(_IndexedTrajectory):
+    """Multi-frame LAMMPS dump file, frames are (xyz, types, step, box)
+    tuples as returned by read_frame_lammpstrj().
+    """
+    def _frame_lines(self, f):
+        if not f.readline():
+            return None
+        for _ in range(2):
+            f.readline()  # timestep, ITEM: NUMBER OF ATOMS
+        n_atoms = int(f.readline())
+        return n_atoms + 5  # box bounds, ITEM: ATOMS and atom lines
+
+    def _read_frame(self, f):
+        return _read_lammpstrj_frame(f)
+
+
+def _read_lammpstrj_frame(f, read_velocities=False):
+    """Read one LAMMPS dump frame from a file opened in binary mode.
+
+    Atoms are sorted by id. The columns are located through the 'ITEM: ATOMS'
+    line, falling back to 'id type x y z'. Unwrapped (xu) and scaled (xs)
+    coordinates are used if plain ones are absent.
+
+    Args:
+        f (file): dump file opened in binary mode
+        read_velocities (bool): also return the vx, vy, vz columns, which
+            fall back to the three columns after z
+    Returns:
+        xyz (np.ndarray): (n_atoms, 3) float64 coordinates
+        types (np.ndarray): (n_atoms,) int atom types
+        step (int): timestep
+        box (Box): simulation box
+        vxyz (np.ndarray): (n_atoms, 3) velocities if read_velocities
+    """
+    f.readline()  # ITEM: TIMESTEP
+    step = int(f.readline())
+    f.readline()  # ITEM: NUMBER OF ATOMS
+    n_atoms = int(f.readline())
+    f.readline()  # ITEM: BOX BOUNDS
+    box_dims = np.array([f.readline().split()[:2] for _ in range(3)],
+                        dtype=np.float64)
+    box = Box(mins=box_dims[:, 0], maxs=box_dims[:, 1])
+    columns = f.readline().decode().split()[2:]
+    lines = list(islice(f, n_atoms))
+    if len(lines) < n_atoms:
+        raise IOError('Incomplete lammpstrj frame')
+
+    def column(names, default):
+        for name in names:
+            if name in columns:
+                return columns.index(name), name
+        return default, None
+
+    i_id, _ = column(['id'], 0)
+    i_type, _ = column(['type'], 1)
+    i_x, x_name = column(['x', 'xu', 'xs', 'xsu'], 2)
+    i_y, _ = column(['y', 'yu', 'ys', 'ysu'], i_x + 1)
+    i_z, _ = column(['z', 'zu', 'zs', 'zsu'], i_x + 2)
+
+    if n_atoms:
+        data = _parse_block(b''.join(lines).decode().splitlines(True))
+    else:
+        data = np.empty(shape=(0, max(5, len(columns))))
+    order = np.argsort(data[:, i_id], kind='mergesort')
+    data = data[order]
+    xyz = data[:, [i_x, i_y, i_z]]
+    if x_name in ('xs', 'xsu'):
+        xyz = box.mins + xyz * box.lengths
+    types = data[:, i_type].astype(int)
+    if read_velocities:
+        i_vx, _ = column(['vx'], i_z + 1)
+        i_vy, _ = column(['vy'], i_vx + 1)
+        i_vz, _ = column(['vz'], i_vx + 2)
+        if max(i_vx, i_vy, i_vz) >= data.shape[1]:
+            raise IOError('No velocities in lammpstrj frame')
+        return xyz, types, step, box, data[:, [i_vx, i_vy, i_vz]]
+    return xyz, types, step, box
+
+
+
+# sections whose number of lines is given in the header
+_COUNTED_SECTIONS = {'Atoms': 'atoms',
+                     'Velocities': 'atoms',
+                     'Bonds': 'bonds',
+                     'Angles': 'angles',
+                     'Dihedrals': 'dihedrals',
+                     'Impropers': 'impropers'}
+
+# sections that run until the next blank line
+_COEFF_SECTIONS = ('Masses', 'Pair Coeffs', 'Bond Coeffs', 'Angle Coeffs',
+                   'Dihedral Coeffs', 'Improper Coeffs')
+
+_HEADER_COUNT = re.compile(
+    r'^\s*(\d+)\s+(atoms|bonds|angles|dihedrals|impropers)\s*$')
+
+
+def _parse_block(lines, dtype=float):
+    """Parse a block of whitespace separated numbers into a 2D array.
+
+    Lines with more fields than the shortest line are truncated.
+
+    Args:
+        lines (list(str)): lines of the block
+        dtype: type of the returned array
+    Returns:
+        block (np.ndarray): (len(lines), n_fields) array
+    """
+    text = ''.join(lines)
+    if '#' in text:
+        text = '\n'.join(line.split('#', 1)[0] for line in lines)
+    fields = text.split()
+    n_fields = len(lines[0].split('#', 1)[0].split())
+    if len(fields) != n_fields * len(lines):
+        # ragged, e.g. only some atoms have image flags
+        rows = [line.split('#', 1)[0].split() for line in lines]
+        n_fields = min(len(row) for row in rows)
+        fields = [x for row in rows for x in row[:n_fields]]
+    return np.array(fields, dtype=dtype).reshape(len(lines), n_fields)
+
 
 def read_lammps_data(data_file, verbose=False):
     """Reads a LAMMPS data file
 
-    *** Only works for directives delimited by blank lines ***
+    The file is read once, line by line. Atoms, Bonds, Angles, Dihedrals and
+    Impropers are read as blocks of as many lines as given in the header and
+    converted in bulk. Sections that are not listed below are skipped: a
+    line that does not start with an integer ends the current section.
 
     Currently supports the following directives:
         Masses
@@ -143,8 +585,6 @@ def read_lammps_data(data_file, verbose=False):
         Impropers
 
     TODO:
-        -handling for comments
-        -handling for directives not delimited by blank lines
         -allow specification of forcefield styles
 
     Args:
@@ -165,243 +605,124 @@ def read_lammps_data(data_file, verbose=False):
             'dihedral_types': dihedral_type (dict)
             'improper_types': improper_type (dict)
 
-        box (numpy.ndarray): box dimensions
+        box (Box): box dimensions
     """
-    bonds = np.empty(shape=(0, 3), dtype='int')
-    angles = np.empty(shape=(0, 4), dtype='int')
-    dihedrals = np.empty(shape=(0, 5), dtype='int')
-    impropers = np.empty(shape=(0, 5), dtype='int')
-
-    pair_types = dict()
-    bond_types = dict()
-    angle_types = dict()
-    dihedral_types = dict()
-    improper_types = dict()
+    counts = {'atoms': 0, 'bonds': 0, 'angles': 0, 'dihedrals': 0,
+              'impropers': 0}
+    width = {'bonds': 3, 'angles': 4, 'dihedrals': 5, 'impropers': 5}
+    topology = dict()
+    coeffs = dict((section, dict()) for section in _COEFF_SECTIONS)
+    dims = np.zeros(shape=(3, 2))
+    atoms = None
 
     print("Reading '" + data_file + "'")
     with open(data_file, 'r') as f:
-        data_lines = f.readlines()
-
-    # TODO: improve robustness of xlo regex
-    directives = re.compile(r"""
-        ((?P<n_atoms>\s*\d+\s+atoms)
-        |
-        (?P<n_bonds>\s*\d+\s+bonds)
-        |
-        (?P<n_angles>\s*\d+\s+angles)
-        |
-        (?P<n_dihedrals>\s*\d+\s+dihedrals)
-        |
-        (?P<n_impropers>\s*\d+\s+impropers)
-        |
-        (?P<box>.+xlo)
-        |
-        (?P<Masses>\s*Masses)
-        |
-        (?P<PairCoeffs>\s*Pair\sCoeffs)
-        |
-        (?P<BondCoeffs>\s*Bond\sCoeffs)
-        |
-        (?P<AngleCoeffs>\s*Angle\sCoeffs)
-        |
-        (?P<DihedralCoeffs>\s*Dihedral\sCoeffs)
-        |
-        (?P<ImproperCoeffs>\s*Improper\sCoeffs)
-        |
-        (?P<Atoms>\s*Atoms)
-        |
-        (?P<Bonds>\s*Bonds)
-        |
-        (?P<Angles>\s*Angles)
-        |
-        (?P<Dihedrals>\s*Dihedrals)
-        |
-        (?P<Impropers>\s*Impropers))
-        """, re.VERBOSE)
-
-    i = 0
-    while i < len(data_lines):
-        match = directives.match(data_lines[i])
-        if match:
-            if verbose:
-                print(match.groups())
-
-            elif match.group('n_atoms'):
-                fields = data_lines.pop(i).split()
-                n_atoms = int(fields[0])
-                xyz = np.empty(shape=(n_atoms, 3))
-                types = np.empty(shape=(n_atoms), dtype='int')
-                masses = np.empty(shape=(n_atoms))
-                charges = np.empty(shape=(n_atoms))
-
-            elif match.group('n_bonds'):
-                fields = data_lines.pop(i).split()
-                bonds = np.empty(shape=(float(fields[0]), 3), dtype='int')
-
-            elif match.group('n_angles'):
-                fields = data_lines.pop(i).split()
-                angles = np.empty(shape=(float(fields[0]), 4), dtype='int')
-
-            elif match.group('n_dihedrals'):
-                fields = data_lines.pop(i).split()
-                dihedrals = np.empty(shape=(float(fields[0]), 5), dtype='int')
-
-            elif match.group('n_impropers'):
-                fields = data_lines.pop(i).split()
-                impropers = np.empty(shape=(float(fields[0]), 5), dtype='int')
-
-            elif match.group('box'):
-                dims = np.zeros(shape=(3, 2))
-                for j in range(3):
-                    fields = [float(x) for x in data_lines.pop(i).split()[:2]]
-                    dims[j, 0] = fields[0]
-                    dims[j, 1] = fields[1]
-                box = Box(dims[:, 1], dims[:, 0])
-
-            elif match.group('Masses'):
-                if verbose:
-                    print('Parsing Masses...')
-                data_lines.pop(i)
-                data_lines.pop(i)
-
-                mass_dict = dict()  # type:mass
-                #     not end of file         not blank line
-                while i < len(data_lines) and data_lines[i].strip():
-                    fields = data_lines.pop(i).split()
-                    mass_dict[int(fields[0])] = float(fields[1])
-
-            elif match.group('Atoms'):
-                if verbose:
-                    print('Parsing Atoms...')
-                data_lines.pop(i)
-                data_lines.pop(i)
-
-                while i < len(data_lines) and data_lines[i].strip():
-                    fields = data_lines.pop(i).split()
-                    if len(fields) == 7:
-                        a_id = int(fields[0])
-                        types[a_id - 1] = int(fields[2])
-                        masses[a_id - 1] = mass_dict[int(fields[2])]
-                        charges[a_id - 1] = float(fields[3])
-                        xyz[a_id - 1] = np.array([float(fields[4]),
-                                             float(fields[5]),
-                                             float(fields[6])])
-
-                    if len(fields) == 10:
-                        a_id = int(fields[0])
-                        types[a_id - 1] = int(fields[2])
-                        masses[a_id - 1] = mass_dict[int(fields[2])]
-                        charges[a_id - 1] = float(fields[3])
-                        xyz[a_id - 1] = np.array([float(fields[4]),
-                                             float(fields[5]),
-                                             float(fields[6])])
-                        # TODO: store image flags?
-
-                    # non-official file format
-                    if len(fields) == 8:
-                        a_id = int(fields[0])
-                        types[a_id - 1] = int(fields[1])
-                        masses[a_id - 1] = mass_dict[int(fields[1])]
-                        charges[a_id - 1] = 0.0
-                        xyz[a_id - 1] = np.array([float(fields[2]),
-                                             float(fields[3]),
-                                             float(fields[4])])
-
-
-            elif match.group('PairCoeffs'):
-                if verbose:
-                    print('Parsing Pair Coeffs...')
-                data_lines.pop(i)
-                data_lines.pop(i)
-
-                while i < len(data_lines) and data_lines[i].strip():
-                    fields = data_lines.pop(i).split()
-                    pair_types[int(fields[0])] = (float(fields[1]),
-                                                  float(fields[2]))
-            elif match.group('BondCoeffs'):
+        f.readline()  # title line
+        section = None
+        for line in f:
+            content = line.split('#', 1)[0].strip()
+
+            # --- header ---
+            if section is None:
+                match = _HEADER_COUNT.match(content)
+                if match:
+                    counts[match.group(2)] = int(match.group(1))
+                    continue
+                fields = content.split()
+                if len(fields) == 4 and fields[3][1:] == 'hi':
+                    k = 'xyz'.index(fields[3][0])
+                    dims[k] = [float(fields[0]), float(fields[1])]
+                    continue
+
+            # --- start of a section ---
+            if content in _COUNTED_SECTIONS or content in _COEFF_SECTIONS:
+                section = content
                 if verbose:
-                    print('Parsing Bond Coeffs...')
-                data_lines.pop(i)
-                data_lines.pop(i)
-
-                while i < len(data_lines) and data_lines[i].strip():
-                    fields = [float(x) for x in  data_lines.pop(i).split()]
-                    bond_types[int(fields[0])] = fields[1:]
-
-            elif match.group('AngleCoeffs'):
-                if verbose:
-                    print('Parsing Angle Coeffs...')
-                data_lines.pop(i)
-                data_lines.pop(i)
-
-                while i < len(data_lines) and data_lines[i].strip():
-                    fields = [float(x) for x in data_lines.pop(i).split()]
-                    angle_types[int(fields[0])] = fields[1:]
-
-            elif match.group('DihedralCoeffs'):
-                if verbose:
-                    print('Parsing Dihedral Coeffs...')
-                data_lines.pop(i)
-                data_lines.pop(i)
-
-                while i < len(data_lines) and data_lines[i].strip():
-                    fields = [float(x) for x in data_lines.pop(i).split()]
-                    dihedral_types[int(fields[0])] = fields[1:]
-
-            elif match.group('ImproperCoeffs'):
-                if verbose:
-                    print('Parsing Improper Coeffs...')
-                data_lines.pop(i)
-                data_lines.pop(i)
-
-                while i < len(data_lines) and data_lines[i].strip():
-                    fields = map(float, data_lines.pop(i).split())
-                    improper_types[int(fields[0])] = fields[1:]
-
-            elif match.group('Bonds'):
-                if verbose:
-                    print('Parsing Bonds...')
-                data_lines.pop(i)
-                data_lines.pop(i)
-
-                while i < len(data_lines) and data_lines[i].strip():
-                    fields = map(int, data_lines.pop(i).split())
-                    bonds[fields[0] - 1] = fields[1:]
-
-            elif match.group('Angles'):
-                if verbose:
-                    print('Parsing Angles...')
-                data_lines.pop(i)
-                data_lines.pop(i)
-
-                while i < len(data_lines) and data_lines[i].strip():
-                    fields = map(int, data_lines.pop(i).split())
-                    angles[fields[0] - 1] = fields[1:]
-
-            elif match.group('Dihedrals'):
-                if verbose:
-                    print('Parsing Dihedrals...')
-                data_lines.pop(i)
-                data_lines.pop(i)
-
-                while i < len(data_lines) and data_lines[i].strip():
-                    fields = map(int, data_lines.pop(i).split())
-                    dihedrals[fields[0] - 1] = fields[1:]
-
-            elif match.group('Impropers'):
-                if verbose:
-                    print('Parsing Impropers...')
-                data_lines.pop(i)
-                data_lines.pop(i)
-
-                while i < len(data_lines) and data_lines[i].strip():
-                    fields = map(int, data_lines.pop(i).split())
-                    impropers[fields[0] - 1] = fields[1:]
-
-            else:
-                i += 1
+                    print('Parsing {0}...'.format(section))
+                if section in _COUNTED_SECTIONS:
+                    n_lines = counts[_COUNTED_SECTIONS[section]]
+                    block = []
+                    if n_lines > 0:
+                        first = next(f, '')
+                        while first and not first.strip():
+                            first = next(f, '')
+                        block = [first] + list(islice(f, n_lines - 1))
+                    if n_lines > 0 and (len(block) < n_lines
+                                        or not block[-1].strip()):
+                        raise ValueError("Section '{0}' of '{1}' ends before "
+                                "{2} lines were read".format(
+                                    section, data_file, n_lines))
+                    if section == 'Atoms':
+                        atoms = _parse_block(block)
+                    elif section != 'Velocities':
+                        data = _parse_block(block, dtype=int)
+                        topology[section.lower()] = data
+                continue
+            if not content:
+                continue
+
+            fields = content.split()
+            if not fields[0].lstrip('-').isdigit():
+                # header of an unknown section, e.g. 'PairIJ Coeffs', skip its
+                # lines until the next known header
+                if verbose and section is not None:
+                    print('Skipping section: ' + content)
+                section = None
+                continue
+
+            # --- lines of a coefficient section ---
+            if section in _COEFF_SECTIONS:
+                coeffs[section][int(fields[0])] = [float(x) for x in fields[1:]]
+            elif verbose:
+                print('Skipping line: ' + line.strip())
+
+    n_atoms = counts['atoms']
+    xyz = np.empty(shape=(n_atoms, 3))
+    types = np.empty(shape=(n_atoms), dtype='int')
+    charges = np.empty(shape=(n_atoms))
+    if n_atoms > 0:
+        ids = atoms[:, 0].astype(int) - 1
+        if atoms.shape[1] in (7, 10):
+            types[ids] = atoms[:, 2]
+            charges[ids] = atoms[:, 3]
+            xyz[ids] = atoms[:, 4:7]
+            # TODO: store image flags?
+        # non-official file format
+        elif atoms.shape[1] == 8:
+            types[ids] = atoms[:, 1]
+            charges[ids] = 0.0
+            xyz[ids] = atoms[:, 2:5]
         else:
-            i += 1
+            raise ValueError('Unsupported number of columns in Atoms: '
+                             '{0}'.format(atoms.shape[1]))
+
+    # per atom masses through a dense type -> mass lookup
+    mass_dict = coeffs['Masses']
+    masses = np.empty(shape=(n_atoms))
+    if n_atoms > 0 and mass_dict:
+        mass_table = np.full(max(max(mass_dict), types.max()) + 1, np.nan)
+        for atype, mass in mass_dict.items():
+            mass_table[atype] = mass[0]
+        masses = mass_table[types]
+
+    bonds, angles, dihedrals, impropers = [
+        np.empty(shape=(0, width[kind]), dtype='int') for kind in
+        ('bonds', 'angles', 'dihedrals', 'impropers')]
+    for kind, data in topology.items():
+        ordered = np.empty(shape=(data.shape[0], width[kind]), dtype='int')
+        ordered[data[:, 0] - 1] = data[:, 1:width[kind] + 1]
+        if kind == 'bonds':
+            bonds = ordered
+        elif kind == 'angles':
+            angles = ordered
+        elif kind == 'dihedrals':
+            dihedrals = ordered
+        else:
+            impropers = ordered
+
+    pair_types = dict((key, tuple(value[:2])) for key, value in
+                      coeffs['Pair Coeffs'].items())
+    box = Box(mins=dims[:, 0], maxs=dims[:, 1])
 
     lmp_data = {'xyz': xyz,
                 'types': types,
@@ -412,10 +733,10 @@ def read_lammps_data(data_file, verbose=False):
                 'dihedrals': dihedrals,
                 'impropers': impropers,
                 'pair_types': pair_types,
-                'bond_types': bond_types,
-                'angle_types': angle_types,
-                'dihedral_types': dihedral_types,
-                'improper_types': improper_types
+                'bond_types': coeffs['Bond Coeffs'],
+                'angle_types': coeffs['Angle Coeffs'],
+                'dihedral_types': coeffs['Dihedral Coeffs'],
+                'improper_types': coeffs['Improper Coeffs']
                 }
     return lmp_data, box
 
@@ -502,7 +823,6 @@ def write_lammpsdata(system, box, filename='groupy.lammpsdata',
                     type_mass[atype] = element[0]
 
             # now check that these are the same as in the system gbbs
-            import pdb
             for atype in system.type_mass.keys():
                 if type_mass[atype] != system.type_mass[atype]:
                     warn_message = "Warning: atom type %d " % atype
@@ -534,7 +854,6 @@ def write_lammpsdata(system, box, filename='groupy.lammpsdata',
                     type_mass[atype] = element[0]
 
             # now check that these are the same as in the system gbbs
-            import pdb
             for atype in system.type_mass.keys():
                 if type_mass[atype] != system.type_mass[atype]:
                     warn_message = "Warning: atom type %d " % atype
@@ -620,7 +939,6 @@ def write_lammpsdata(system, box, filename='groupy.lammpsdata',
                     type_mass[atype] = element[0]
 
             # now check that these are the same as in the system gbbs
-            import pdb
             for atype in system.type_mass.keys():
                 if type_mass[atype] != system.type_mass[atype]:
                     warn_message = "Warning: atom type %d " % atype
@@ -734,6 +1052,158 @@ def write_lammpsdata(system, box, filename='groupy.lammpsdata',
                 f.write('%d %d %d %d %d %d\n' %
                         (i+1, imp[0], imp[1]+1, imp[2]+1, imp[3]+1, imp[4]+1))
 
+def _topology_rows(gbb, kind):
+    """Connectivity of a prototype as an integer array, or None."""
+    rows = np.asarray(getattr(gbb, kind, []), dtype=int)
+    if rows.size == 0:
+        return None
+    return rows.reshape(-1, {'bonds': 3, 'angles': 4,
+                             'dihedrals': 5, 'impropers': 5}[kind])
+
+
+def write_lammpsdata_stream(prototypes, blocks, box,
+        filename='groupy.lammpsdata', sys_name=None, chunk_size=100000):
+    """Write a lammpsdata file without holding the whole system in memory.
+
+    Header counts are computed from the prototypes times their number of
+    copies. Atom coordinates are consumed from 'blocks' as they arrive and
+    connectivity is generated from the prototypes, so only one block of
+    molecules is ever in memory. Atom ids in the prototype connectivity are
+    zero-indexed, as in System.
+
+    Args:
+        prototypes (list): (Gbb, n_copies) for each component, in the order
+            in which the molecules arrive
+        blocks (iterable): (i, xyz) where xyz is a (k, n_atoms_i, 3) array
+            with the coordinates of the next k copies of prototype i, e.g.
+            FastBilayer.iter_blocks()
+        box (Box): simulation box
+        filename (str): name of the data file to write
+        sys_name (str): name written on the first line
+        chunk_size (int): number of lines formatted per write
+    """
+    if not sys_name:
+        sys_name = 'created with groupy'
+    kinds = ('bonds', 'angles', 'dihedrals', 'impropers')
+    headers = {'bonds': 'Bonds', 'angles': 'Angles',
+               'dihedrals': 'Dihedrals', 'impropers': 'Impropers'}
+
+    n_apm = [len(gbb.xyz) for gbb, _ in prototypes]
+    n_atoms = sum(n * n_copies for n, (_, n_copies) in zip(n_apm, prototypes))
+    counts = dict()
+    n_types = dict()
+    for kind in kinds:
+        counts[kind] = 0
+        n_types[kind] = 0
+        for gbb, n_copies in prototypes:
+            rows = _topology_rows(gbb, kind)
+            if rows is not None:
+                counts[kind] += rows.shape[0] * n_copies
+                n_types[kind] = max(n_types[kind], rows[:, 0].max())
+
+    type_mass = dict()
+    net_charge = 0.0
+    for gbb, n_copies in prototypes:
+        for atype, mass in zip(np.ravel(gbb.types), np.ravel(gbb.masses)):
+            type_mass[int(atype)] = mass
+        net_charge += np.sum(gbb.charges) * n_copies
+    if abs(net_charge) > 1.0e-8:
+        print('Warning: non-zero net system charge (%.4f). Proceed with caution!'
+                % net_charge)
+
+    with open(filename, 'w') as f:
+        f.write(sys_name + '\n')
+        f.write('\n')
+        f.write('%d atoms\n' % n_atoms)
+        for kind in kinds:
+            f.write('%d %s\n' % (counts[kind], kind))
+        f.write('\n')
+        f.write('%d atom types\n' % max(type_mass.keys()))
+        for kind in kinds:
+            f.write('%d %s types\n' % (n_types[kind], kind[:-1]))
+        f.write('\n')
+        f.write('%.6f %.6f xlo xhi\n' % (box.mins[0], box.maxs[0]))
+        f.write('%.6f %.6f ylo yhi\n' % (box.mins[1], box.maxs[1]))
+        f.write('%.6f %.6f zlo zhi\n' % (box.mins[2], box.maxs[2]))
+        f.write('\n')
+
+        f.write('Masses\n')
+        f.write('\n')
+        for atype in range(1, max(type_mass.keys()) + 1):
+            if atype in type_mass:
+                f.write('%d %.4f\n' % (atype, type_mass[atype]))
+            else:
+                f.write('%d 999.0   # dummy, this type not in this system\n'
+                        % atype)
+        f.write('\n')
+
+        # atoms, as the coordinates come in
+        f.write('Atoms\n')
+        f.write('\n')
+        fmt = '%d %d %d %.5f %.5f %.5f %.5f\n'
+        written = [0] * len(prototypes)
+        atom_id = 0
+        mol_id = 0
+        for i, xyz in blocks:
+            gbb = prototypes[i][0]
+            xyz = np.asarray(xyz).reshape(-1, n_apm[i], 3)
+            assert (all(written[k] == prototypes[k][1] for k in range(i))
+                    and not any(written[i + 1:])), \
+                'Molecules must arrive in the order of the prototypes'
+            written[i] += xyz.shape[0]
+            assert written[i] <= prototypes[i][1], \
+                'Received more copies of prototype %d than declared' % i
+            types = np.ravel(gbb.types).astype(int)
+            charges = np.ravel(gbb.charges)
+            step = max(1, chunk_size // n_apm[i])
+            for start in range(0, xyz.shape[0], step):
+                chunk = xyz[start:start + step]
+                n_mol = chunk.shape[0]
+                n = n_mol * n_apm[i]
+                f.write(_format_rows(fmt,
+                    [np.arange(atom_id + 1, atom_id + n + 1),
+                     np.repeat(np.arange(mol_id + 1, mol_id + n_mol + 1),
+                               n_apm[i]),
+                     np.tile(types, n_mol),
+                     np.tile(charges, n_mol),
+                     chunk[:, :, 0].ravel(),
+                     chunk[:, :, 1].ravel(),
+                     chunk[:, :, 2].ravel()]))
+                atom_id += n
+                mol_id += n_mol
+        assert atom_id == n_atoms, \
+            'Expected %d atoms, received %d atoms.' % (n_atoms, atom_id)
+
+        # connectivity straight from the prototypes
+        for kind in kinds:
+            if counts[kind] == 0:
+                continue
+            f.write('\n')
+            f.write(headers[kind] + '\n')
+            f.write('\n')
+            item_id = 0
+            atom_offset = 0
+            for (gbb, n_copies), n in zip(prototypes, n_apm):
+                rows = _topology_rows(gbb, kind)
+                if rows is None:
+                    atom_offset += n * n_copies
+                    continue
+                n_cols = rows.shape[1]
+                fmt = ' '.join(['%d'] * (n_cols + 1)) + '\n'
+                step = max(1, chunk_size // rows.shape[0])
+                for start in range(0, n_copies, step):
+                    n_mol = min(step, n_copies - start)
+                    offsets = atom_offset + n * np.arange(start, start + n_mol)
+                    chunk = np.tile(rows, (n_mol, 1))
+                    chunk[:, 1:] += np.repeat(offsets, rows.shape[0])[:, np.newaxis] + 1
+                    n_rows = chunk.shape[0]
+                    f.write(_format_rows(fmt,
+                        [np.arange(item_id + 1, item_id + n_rows + 1)]
+                        + [chunk[:, k] for k in range(n_cols)]))
+                    item_id += n_rows
+                atom_offset += n * n_copies
+    print("Wrote file '" + filename + "'")
+
 def write_lammps_data(gbb, box=None, file_name='data.system', 
         sys_name='system', prototype=False):
     """Write gbb to LAMMPS data file
@@ -933,49 +1403,67 @@ def write_lammps_data(gbb, box=None, file_name='data.system',
     print("Wrote file '" + file_name + "'")
 
 def read_gro(file_name):
-    """
+    """Read the first frame of a .gro file.
+
+    Use GroTrajectory to read multi-frame files.
+
+    Returns:
+        resids (np.ndarray): (n_atoms,) residue numbers
+        resnames (np.ndarray): (n_atoms,) residue names
+        types (np.ndarray): (n_atoms,) atom names
+        xyz (np.ndarray): (n_atoms, 3) float64 coordinates
+        vel (np.ndarray): (n_atoms, 3) float64 velocities, zero if absent
+        box (np.ndarray): (3, 2) box bounds
     """
     if not file_name.endswith('.gro'):
         warnings.warn("File name passed to read_gro() does not end with '.gro'")
 
-    with open(file_name, 'r') as f:
-        sys_name = f.readline().strip()
-        n_atoms = int(f.readline())
-
-        resids = np.empty(shape=(n_atoms), dtype='u4')
-        resnames = np.empty(shape=(n_atoms), dtype='a5')
-        types = np.empty(shape=(n_atoms), dtype='a5')
-        xyz = np.empty(shape=(n_atoms, 3), dtype='f2')
-        vel = np.empty(shape=(n_atoms, 3), dtype='f2')
-        for i in range(n_atoms):
-            line = f.readline()
-            resids[i] = int(line[:5])
-            resnames[i] = line[5:10].strip()
-            types[i] = line[10:15].strip()
-            xyz[i, 0] = float(line[20:28])
-            xyz[i, 1] = float(line[28:36])
-            xyz[i, 2] = float(line[36:44])
-            try:
-                vel[i, 0] = float(line[44:52])
-                vel[i, 1] = float(line[52:60])
-                vel[i, 2] = float(line[60:68])
-            except:
-                vel[i, 0] = 0.0
-                vel[i, 1] = 0.0
-                vel[i, 2] = 0.0
-
-        box = np.zeros(shape=(3, 2))
-        line = list(map(float, f.readline().split()))
-        if len(line) == 3:
-            box[0, 1] = line[0]
-            box[1, 1] = line[1]
-            box[2, 1] = line[2]
+    with open(file_name, 'rb') as f:
+        frame = _read_gro_frame(f)
 
     print("Read file '" + file_name + "'")
-    return resids, resnames, types, xyz, vel, box
+    return frame
+
 
+def _gro_column(chars, start, stop, dtype):
+    """Convert a fixed-width column of a (n, width) 'S1' array."""
+    column = np.ascontiguousarray(chars[:, start:stop])
+    return column.view('S%d' % (stop - start)).ravel().astype(dtype)
 
 
+def _read_gro_frame(f):
+    """Read one .gro frame from a file opened in binary mode.
+
+    The atom lines are laid out in a (n_atoms, width) character array so that
+    every field is converted as a whole column.
+    """
+    f.readline()  # title
+    n_atoms = int(f.readline())
+    lines = [line.rstrip(b'\r\n') for line in islice(f, n_atoms)]
+    if len(lines) < n_atoms:
+        raise IOError('Incomplete gro frame')
+    box_line = f.readline().split()
+
+    width = max([44] + [len(line) for line in lines])
+    chars = np.array(lines, dtype='S%d' % width).view('S1')
+    chars = chars.reshape(n_atoms, width)
+
+    resids = _gro_column(chars, 0, 5, 'u4')
+    resnames = np.char.strip(_gro_column(chars, 5, 10, 'a5'))
+    types = np.char.strip(_gro_column(chars, 10, 15, 'a5'))
+    xyz = np.empty(shape=(n_atoms, 3))
+    vel = np.zeros(shape=(n_atoms, 3))
+    for k in range(3):
+        xyz[:, k] = _gro_column(chars, 20 + 8 * k, 28 + 8 * k, np.float64)
+    if n_atoms and min(len(line) for line in lines) >= 68:
+        for k in range(3):
+            vel[:, k] = _gro_column(chars, 44 + 8 * k, 52 + 8 * k, np.float64)
+
+    box = np.zeros(shape=(3, 2))
+    if len(box_line) == 3:
+        box[:, 1] = [float(x) for x in box_line]
+    return resids, resnames, types, xyz, vel, box
+
 
 def write_gro(gbb, box, grofile='system.gro', sys_name='system'):
     """Write gbb to GROMACS .gro file
@@ -986,21 +1474,20 @@ def write_gro(gbb, box, grofile='system.gro', sys_name='system'):
     Args:
         grofile (str): name of .gro structure file
     """
+    xyz = np.asarray(gbb.xyz)
+    vel = np.asarray(gbb.vel)
+    # format before opening the file so that missing fields leave no file
+    body = _format_rows('%5d%-4s%6s%5d%8.3f%8.3f%8.3f%8.3f%8.3f%8.3f\n',
+            [gbb.resids,
+             _as_str(gbb.resnames),
+             _as_str(gbb.types),
+             np.arange(1, xyz.shape[0] + 1),
+             xyz[:, 0], xyz[:, 1], xyz[:, 2],
+             vel[:, 0], vel[:, 1], vel[:, 2]])
     with open(grofile, 'w') as f:
         f.write(sys_name + '\n')
-        f.write(str(gbb.xyz.shape[0]) + '\n')
-        for i, coord in enumerate(gbb.xyz):
-            f.write('%5d%-4s%6s%5d%8.3f%8.3f%8.3f%8.3f%8.3f%8.3f\n'
-                      %(gbb.resids[i],
-                        gbb.resnames[i].decode(),
-                        gbb.types[i].decode(),
-                        i+1,
-                        coord[0],
-                        coord[1],
-                        coord[2],
-                        gbb.vel[i, 0],
-                        gbb.vel[i, 1],
-                        gbb.vel[i, 2]))
+        f.write(str(xyz.shape[0]) + '\n')
+        f.write(body)
         f.write('%10.5f%10.5f%10.5f\n'
                %(box[0, 1],
                  box[1, 1],
@@ -1013,22 +1500,23 @@ def write_pdb(gbb, box, pdbfile='system.pdb', sys_name='system'):
     Args:
         pdbfile (str): name of .pdb file
     """
+    xyz = np.asarray(gbb.xyz) * 10
+    n_atoms = xyz.shape[0]
+    # format before opening the file so that missing fields leave no file
+    body = _format_rows(
+            'ATOM  %5d%4s %4s %4d    %8.3f%8.3f%8.3f%6.2f%6.2f    %2s\n',
+            [np.arange(1, n_atoms + 1),
+             _as_str(gbb.types),
+             _as_str(gbb.resnames),
+             gbb.resids,
+             xyz[:, 0], xyz[:, 1], xyz[:, 2],
+             np.zeros(n_atoms), np.zeros(n_atoms),
+             np.zeros(n_atoms, dtype=int)])
     with open(pdbfile, 'w') as f:
         f.write('CRYST1%9.3f%9.3f%9.3f%7.2f%7.2f%7.2f P 1         1\n'
             %(box[0, 1]*10, box[1, 1]*10, box[2, 1]*10,
               box[0, 0], box[1, 0], box[2, 0]))
-        for i, coord in enumerate(gbb.xyz):
-            f.write('ATOM  %5d%4s %4s %4d    %8.3f%8.3f%8.3f%6.2f%6.2f    %2s\n'
-                %(float(i+1),
-                gbb.types[i].decode(),            
-                gbb.resnames[i].decode(),
-                float(gbb.resids[i]),
-                coord[0]*10,
-                coord[1]*10,
-                coord[2]*10,
-                0.0,
-                0.0,
-                0))
+        f.write(body)
         f.write('END') 
     print("Wrote file '" + pdbfile + "'")
 
@@ -1077,7 +1565,16 @@ def write_top(gbb, topfile='system.top'):
         f.write('[ molecules ]\n')
     print("Wrote file '" + topfile + "'")
 
+def _format_topology(rows, n_atoms):
+    """Format 'type id id ...' connectivity rows of a hoomd xml file."""
+    if len(rows) == 0:
+        return ''
+    columns = list(zip(*rows))
+    return _format_rows('%s' + ' %d' * n_atoms + '\n', columns)
+
+
 def write_hoomd_xml(system, box, filename='system.xml'):
+    xyz = np.asarray(system.xyz).reshape(-1, 3)
     # write header
     with open(filename, 'w') as f:
         f.write('<?xml version="1.3" encoding="UTF-8"?>\n')
@@ -1085,37 +1582,30 @@ def write_hoomd_xml(system, box, filename='system.xml'):
         f.write('<configuration time_step="0">\n')
         f.write('<box units="sigma"  Lx="%.4f" Ly="%.4f" Lz="%.4f"/>\n' 
                 % (box.lengths[0], box.lengths[1], box.lengths[2]))
-        f.write('<position units="sigma" num="%d">\n' % len(system.xyz))
-        for pos in system.xyz:
-            f.write('%.4f %.4f %.4f\n' % (pos[0], pos[1], pos[2]))
+        f.write('<position units="sigma" num="%d">\n' % len(xyz))
+        f.write(_format_rows('%.4f %.4f %.4f\n',
+                             [xyz[:, 0], xyz[:, 1], xyz[:, 2]]))
         f.write('</position>\n')
         f.write('<type>\n')
-        for t in system.types:
-            f.write('%s\n' % str(t))
+        f.write(_format_rows('%s\n', [_as_str(system.types)]))
         f.write('</type>\n')
         f.write('<mass>\n')
-        for m in system.masses:
-            f.write('%.4f\n' % m)
+        f.write(_format_rows('%.4f\n', [system.masses]))
         f.write('</mass>\n')
         f.write('<charge>\n')
-        for q in system.charges:
-            f.write('%.4f\n' % q)
+        f.write(_format_rows('%.4f\n', [system.charges]))
         f.write('</charge>\n')
         f.write('<bond>\n')
-        for b in system.bonds:
-            f.write('%s %d %d\n' % (str(b[0]), b[1], b[2]))
+        f.write(_format_topology(system.bonds, 2))
         f.write('</bond>\n')
         f.write('<angle>\n')
-        for a in system.angles:
-            f.write('%s %d %d %d\n' % (str(a[0]), a[1], a[2], a[3]))
+        f.write(_format_topology(system.angles, 3))
         f.write('</angle>\n')
         f.write('<dihedral>\n')
-        for a in system.dihedrals:
-            f.write('%s %d %d %d %d\n' % (str(a[0]), a[1], a[2], a[3], a[4]))
+        f.write(_format_topology(system.dihedrals, 4))
         f.write('</dihedral>\n')
         f.write('<improper>\n')
-        for a in system.impropers:
-            f.write('%s %d %d %d %d\n' % (str(a[0]), a[1], a[2], a[3], a[4]))
+        f.write(_format_topology(system.impropers, 4))
         f.write('</improper>\n')
         f.write('</configuration>\n')
         f.write('</hoomd_xml>\n')
@@ -1,34 +1,41 @@
-from collections import defaultdict
-import pdb
+from __future__ import print_function
+
+import os
 
-import matplotlib.pyplot as plt
 import numpy as np
-from numpy import linspace
-import scipy as sp
-import scipy.stats
-import scipy.integrate
-from scitools.numpyutils import meshgrid
 
+from groupy.checkpoint import get_checkpoint
+from groupy.masses import MassTable, as_mass_table
 from groupy.mdio import read_frame_lammpstrj
 from groupy.general import find_nearest
 
+# numpy 2 renamed trapz to trapezoid
+_trapezoid = getattr(np, 'trapezoid', None) or np.trapz
+
 
 def calc_vel_profile(file_name, system_info):
-    """
+    """Samples of the x-velocity against z of the atoms in each region.
+
+    Velocities are the x-displacements between consecutive frames divided by
+    the number of timesteps between them. See binned_vel_profile() for
+    profiles of long trajectories.
+
+    Returns:
+        z_vx (dict): {region: (n_samples, 2) array of (z, vx)}
     """
     with open(file_name, 'r') as trj:
-        z_vx = dict.fromkeys(system_info.keys(), np.empty(shape=(0,2)))
+        samples = dict((region, list()) for region in system_info)
         step = -np.Inf
         while True:
             try:
                 xyz, _, step, _ = read_frame_lammpstrj(trj)
             except:
-                print "Reached end of '" + file_name + "'"
+                print("Reached end of '" + file_name + "'")
                 break
             if step % 10000 == 0:
-                print "Read step " + str(step)
+                print("Read step " + str(step))
             if step > 0:
-                for region, indices in system_info.iteritems():
+                for region, indices in system_info.items():
                     coords = xyz[indices]
                     prev_coords = prev_xyz[indices]
                     temp = np.zeros(shape=(coords.shape[0], 2))
@@ -37,51 +44,221 @@ def calc_vel_profile(file_name, system_info):
                     # x-velocity
                     temp[:, 1] = ((coords[:, 0] - prev_coords[:, 0])
                             / (step - prev_step))
-                    z_vx[region] = np.vstack((z_vx[region], temp))
+                    samples[region].append(temp)
 
             prev_xyz = xyz
             prev_step = step
+    z_vx = dict()
+    for region, chunks in samples.items():
+        z_vx[region] = (np.vstack(chunks) if chunks
+                        else np.empty(shape=(0, 2)))
     return z_vx
 
 
-def calc_film_heights(file_name, system_info):
+def binned_vel_profile(file_name, system_info, regions=None, n_bins=100,
+        z_range=None, read_velocities=False, max_frames=np.inf):
+    """Calculate binned velocity profiles along z of several regions.
+
+    Each frame the z-coordinates of a region are binned and the sum and the
+    sum of squares of the velocities are accumulated per bin with bincount,
+    so memory is O(n_bins) for any trajectory length. Without dumped
+    velocities, vx is the minimum image x-displacement between consecutive
+    frames divided by the number of timesteps between them, binned at the
+    average z of the two frames.
+
+    Args:
+        file_name (str): name of trajectory to read
+        system_info (dict): dictionary containing indices of atoms in regions
+        regions (list): keys in system_info, defaults to all of them
+        n_bins (int): number of bins along z
+        z_range (tuple): (min, max) of the bins, defaults to the box of the
+            first frame
+        read_velocities (bool): use the vx, vy, vz columns of the dump
+        max_frames (int): maximum number of frames to read
+    Returns:
+        profiles (dict): {region: (count, mean, std)} with the (n_bins,)
+            number of samples and (n_bins, n_components) mean and standard
+            deviation of the velocities per bin, n_components is 3 with
+            read_velocities and 1 (vx) otherwise
+        edges (np.ndarray): (n_bins + 1,) bin edges along z
+    """
+    if regions is None:
+        regions = list(system_info)
+    n_comp = 3 if read_velocities else 1
+    count = dict((region, np.zeros(n_bins)) for region in regions)
+    v_sum = dict((region, np.zeros((n_bins, n_comp))) for region in regions)
+    v_sq = dict((region, np.zeros((n_bins, n_comp))) for region in regions)
+
+    edges = None
+    prev_xyz = None
+    n_frames = 0
+    with open(file_name, 'r') as trj:
+        while n_frames < max_frames:
+            try:
+                frame = read_frame_lammpstrj(trj,
+                                             read_velocities=read_velocities)
+            except:
+                print("Reached end of '" + file_name + "'")
+                break
+            xyz, _, step, box = frame[:4]
+            n_frames += 1
+            if edges is None:
+                if z_range is None:
+                    z_range = (box.mins[2], box.maxs[2])
+                edges = np.linspace(z_range[0], z_range[1], n_bins + 1)
+            if not read_velocities and prev_xyz is None:
+                prev_xyz, prev_step = xyz, step
+                continue
+
+            for region in regions:
+                indices = system_info[region]
+                if read_velocities:
+                    z = xyz[indices, 2]
+                    v = frame[4][indices]
+                else:
+                    z = 0.5 * (xyz[indices, 2] + prev_xyz[indices, 2])
+                    dx = xyz[indices, 0] - prev_xyz[indices, 0]
+                    dx -= box.lengths[0] * np.round(dx / box.lengths[0])
+                    v = (dx / (step - prev_step))[:, np.newaxis]
+                bins = np.searchsorted(edges, z, side='right') - 1
+                inside = (bins >= 0) & (bins < n_bins)
+                bins, v = bins[inside], v[inside]
+                count[region] += np.bincount(bins, minlength=n_bins)
+                for k in range(n_comp):
+                    v_sum[region][:, k] += np.bincount(
+                        bins, weights=v[:, k], minlength=n_bins)
+                    v_sq[region][:, k] += np.bincount(
+                        bins, weights=v[:, k] ** 2, minlength=n_bins)
+            prev_xyz, prev_step = xyz, step
+
+    profiles = dict()
+    for region in regions:
+        n = count[region][:, np.newaxis]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = v_sum[region] / n
+            var = v_sq[region] / n - mean ** 2
+        profiles[region] = (count[region], mean,
+                            np.sqrt(np.maximum(var, 0)))
+    return profiles, edges
+
+
+def calc_film_heights(file_name, system_info, plot=False):
     """Calculate z-coordinate bounds of top and bottom monolayers.
 
     Bounds are the atom closest to the substrate and the z-coordinate
-    that on average includes 90% of the atoms throughout the simulation.
+    that includes 90% of the atoms in each frame, estimated from a Rayleigh
+    distribution. See film_heights().
 
     Args:
         file_name (str): name of trajectory to read
         system_info (dict): dictionary containing indices of atoms in top and
             bottom monolayer. Corresponding keys must be:
             'topfilm' and 'botfilm'
+        plot (bool): plot the bounds over time after reading all frames
     Returns:
-        top_bounds (tuple): z-bounds of top monolayer (min, max)
-        bot_bounds (tuple): z-bounds of bot monolayer (min, max)
+        top_bounds (np.ndarray): (n_frames, 2) z-bounds of top monolayer
+        bot_bounds (np.ndarray): (n_frames, 2) z-bounds of bot monolayer
+    """
+    return film_heights(file_name, system_info, method='rayleigh', plot=plot)
+
+
+def _rayleigh_quantile(z, q):
+    """Quantile q of Rayleigh distributions fitted to each row of z.
+
+    The location and scale follow in closed form from the mean and standard
+    deviation of each row (method of moments).
+    """
+    scale = z.std(axis=1) / np.sqrt((4 - np.pi) / 2)
+    loc = z.mean(axis=1) - scale * np.sqrt(np.pi / 2)
+    return loc + scale * np.sqrt(-2 * np.log(1 - q))
+
+
+def film_heights(file_name, system_info, method='rayleigh', cut=0.1,
+        max_frames=np.inf, plot=False):
+    """Calculate z-coordinate bounds of top and bottom monolayers of all frames.
+
+    The z-coordinates of both films are collected for all frames first and
+    the cutoffs of every frame are then computed at once. The top film is
+    bounded by its lowest 'cut' quantile and its highest atom, the bottom
+    film by its lowest atom and its 1 - 'cut' quantile.
+
+    Args:
+        file_name (str): name of trajectory to read
+        system_info (dict): dictionary containing indices of atoms in top and
+            bottom monolayer. Corresponding keys must be:
+            'topfilm' and 'botfilm'
+        method (str): 'rayleigh' for quantiles of Rayleigh distributions fitted
+            by the method of moments, 'percentile' for empirical percentiles
+        cut (float): fraction of film atoms outside of the bounds
+        max_frames (int): maximum number of frames to read
+        plot (bool): plot the bounds over time after reading all frames
+    Returns:
+        top_bounds (np.ndarray): (n_frames, 2) z-bounds of top monolayer
+        bot_bounds (np.ndarray): (n_frames, 2) z-bounds of bot monolayer
     """
+    if method not in ('rayleigh', 'percentile'):
+        raise ValueError("Unknown method '{0}'".format(method))
+    top_atoms = system_info['topfilm']
+    bot_atoms = system_info['botfilm']
+    top_z = np.empty(shape=(0, len(top_atoms)))
+    bot_z = np.empty(shape=(0, len(bot_atoms)))
+    n_frames = 0
     with open(file_name, 'r') as trj:
-        top_bounds = list()
-        bot_bounds = list()
-        while True:
+        while n_frames < max_frames:
             try:
                 xyz, _, step, _ = read_frame_lammpstrj(trj)
             except:
-                print "Reached end of '" + file_name + "'"
+                print("Reached end of '" + file_name + "'")
                 break
+            top_z = _grow_rows(top_z, n_frames)
+            bot_z = _grow_rows(bot_z, n_frames)
+            top_z[n_frames] = xyz[top_atoms, 2]
+            bot_z[n_frames] = xyz[bot_atoms, 2]
+            n_frames += 1
+    top_z = top_z[:n_frames]
+    bot_z = bot_z[:n_frames]
+
+    top_min = top_z.min(axis=1)
+    top_max = top_z.max(axis=1)
+    bot_min = bot_z.min(axis=1)
+    bot_max = bot_z.max(axis=1)
+    if method == 'rayleigh':
+        top_cut = _rayleigh_quantile(top_z, cut)
+        bot_cut = _rayleigh_quantile(bot_z, 1 - cut)
+    else:
+        top_cut = np.percentile(top_z, 100 * cut, axis=1)
+        bot_cut = np.percentile(bot_z, 100 * (1 - cut), axis=1)
+    top_bounds = np.column_stack((np.clip(top_cut, top_min, top_max), top_max))
+    bot_bounds = np.column_stack((bot_min, np.clip(bot_cut, bot_min, bot_max)))
 
-            # temp container for z-coords of top, [0], and bottom, [1], films
-            heights = np.empty(shape=(2, len(system_info['botfilm'])))
-            heights[0] = xyz[system_info['topfilm']][:, 2]
-            heights[1] = xyz[system_info['botfilm']][:, 2]
-
-            top = find_cutoff('top', heights)
-            bot = find_cutoff('bot', heights, plot=True)
-            top_bounds.append(top)
-            bot_bounds.append(bot)
-    return np.asarray(top_bounds), np.asarray(bot_bounds)
-
-
-def calc_flux(file_name, system_info, planes, area, max_time=np.inf):
+    if plot:
+        import matplotlib.pyplot as plt
+        fig, ax = plt.subplots()
+        frames = np.arange(n_frames)
+        ax.fill_between(frames, top_bounds[:, 0], top_bounds[:, 1],
+                        color='blue', alpha=0.5, label='top film')
+        ax.fill_between(frames, bot_bounds[:, 0], bot_bounds[:, 1],
+                        color='green', alpha=0.5, label='bottom film')
+        ax.set_xlabel('Frame')
+        ax.set_ylabel(u'z (\u00c5)')
+        ax.legend()
+        fig.savefig('film_heights.pdf', bbox_inches='tight')
+        plt.close(fig)
+    return top_bounds, bot_bounds
+
+
+def _grow_rows(array, n_rows):
+    """Double the rows of a chunk-grown array once 'n_rows' are used up."""
+    if n_rows < array.shape[0]:
+        return array
+    grown = np.empty(shape=(max(2 * n_rows, 1024),) + array.shape[1:],
+                     dtype=array.dtype)
+    grown[:n_rows] = array[:n_rows]
+    return grown
+
+
+def calc_flux(file_name, system_info, planes, area, max_time=np.inf,
+        checkpoint=None, resume=False):
     """Calculate fluxes of water across multiple x-y planes.
 
     Args:
@@ -90,141 +267,372 @@ def calc_flux(file_name, system_info, planes, area, max_time=np.inf):
             Corresponding key must be: 'water'
         planes (np.ndarray): z-coords of planes to calculate flux through
         area (float): surface area of planes
+        checkpoint (Checkpoint or str): periodically save progress here
+        resume (bool): continue from the saved checkpoint if there is one
     Returns:
         fluxes_over_time (np.ndarray): fluxes through 'planes'
     """
+    checkpoint = get_checkpoint(checkpoint)
+    planes = np.asarray(planes, dtype=float)
+    n_planes = len(planes)
+    order = np.argsort(planes)
+    sorted_planes = planes[order]
+
     steps = list()
-    fluxes_over_time = np.empty(shape=(0, len(planes)))
+    # grown by doubling, rows [n_rows:] are unused
+    fluxes_over_time = np.empty(shape=(1024, n_planes))
+    n_rows = 0
+    n_frames = 0
     with open(file_name, 'r') as trj:
         step = -1
+        state = checkpoint.restore(trj) if checkpoint and resume else None
+        if state:
+            steps = state['steps'].tolist()
+            fluxes_over_time = state['fluxes_over_time']
+            n_rows = fluxes_over_time.shape[0]
+            n_frames = state['n_frames']
+            step = state['step']
+            prev_bins = state['prev_bins']
+            prev_step = state['prev_step']
         while step < max_time:
             try:
                 xyz, _, step, _ = read_frame_lammpstrj(trj)
             except:
-                print "Reached end of '" + file_name + "'"
+                print("Reached end of '" + file_name + "'")
                 break
 
             # select z-coords of water atoms
             water = xyz[system_info['water']][:, 2]
+            # number of planes each water atom is above
+            bins = np.searchsorted(sorted_planes, water, side='left')
+            bins[np.isnan(water)] = 0
             if step > 0:
                 steps.append(step)
-                fluxes = np.empty(shape=(1, len(planes)))
-                for i, plane in enumerate(planes): # TODO: vectorize
-                    # select water atoms that were and are above the flux plane
-                    were_above = np.where(prev_water > plane)[0]
-                    are_above = np.where(water > plane)[0]
-                    # count how many left the level
-                    n_fluxed = (len(were_above) -
-                               len(np.intersect1d(are_above, were_above)))
-                    # calc dat flux
-                    fluxes[0, i] = n_fluxed / (area * (step - prev_step))
-                fluxes_over_time = np.vstack((fluxes_over_time, fluxes))
+                # an atom that moved down from bin b0 to bin b1 left the level
+                # of planes b1 .. b0 - 1: +1 at b1 and -1 at b0, then cumsum
+                down = bins < prev_bins
+                n_fluxed = np.cumsum(
+                        np.bincount(bins[down], minlength=n_planes + 1)
+                        - np.bincount(prev_bins[down], minlength=n_planes + 1))
+                fluxes_over_time = _grow_rows(fluxes_over_time, n_rows)
+                # calc dat flux
+                fluxes_over_time[n_rows, order] = (n_fluxed[:n_planes]
+                        / (area * (step - prev_step)))
+                n_rows += 1
             # store current frame
-            prev_water = water
+            prev_bins = bins
             prev_step = step
-    return fluxes_over_time, steps
+            n_frames += 1
+            if checkpoint:
+                checkpoint.update(trj, n_frames, steps=steps,
+                        fluxes_over_time=fluxes_over_time[:n_rows],
+                        n_frames=n_frames, step=step, prev_bins=prev_bins,
+                        prev_step=prev_step)
+    return fluxes_over_time[:n_rows], steps
 
 
-def calc_density(file_name, system_info, group, masses, axis, planes,
-        area, max_frames=np.inf):
-    """Calculate density along a specified axis.
+# one record of a flux event log
+FLUX_EVENT_DTYPE = np.dtype([('frame', '<i4'),
+                             ('molecule', '<i4'),
+                             ('plane', '<i2'),
+                             ('direction', 'i1')])
+
+
+def _molecule_ids(n_atoms, molecules):
+    """Molecule index of every atom, see calc_bidirectional_flux."""
+    if molecules is None:
+        return np.arange(n_atoms)
+    if np.isscalar(molecules):
+        assert n_atoms % molecules == 0, 'Atoms do not split into molecules'
+        return np.arange(n_atoms) // molecules
+    assert len(molecules) == n_atoms
+    return np.unique(molecules, return_inverse=True)[1]
+
+
+def _plane_levels(z, planes, length):
+    """Number of plane images below each z, as a (len(z), len(planes)) array.
+
+    Without a period the level is 1 above a plane and 0 below it.
+    """
+    if length is None:
+        return (z[:, np.newaxis] > planes).astype(np.int64)
+    return np.floor((z[:, np.newaxis] - planes) / length).astype(np.int64)
+
+
+def calc_bidirectional_flux(file_name, system_info, planes, area,
+        group='water', molecules=None, periodic=True, event_log=None,
+        max_time=np.inf, checkpoint=None, resume=False):
+    """Calculate fluxes in both directions across multiple x-y planes.
+
+    Atom z-coordinates are unwrapped between frames, so atoms leaving
+    through one side of the box do not count as crossing every plane. Atoms
+    are grouped into molecules whose centers of geometry are tracked. A
+    molecule that passes a plane, or several periodic images of it, between
+    two frames contributes one crossing per plane image.
+
+    Args:
+        file_name (str): name of trajectory to read
+        system_info (dict): dictionary containing indices of atoms in groups
+        planes (np.ndarray): z-coords of planes to calculate flux through
+        area (float): surface area of planes
+        group (str): key in system_info of the atoms to track
+        molecules: None to track single atoms, an int for consecutive
+            molecules of that many atoms, or a molecule id per atom in group
+        periodic (bool): if True, unwrap z and count plane images
+        event_log (str): if given, write every crossing to this file as
+            FLUX_EVENT_DTYPE records, see read_flux_events()
+        checkpoint (Checkpoint or str): periodically save progress here
+        resume (bool): continue from the saved checkpoint if there is one
+    Returns:
+        fluxes_up (np.ndarray): (n_frames - 1, n_planes) fluxes towards +z
+        fluxes_down (np.ndarray): (n_frames - 1, n_planes) fluxes towards -z
+        steps (list): timesteps at which the fluxes were calculated
+    """
+    checkpoint = get_checkpoint(checkpoint)
+    planes = np.asarray(planes, dtype=float)
+    n_planes = len(planes)
+    atoms = system_info[group]
+    mol_ids = _molecule_ids(len(atoms), molecules)
+    n_molecules = mol_ids.max() + 1 if len(mol_ids) else 0
+    atoms_per_molecule = np.bincount(mol_ids, minlength=n_molecules)
+    # first atom of the molecule of each atom
+    reference = np.unique(mol_ids, return_index=True)[1][mol_ids]
+
+    steps = list()
+    # grown by doubling, rows [n_rows:] are unused
+    fluxes_up = np.empty(shape=(1024, n_planes))
+    fluxes_down = np.empty(shape=(1024, n_planes))
+    n_rows = 0
+    n_frames = 0
+    prev_z = None
+    log = None
+    with open(file_name, 'r') as trj:
+        step = -1
+        state = checkpoint.restore(trj) if checkpoint and resume else None
+        if state:
+            steps = state['steps'].tolist()
+            fluxes_up = state['fluxes_up']
+            fluxes_down = state['fluxes_down']
+            n_rows = fluxes_up.shape[0]
+            n_frames = state['n_frames']
+            step = state['step']
+            prev_z = state['prev_z']
+            prev_unwrapped = state['prev_unwrapped']
+            prev_pos = state['prev_pos']
+            prev_step = state['prev_step']
+        if event_log and state:
+            log_size = int(state['log_size'])
+            if os.path.getsize(event_log) < log_size:
+                raise IOError("Event log '{0}' is shorter than recorded in "
+                              "the checkpoint, cannot resume".format(event_log))
+            # drop events logged after the checkpoint
+            log = open(event_log, 'r+b')
+            log.truncate(log_size)
+            log.seek(0, 2)
+        elif event_log:
+            log = open(event_log, 'wb')
+        try:
+            while step < max_time:
+                try:
+                    xyz, _, step, box = read_frame_lammpstrj(trj)
+                except:
+                    print("Reached end of '" + file_name + "'")
+                    break
+
+                z = xyz[atoms][:, 2]
+                length = box.lengths[2] if periodic else None
+                if prev_z is None:
+                    unwrapped = z
+                    if periodic:
+                        # make molecules that straddle the boundary whole
+                        dz = z - z[reference]
+                        unwrapped = z - length * np.round(dz / length)
+                else:
+                    dz = z - prev_z
+                    if periodic:
+                        dz -= length * np.round(dz / length)
+                    unwrapped = prev_unwrapped + dz
+                pos = (np.bincount(mol_ids, weights=unwrapped,
+                                   minlength=n_molecules)
+                       / atoms_per_molecule)
+
+                if prev_z is not None:
+                    steps.append(step)
+                    # both levels use this frame's box length
+                    crossed = (_plane_levels(pos, planes, length)
+                               - _plane_levels(prev_pos, planes, length))
+                    dt = area * (step - prev_step)
+                    fluxes_up = _grow_rows(fluxes_up, n_rows)
+                    fluxes_down = _grow_rows(fluxes_down, n_rows)
+                    up = np.maximum(crossed, 0).sum(axis=0)
+                    down = np.maximum(-crossed, 0).sum(axis=0)
+                    fluxes_up[n_rows] = up / dt
+                    fluxes_down[n_rows] = down / dt
+                    if log:
+                        mol, plane = np.nonzero(crossed)
+                        n_cross = crossed[mol, plane]
+                        repeat = np.abs(n_cross)
+                        events = np.empty(repeat.sum(),
+                                          dtype=FLUX_EVENT_DTYPE)
+                        events['frame'] = n_frames
+                        events['molecule'] = np.repeat(mol, repeat)
+                        events['plane'] = np.repeat(plane, repeat)
+                        events['direction'] = np.repeat(np.sign(n_cross),
+                                                        repeat)
+                        log.write(events.tobytes())
+                    n_rows += 1
+
+                # store current frame
+                prev_z = z
+                prev_unwrapped = unwrapped
+                prev_pos = pos
+                prev_step = step
+                n_frames += 1
+                if checkpoint:
+                    if log and n_frames % checkpoint.every == 0:
+                        # the logged events must be on disk before the
+                        # checkpoint that records the log size
+                        log.flush()
+                        os.fsync(log.fileno())
+                    checkpoint.update(trj, n_frames, steps=steps,
+                            fluxes_up=fluxes_up[:n_rows],
+                            fluxes_down=fluxes_down[:n_rows],
+                            n_frames=n_frames, step=step, prev_z=prev_z,
+                            prev_unwrapped=prev_unwrapped, prev_pos=prev_pos,
+                            prev_step=prev_step,
+                            log_size=log.tell() if log else 0)
+        finally:
+            if log:
+                log.close()
+    return fluxes_up[:n_rows], fluxes_down[:n_rows], steps
+
+
+def read_flux_events(file_name):
+    """Load an event log written by calc_bidirectional_flux().
+
+    Returns:
+        events (np.ndarray): records with fields 'frame', 'molecule', 'plane'
+            and 'direction' (+1 towards +z, -1 towards -z)
+    """
+    return np.fromfile(file_name, dtype=FLUX_EVENT_DTYPE)
+
+
+def count_flux_events(events, n_frames, n_planes):
+    """Count crossings per frame and plane from an event log.
+
+    Args:
+        events (np.ndarray): records as returned by read_flux_events()
+        n_frames (int): number of frames of the trajectory
+        n_planes (int): number of planes
+    Returns:
+        n_up (np.ndarray): (n_frames, n_planes) crossings towards +z
+        n_down (np.ndarray): (n_frames, n_planes) crossings towards -z
+    """
+    flat = events['frame'].astype(np.intp) * n_planes + events['plane']
+    up = events['direction'] > 0
+    n_up = np.bincount(flat[up], minlength=n_frames * n_planes)
+    n_down = np.bincount(flat[~up], minlength=n_frames * n_planes)
+    return (n_up.reshape(n_frames, n_planes),
+            n_down.reshape(n_frames, n_planes))
+
+
+def binned_density(file_name, system_info, groups, masses, axis, planes,
+        area, max_frames=np.inf, type_offset=0):
+    """Calculate densities of several groups in bins along an axis.
+
+    Every frame, the outer planes are moved to the box bounds along 'axis'.
+    Each selected atom is assigned to a bin with one searchsorted call and the
+    masses per bin are summed with a weighted bincount. Atoms exactly on a
+    plane are not counted.
 
     Args:
         file_name (str): name of trajectory to read
         system_info (dict): dictionary containing indices of groups in system
-        group (list): list of keys in system_info
-        masses (dict):  {atom_type: mass}
+        groups (list): list of keys in system_info
+        masses (MassTable): masses of the atom types, a {atom_type: mass}
+            dict or an array indexed by atom_type - type_offset also work
         axis (int): axis along which to calculate density
-        planes (np.ndarray): coords of planes to calculate flux through
+        planes (np.ndarray): coords of the planes bounding the bins
         area (float): area of plane normal to specified axis
         max_frames (int): maximum number of frames to read
+        type_offset (int): offset of the indices of a 'masses' array
     Returns:
-        densities_over_time (np.ndarray): densities along axis over time
+        densities (dict): {group: (n_frames, len(planes) - 1) densities}
     """
-    if max_frames == np.inf:
-        densities_over_time = np.empty(len(planes) - 1)
-    else:
-        densities_over_time = np.empty(shape=(max_frames, len(planes) - 1))
+    masses = as_mass_table(masses, type_offset)
+    planes = np.array(planes, dtype=float)
+    n_bins = len(planes) - 1
 
+    # grown by doubling, rows [n_frames:] are unused
+    densities = np.empty(shape=(1024, len(groups), n_bins))
+    n_frames = 0
     with open(file_name, 'r') as trj:
-        step = -1
-        while step < max_frames - 1:
+        while n_frames < max_frames:
             try:
                 xyz, types, time_step, box = read_frame_lammpstrj(trj)
             except:
-                print "Reached end of '{0}'".format(file_name)
+                print("Reached end of '{0}'".format(file_name))
                 break
-            step += 1
-            print "Read frame #{0}".format(step)
-            planes[0] = box.mins[0]
-            planes[-1] = box.maxs[0]
+            print("Read frame #{0}".format(n_frames))
+            planes[0] = box.mins[axis]
+            planes[-1] = box.maxs[axis]
+            volumes = area * (np.diff(planes))
 
-            # select coords of relevant atoms along specified axis
-            # TODO: multiple groups
-            selected = xyz[system_info[group]][:, axis]
-            selected_types = types[system_info[group]]
+            densities = _grow_rows(densities, n_frames)
+            for k, group in enumerate(groups):
+                # select coords of relevant atoms along specified axis
+                selected = xyz[system_info[group]][:, axis]
+                selected_types = types[system_info[group]]
+
+                # index of the first plane at or above each atom
+                upper = np.searchsorted(planes, selected, side='left')
+                inside = (upper > 0) & (upper <= n_bins)
+                inside[inside] &= planes[upper[inside]] != selected[inside]
+                mass_in_layer = np.bincount(upper[inside] - 1,
+                        weights=masses.masses(selected_types[inside]),
+                        minlength=n_bins)
+                densities[n_frames, k] = mass_in_layer / volumes
+            n_frames += 1
+    return dict((group, densities[:n_frames, k])
+                for k, group in enumerate(groups))
 
-            volumes = area * (np.diff(planes))
 
-            if max_frames == np.inf:
-                temp_masses = np.empty(len(planes) - 1)
-            for i, plane in enumerate(planes[:-1]):
-                # select atoms in layer
-                atoms_in_layer = np.where((selected > plane)
-                                     & (selected < planes[i+1]))[0]
-                types_in_layer = selected_types[atoms_in_layer]
-                # TODO: REMOVE HARDCODED TYPE OFFSET
-                mass_in_layer = np.sum(masses[types_in_layer - 20])
-                if max_frames == np.inf:
-                    temp_masses[i] = mass_in_layer / volumes[i]
-                else:
-                    densities_over_time[step, i] = mass_in_layer / volumes[i]
-            if max_frames == np.inf:
-                densities_over_time = np.hstack((densities_over_time, temp_masses))
-    return densities_over_time
+def calc_density(file_name, system_info, group, masses, axis, planes,
+        area, max_frames=np.inf, type_offset=0):
+    """Calculate density along a specified axis.
 
-def slab_density(file_name, system_info, group, masses, type_offset, axis,
-        planes, area, max_frames=np.inf):
-    """Calculate density in a slab.
+    Args:
+        file_name (str): name of trajectory to read
+        system_info (dict): dictionary containing indices of groups in system
+        group (str): key in system_info
+        masses (MassTable): masses of the atom types, a {atom_type: mass}
+            dict or an array indexed by atom_type - type_offset also work
+        axis (int): axis along which to calculate density
+        planes (np.ndarray): coords of the planes bounding the bins
+        area (float): area of plane normal to specified axis
+        max_frames (int): maximum number of frames to read
+        type_offset (int): offset of the indices of a 'masses' array
+    Returns:
+        densities_over_time (np.ndarray): (n_frames, len(planes) - 1)
+            densities along axis over time
     """
-    with open(file_name, 'r') as trj:
-        step = -1
-        while step < max_frames - 1:
-            try:
-                xyz, types, time_step, box = read_frame_lammpstrj(trj)
-            except:
-                print "Reached end of '{0}'".format(file_name)
-                break
-            step += 1
-            print "Read frame #{0}".format(step)
-            planes[0] = box.mins[0]
-            planes[-1] = box.maxs[0]
+    return binned_density(file_name, system_info, [group], masses, axis,
+            planes, area, max_frames, type_offset)[group]
 
-            # select coords of relevant atoms along specified axis
-            selected = xyz[system_info[group]][:, axis]
-            selected_types = types[system_info[group]]
 
-            volumes = area * (np.diff(planes))
+def slab_density(file_name, system_info, group, masses, type_offset, axis,
+        planes, area, max_frames=np.inf):
+    """Calculate density in a slab.
 
-            if max_frames == np.inf:
-                temp_masses = np.empty(len(planes) - 1)
-            for i, plane in enumerate(planes[:-1]):
-                # select atoms in layer
-                atoms_in_layer = np.where((selected > plane)
-                                     & (selected < planes[i+1]))[0]
-                types_in_layer = selected_types[atoms_in_layer]
-                mass_in_layer = np.sum(masses[types_in_layer - type_offset])
-                if max_frames == np.inf:
-                    temp_masses[i] = mass_in_layer / volumes[i]
-                else:
-                    densities_over_time[step, i] = mass_in_layer / volumes[i]
-            if max_frames == np.inf:
-                densities_over_time = np.hstack((densities_over_time, temp_masses))
-    return densities_over_time
+    Same as calc_density(), see binned_density() for the arguments.
+    """
+    return binned_density(file_name, system_info, [group], masses, axis,
+            planes, area, max_frames, type_offset)[group]
 
 
 def calc_res_time(file_name, system_info, top_bounds, bot_bounds, slab,
-        max_time=np.inf, return_data=False, plot=False):
+        max_time=np.inf, return_data=False, plot=False, checkpoint=None,
+        resume=False):
     """Calculate residence time of water molecules in monolayers.
 
     Args:
@@ -236,14 +644,17 @@ def calc_res_time(file_name, system_info, top_bounds, bot_bounds, slab,
         slab (tuple): bounds of slab containing initial water molecules
         return_data (bool): return time and R(t) values
         plot (bool): optional flag to plot fitted exponential decay
+        checkpoint (Checkpoint or str): periodically save progress here
+        resume (bool): continue from the saved checkpoint if there is one
     Returns:
-        res_time (float): residence time
+        res_time (float): residence time in ps, the time constant of an
+            exponential fit to the fraction remaining
         time (list): simulation times of frames read
         frac_remaining (list): fraction of water remaining in monolayer
 
-    TODO:
-        -multiple slabs simultaneously
+    See residence_correlation() for multiple slabs and time origins.
     """
+    checkpoint = get_checkpoint(checkpoint)
     with open(file_name, 'r') as trj:
         data = list()
         steps = list()
@@ -259,11 +670,19 @@ def calc_res_time(file_name, system_info, top_bounds, bot_bounds, slab,
         bot_bot_slab = bot_bounds[0] + slab[0]
 
         step = -1
+        state = checkpoint.restore(trj) if checkpoint and resume else None
+        if state:
+            data = state['data'].tolist()
+            steps = state['steps'].tolist()
+            step = state['step']
+            n_init = state['n_init']
+            start_in_topslab = state['start_in_topslab']
+            start_in_botslab = state['start_in_botslab']
         while step < max_time:
             try:
                 xyz, _, step, _ = read_frame_lammpstrj(trj)
             except:
-                print "Reached end of '" + file_name + "'"
+                print("Reached end of '" + file_name + "'")
                 break
             steps.append(step)
             if step == 0:
@@ -284,38 +703,183 @@ def calc_res_time(file_name, system_info, top_bounds, bot_bounds, slab,
                 still_in_toplayer = start_in_topslab[current[start_in_topslab] > top_bound]
                 still_in_botlayer = start_in_botslab[current[start_in_botslab] < bot_bound]
                 # count em
-                diff = len(np.intersect1d(start_in_topslab, still_in_toplayer))
-                diff += len(np.intersect1d(start_in_botslab, still_in_botlayer))
-                data.append(diff)
+                data.append(len(still_in_toplayer) + len(still_in_botlayer))
+            if checkpoint:
+                checkpoint.update(trj, len(steps), data=data, steps=steps,
+                        step=step, n_init=n_init,
+                        start_in_topslab=start_in_topslab,
+                        start_in_botslab=start_in_botslab)
     # convert to ps
     time = np.array([x / 1000. for x in steps])
     # normalize by number of atoms
     frac_remaining = np.array([x / n_init for x in data])
 
     # non-linear fit
-    A0 = frac_remaining.max()
-    K0 = -y.max() / t.max()
-    C0 = np.mean(y[int(0.75 * len(y)):])
-
-    guesses = [A0, K0, C0]
-    A, K, C = fit_exp_nonlinear(time, frac_remaining, guesses)
-    res_time = K
+    res_time, (A, K, C) = fit_residence_time(time - time[0], frac_remaining)
 
     if plot:
+        import matplotlib.pyplot as plt
         fig = plt.figure()
         ax = fig.add_subplot(1, 1, 1)
-        fit_y = model_exp(time, A, K, C)
+        fit_y = model_exp(time - time[0], A, K, C)
         plot_fit(ax, time, frac_remaining, fit_y)
         fig.savefig('res_time_exp_fit.pdf', bbox_inches='tight')
 
-    #res_time = sp.integrate.simps(frac_remaining, time)  # integrate RTCF
-
     if return_data:
         return res_time, time, frac_remaining
     else:
         return res_time
 
 
+def model_exp(t, A, K, C):
+    """Exponential decay A * exp(K * t) + C, with K < 0."""
+    return A * np.exp(K * t) + C
+
+
+def fit_exp_nonlinear(t, y, guesses):
+    """Fit model_exp() to y(t) with a robust loss.
+
+    A soft L1 loss keeps the noisy tail of a correlation function from
+    dominating the fit. A is kept non-negative and K negative.
+
+    Args:
+        t (np.ndarray): times
+        y (np.ndarray): values
+        guesses (list): initial [A, K, C]
+    Returns:
+        params (np.ndarray): fitted [A, K, C]
+    """
+    import scipy.optimize
+
+    lower = [0.0, -np.inf, -np.inf]
+    upper = [np.inf, -1e-12, np.inf]
+    guesses = np.clip(guesses, np.add(lower, 1e-12), upper)
+    params, _ = scipy.optimize.curve_fit(model_exp, t, y, p0=guesses,
+            bounds=(lower, upper), loss='soft_l1', maxfev=10000)
+    return params
+
+
+def fit_residence_time(t, y):
+    """Residence time from a survival function y(t) with y(0) ~ 1.
+
+    Fits model_exp() and returns its time constant -1 / K. If the fit fails
+    or does not decay, falls back to the integral of y(t).
+
+    Returns:
+        res_time (float): residence time in the units of t
+        params (tuple): fitted (A, K, C), K = -1 / res_time for the fallback
+    """
+    t = np.asarray(t, dtype=float)
+    y = np.asarray(y, dtype=float)
+    valid = np.isfinite(y)
+    t, y = t[valid], y[valid]
+    guesses = [y.max() - y[-1], -1.0 / max(t.max(), 1e-12),
+               np.mean(y[int(0.75 * len(y)):])]
+    try:
+        A, K, C = fit_exp_nonlinear(t, y, guesses)
+        if np.isfinite(K) and K < 0:
+            return -1.0 / K, (A, K, C)
+    except (RuntimeError, ValueError):
+        pass
+    print('Exponential fit failed, integrating the survival function')
+    res_time = _trapezoid(y, t)
+    return res_time, (1.0, -1.0 / res_time if res_time else -np.inf, 0.0)
+
+
+def plot_fit(ax, t, y, fit_y):
+    """Plot data and a fitted curve."""
+    ax.plot(t, y, 'o', color='blue', label='data')
+    ax.plot(t, fit_y, color='red', linewidth=2, label='fit')
+    ax.set_xlabel('Time (ps)')
+    ax.set_ylabel('Fraction remaining')
+    ax.legend()
+
+
+def residence_correlation(file_name, system_info, slabs, start_slabs=None,
+        group='water', axis=2, max_lag=100, origin_interval=10,
+        continuous=True, max_frames=np.inf):
+    """Calculate survival functions of atoms in many slabs at once.
+
+    A new time origin starts every 'origin_interval' frames. At each origin
+    the atoms in each start slab are marked alive. Every following frame
+    the alive masks of all open origins are ANDed with the slab occupancy,
+    so an atom stops counting the first time it leaves its slab. With
+    continuous=False only the occupancy at the current frame is used, which
+    gives the intermittent correlation. Origins are dropped after 'max_lag'
+    frames. An origin cut off by the end of the trajectory contributes
+    only to the lags it reached.
+
+    Args:
+        file_name (str): name of trajectory to read
+        system_info (dict): dictionary containing indices of atoms in groups
+        slabs (list): (min, max) coords of each slab along 'axis'
+        start_slabs (list): (min, max) of the region of each slab in which
+            atoms have to be at a time origin, defaults to 'slabs'
+        group (str): key in system_info of the atoms to track
+        axis (int): axis normal to the slabs
+        max_lag (int): longest lag in frames
+        origin_interval (int): frames between time origins
+        continuous (bool): if False, atoms may leave and come back
+        max_frames (int): maximum number of frames to read
+    Returns:
+        time (np.ndarray): (max_lag + 1,) lag times in ps
+        survival (np.ndarray): (n_slabs, max_lag + 1) fraction of the atoms
+            of a time origin still in each slab, averaged over origins
+    """
+    slabs = np.asarray(slabs, dtype=float).reshape(-1, 2)
+    if start_slabs is None:
+        start_slabs = slabs
+    start_slabs = np.asarray(start_slabs, dtype=float).reshape(-1, 2)
+    n_slabs = slabs.shape[0]
+    atoms = system_info[group]
+
+    # ring buffer of open time origins
+    n_slots = max_lag // origin_interval + 1
+    alive = np.zeros(shape=(n_slots, n_slabs, len(atoms)), dtype=bool)
+    n_start = np.zeros(shape=(n_slots, n_slabs))
+    origin = np.full(n_slots, -1, dtype=int)
+    survived = np.zeros(shape=(n_slabs, max_lag + 1))
+    started = np.zeros(shape=(n_slabs, max_lag + 1))
+
+    steps = list()
+    n_frames = 0
+    with open(file_name, 'r') as trj:
+        while n_frames < max_frames:
+            try:
+                xyz, _, step, _ = read_frame_lammpstrj(trj)
+            except:
+                print("Reached end of '" + file_name + "'")
+                break
+            if len(steps) < 2:
+                steps.append(step)
+            x = xyz[atoms][:, axis]
+            occupied = ((x > slabs[:, 0:1]) & (x < slabs[:, 1:2]))
+
+            if n_frames % origin_interval == 0:
+                slot = (n_frames // origin_interval) % n_slots
+                alive[slot] = ((x > start_slabs[:, 0:1])
+                               & (x < start_slabs[:, 1:2]))
+                n_start[slot] = alive[slot].sum(axis=1)
+                origin[slot] = n_frames
+            lags = n_frames - origin
+            open_slots = np.where((origin >= 0) & (lags <= max_lag))[0]
+            if continuous:
+                alive[open_slots] &= occupied
+                counts = alive[open_slots].sum(axis=2)
+            else:
+                counts = (alive[open_slots] & occupied).sum(axis=2)
+            # every open origin is at a different lag
+            survived[:, lags[open_slots]] += counts.T
+            started[:, lags[open_slots]] += n_start[open_slots].T
+            n_frames += 1
+
+    dt = (steps[1] - steps[0]) / 1000. if len(steps) == 2 else 0.0
+    time = np.arange(max_lag + 1) * dt
+    with np.errstate(invalid='ignore', divide='ignore'):
+        survival = survived / started
+    return time, survival
+
+
 def find_cutoff(film, heights, plot=False):
     """Find z-coordinates that includes 90% of the points in 'heights'.
 
@@ -349,9 +913,10 @@ def find_cutoff(film, heights, plot=False):
     z_max = heights[i].max()
 
     # fit Rayleigh distribution function
+    import scipy.stats
     z = np.linspace(z_min, z_max, 200)
-    param = sp.stats.rayleigh.fit(heights[i])
-    cdf = sp.stats.rayleigh.cdf(z, loc=param[0], scale=param[1])
+    param = scipy.stats.rayleigh.fit(heights[i])
+    cdf = scipy.stats.rayleigh.cdf(z, loc=param[0], scale=param[1])
 
     # find 90% cutoff value
     idx, val = find_nearest(cdf, cut)
@@ -361,6 +926,7 @@ def find_cutoff(film, heights, plot=False):
         film_bounds = (z_min, z[idx])
 
     if plot:
+        import matplotlib.pyplot as plt
         fig, ax1 = plt.subplots()
         ax1.set_xlabel(u'z (\u00c5)')
         ax1.set_ylabel('Count')
@@ -370,100 +936,96 @@ def find_cutoff(film, heights, plot=False):
         ax2 = ax1.twinx()
         ax2.set_ylabel('Cumulative distribution function')
         ax2.plot(z, cdf, color='blue', linewidth=3)
-        pdf = sp.stats.rayleigh.pdf(z, loc=param[0], scale=param[1])
+        pdf = scipy.stats.rayleigh.pdf(z, loc=param[0], scale=param[1])
         ax2.plot(z, pdf, color='red', linewidth=3)
 
         fig.savefig(film + '_film_thickness.pdf', bbox_inches='tight')
     return film_bounds
 
 
-def voxel_density(file_name, system_info, box, n_grid=[50, 50, 10], z_bounds=[], max_time=np.Inf):
-    """
+# atom masses of the system voxel_density was written for
+DEFAULT_VOXEL_MASSES = {1: 1.008, 2: 14.007, 3: 12.011, 4: 12.011, 5: 1.008,
+                        6: 12.011, 7: 1.008, 8: 15.999, 9: 30.974,
+                        10: 15.990, 11: 12.011, 12: 15.999, 13: 12.011,
+                        14: 15.999, 15: 12.011, 16: 12.011, 17: 1.008,
+                        18: 12.011, 19: 15.999, 20: 1.008, 21: 28.085,
+                        22: 28.085, 23: 15.999, 24: 1.008, 25: 28.085,
+                        26: 15.999, 27: 15.999, 28: 1.008}
+
+
+def voxel_density(file_name, system_info, box, n_grid=[50, 50, 10], z_bounds=[], max_time=np.Inf,
+        checkpoint=None, resume=False, masses=None):
+    """Calculate the time averaged mass density on a voxel grid.
+
+    Atoms are wrapped into each frame's box and binned on an n_grid voxel
+    grid spanning 'box' in x and y and 'z_bounds' in z. Atoms outside
+    'z_bounds' are ignored.
+
+    Args:
+        file_name (str): name of trajectory to read
+        system_info (dict): unused, kept for compatibility
+        box (Box): box spanning the grid in x and y
+        n_grid (list): number of voxels along x, y and z
+        z_bounds (list): (min, max) z-coords of the grid
+        masses (MassTable): masses of the atom types, defaults to
+            DEFAULT_VOXEL_MASSES
+        checkpoint (Checkpoint or str): periodically save progress here
+        resume (bool): continue from the saved checkpoint if there is one
+    Returns:
+        density (np.ndarray): n_grid array of densities in g/cm^3
+        vol_per_voxel (float): volume of a voxel in A^3
     """
+    checkpoint = get_checkpoint(checkpoint)
 
-    count = defaultdict(int)
-    n_frames = 0
-    x_min = box.mins[0]
-    x_max = box.maxs[0]
-    y_min = box.mins[1]
-    y_max = box.maxs[1]
-    z_min = z_bounds[0]
-    z_max = z_bounds[1]
-
-    xs = linspace(x_min, x_max, n_grid[0])
-    ys = linspace(y_min, y_max, n_grid[1])
-    zs = linspace(z_min, z_max, n_grid[2])
-
-    vol = (x_max-x_min) * (y_max-y_min) * (z_max-z_min)
+    n_grid = np.asarray(n_grid, dtype=int)
+    grid_mins = np.array([box.mins[0], box.mins[1], z_bounds[0]], dtype=float)
+    grid_maxs = np.array([box.maxs[0], box.maxs[1], z_bounds[1]], dtype=float)
+    voxel_size = (grid_maxs - grid_mins) / n_grid
+
+    vol = np.prod(grid_maxs - grid_mins)
     vol_per_voxel = vol / np.prod(n_grid)
-    print 'Volume of voxel: {0}'.format(vol_per_voxel)
+    print('Volume of voxel: {0}'.format(vol_per_voxel))
 
     units = 1.660538  # au/ang^3 to g/cm^3
-    mass_per_volume = {1: 1.008 / vol_per_voxel * units,
-            2: 14.007 / vol_per_voxel * units,
-            3: 12.011 / vol_per_voxel * units,
-            4: 12.011 / vol_per_voxel * units,
-            5: 1.008 / vol_per_voxel * units,
-            6: 12.011 / vol_per_voxel * units,
-            7: 1.008 / vol_per_voxel * units,
-            8: 15.999 / vol_per_voxel * units,
-            9: 30.974 / vol_per_voxel * units,
-            10: 15.990 / vol_per_voxel * units,
-            11: 12.011 / vol_per_voxel * units,
-            12: 15.999 / vol_per_voxel * units,
-            13: 12.011 / vol_per_voxel * units,
-            14: 15.999 / vol_per_voxel * units,
-            15: 12.011 / vol_per_voxel * units,
-            16: 12.011 / vol_per_voxel * units,
-            17: 1.008 / vol_per_voxel * units,
-            18: 12.011 / vol_per_voxel * units,
-            19: 15.999 / vol_per_voxel * units,
-            20: 1.008 / vol_per_voxel * units,
-            21: 28.085 / vol_per_voxel * units,
-            22: 28.085 / vol_per_voxel * units,
-            23: 15.999 / vol_per_voxel * units,
-            24: 1.008 / vol_per_voxel * units,
-            25: 28.085 / vol_per_voxel * units,
-            26: 15.999 / vol_per_voxel * units,
-            27: 15.999 / vol_per_voxel * units,
-            28: 1.008 / vol_per_voxel * units}
+    if masses is None:
+        masses = MassTable(DEFAULT_VOXEL_MASSES)
+    masses = as_mass_table(masses)
 
+    count = np.zeros(np.prod(n_grid))
+    n_frames = 0
     with open(file_name, 'r') as trj:
         step = -np.Inf
+        state = checkpoint.restore(trj) if checkpoint and resume else None
+        if state:
+            n_frames = state['n_frames']
+            count = state['count']
         while step < max_time:
             try:
-                xyz, types, _, box = read_frame_lammpstrj(trj)
+                xyz, types, _, frame_box = read_frame_lammpstrj(trj)
             except:
-                print "Reached end of '" + file_name + "'"
+                print("Reached end of '" + file_name + "'")
                 break
             n_frames += 1
 
-            #all_water = xyz[system_info['water']]
-            #water_ids = np.where((all_water[:, 2] > z_min) & (all_water[:, 2] < z_max))
-            #water = all_water[water_ids]
-            bounded_ids = np.where((xyz[:, 2] > z_min) & (xyz[:, 2] < z_max))
-            bounded_atoms = xyz[bounded_ids]
+            bounded = (xyz[:, 2] > z_bounds[0]) & (xyz[:, 2] < z_bounds[1])
+            bounded_atoms = xyz[bounded]
+            bounded_types = types[bounded]
 
-            #all_water_types = types[system_info['water']]
-            #water_types = all_water_types[water_ids]
-            bounded_types = types[bounded_ids]
+            # wrap coords into the box
+            bounded_atoms = frame_box.mins + np.mod(
+                    bounded_atoms - frame_box.mins, frame_box.lengths)
+            idx = np.floor((bounded_atoms - grid_mins) / voxel_size).astype(int)
+            np.clip(idx, 0, n_grid - 1, out=idx)
+            flat = np.ravel_multi_index(idx.T, n_grid)
 
-            for atom, a_type in zip(bounded_atoms, bounded_types):
-                # wrap coord if necessary
-                for k, c in enumerate(atom):
-                    if c < box.dims[k, 0]:
-                        atom[k] = box.dims[k, 1] - abs(box.dims[k, 0] - c)
-                    elif c > box.dims[k, 1]:
-                        atom[k] = box.dims[k, 0] + abs(c - box.dims[k, 1])
-                x = np.where(np.histogram([atom[0]], bins=xs)[0] ==  1)[0][0]
-                y = np.where(np.histogram([atom[1]], bins=ys)[0] ==  1)[0][0]
-                z = np.where(np.histogram([atom[2]], bins=zs)[0] ==  1)[0][0]
+            count += np.bincount(flat, weights=masses.masses(bounded_types),
+                                 minlength=count.size)
 
-                count[(x, y, z)] += mass_per_volume[a_type]
+            if checkpoint:
+                checkpoint.update(trj, n_frames, n_frames=n_frames, count=count)
 
-    for voxel, density in count.items():
-        count[voxel] = density / n_frames
-    return count, vol_per_voxel
+    density = count.reshape(n_grid) * (units / vol_per_voxel / n_frames)
+    return density, vol_per_voxel
 
 
 def pore_distribution(file_name,
@@ -488,14 +1050,14 @@ def pore_distribution(file_name,
         counts[group], edges = np.histogram([0], bins=n_bins, range=(bounds[0], bounds[1]))
         counts[group][0] = 0
 
-    print "Reading '" + file_name + "'"
+    print("Reading '" + file_name + "'")
     with open(file_name, 'r') as trj:
         step = -1
         while step < max_time:
             try:
                 xyz, _, step, _ = read_frame_lammpstrj(trj)
             except:
-                print "Reached end of '" + file_name + "'"
+                print("Reached end of '" + file_name + "'")
                 break
 
             for group in groups:
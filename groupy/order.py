@@ -1,5 +1,4 @@
 import numpy as np
-import pdb
 
 
 def calc_director(I):
@@ -0,0 +1,135 @@
+"""Memory-bounded pairwise distance calculations."""
+from __future__ import division
+
+import numpy as np
+
+# default scratch budget for a single tile, in bytes
+DEFAULT_MAX_MEMORY = 64 * 1024 ** 2
+
+# float64 values held per (i, j) pair: 2 x (dx, dy, dz) buffers + distance
+_VALUES_PER_PAIR = 7
+
+
+def tile_shape(n_i, n_j, max_memory=DEFAULT_MAX_MEMORY):
+    """Find the largest (i, j) tile whose scratch buffers fit in max_memory.
+
+    Args:
+        n_i (int): number of points in the first set
+        n_j (int): number of points in the second set
+        max_memory (int): memory budget for the scratch buffers in bytes
+    Returns:
+        block_i (int): number of rows per tile
+        block_j (int): number of columns per tile
+    """
+    max_pairs = max(1, int(max_memory // (8 * _VALUES_PER_PAIR)))
+    block_j = max(1, min(n_j, max_pairs))
+    block_i = max(1, min(n_i, max_pairs // block_j))
+    return block_i, block_j
+
+
+def pairwise_distance_pbc(x0, x1, dimensions, reducer, exclude_self=False,
+        max_memory=DEFAULT_MAX_MEMORY):
+    """Stream minimum image distances between two sets of points into a reducer.
+
+    The (i, j) space is split into tiles sized to fit 'max_memory'. The
+    scratch buffers are allocated once and reused for every tile, so the full
+    distance matrix is never materialized.
+
+    Args:
+        x0 (np.ndarray): (n_i, 3) array of coordinates
+        x1 (np.ndarray): (n_j, 3) array of coordinates
+        dimensions (np.ndarray): box lengths used for the minimum image
+        reducer (callable): called as reducer(d, i_start, j_start) for every
+            tile, where 'd' is a (ni, nj) view into a scratch buffer that is
+            overwritten by the next tile
+        exclude_self (bool): if True, x0 and x1 are the same set of points and
+            the i == j distances are set to np.inf before reduction
+        max_memory (int): memory budget for the scratch buffers in bytes
+    Returns:
+        reducer: the reducer that was passed in
+    """
+    x0 = np.asarray(x0, dtype=np.float64).reshape(-1, 3)
+    x1 = np.asarray(x1, dtype=np.float64).reshape(-1, 3)
+    dimensions = np.asarray(dimensions, dtype=np.float64)
+    n_i = x0.shape[0]
+    n_j = x1.shape[0]
+    if exclude_self:
+        assert n_i == n_j, 'exclude_self requires x0 and x1 to be the same set'
+
+    block_i, block_j = tile_shape(n_i, n_j, max_memory)
+    diff_buf = np.empty(shape=(block_i, block_j, 3))
+    image_buf = np.empty(shape=(block_i, block_j, 3))
+    d_buf = np.empty(shape=(block_i, block_j))
+
+    for i in range(0, n_i, block_i):
+        ni = min(block_i, n_i - i)
+        for j in range(0, n_j, block_j):
+            nj = min(block_j, n_j - j)
+            diff = diff_buf[:ni, :nj]
+            image = image_buf[:ni, :nj]
+            d = d_buf[:ni, :nj]
+
+            np.subtract(x0[i:i + ni, np.newaxis, :],
+                        x1[np.newaxis, j:j + nj, :], out=diff)
+            np.abs(diff, out=diff)
+            np.subtract(dimensions, diff, out=image)
+            np.minimum(diff, image, out=diff)
+            np.multiply(diff, diff, out=diff)
+            np.sum(diff, axis=-1, out=d)
+            np.sqrt(d, out=d)
+
+            if exclude_self and i < j + nj and j < i + ni:
+                # global indices on the diagonal of this tile
+                k = np.arange(max(i, j), min(i + ni, j + nj))
+                d[k - i, k - j] = np.inf
+
+            reducer(d, i, j)
+    return reducer
+
+
+class DistanceHistogram():
+    """Reducer that accumulates a histogram of all pair distances.
+    """
+    def __init__(self, bins=100, r_range=(0.0, 8.0)):
+        self.edges = np.linspace(r_range[0], r_range[1], bins + 1)
+        self.counts = np.zeros(bins, dtype=np.int64)
+        self._bins = bins
+        self._r_min = float(r_range[0])
+        self._scale = bins / float(r_range[1] - r_range[0])
+
+    def __call__(self, d, i_start, j_start):
+        idx = ((d[(d >= self._r_min) & (d < self.edges[-1])] - self._r_min)
+               * self._scale).astype(np.intp)
+        np.minimum(idx, self._bins - 1, out=idx)
+        self.counts += np.bincount(idx, minlength=self._bins)
+
+
+class MinimumDistance():
+    """Reducer that tracks the closest x1 point to each x0 point.
+    """
+    def __init__(self, n_i):
+        self.distance = np.full(n_i, np.inf)
+        self.index = np.full(n_i, -1, dtype=np.intp)
+
+    def __call__(self, d, i_start, j_start):
+        rows = slice(i_start, i_start + d.shape[0])
+        j_min = np.argmin(d, axis=1)
+        d_min = d[np.arange(d.shape[0]), j_min]
+        closer = d_min < self.distance[rows]
+        self.distance[rows] = np.where(closer, d_min, self.distance[rows])
+        self.index[rows] = np.where(closer, j_min + j_start, self.index[rows])
+
+
+class ContactCount():
+    """Reducer that counts x1 points within r_cut of each x0 point.
+    """
+    def __init__(self, n_i, r_cut):
+        self.r_cut = r_cut
+        self.counts = np.zeros(n_i, dtype=np.int64)
+
+    def __call__(self, d, i_start, j_start):
+        self.counts[i_start:i_start + d.shape[0]] += (d < self.r_cut).sum(axis=1)
+
+    @property
+    def total(self):
+        return int(self.counts.sum())
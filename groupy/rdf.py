@@ -1,10 +1,14 @@
-import pdb
+from __future__ import division, print_function
 
+from groupy.checkpoint import get_checkpoint
 from groupy.mdio import *
 from groupy.general import *
+from groupy.pairwise import DEFAULT_MAX_MEMORY, DistanceHistogram, \
+    pairwise_distance_pbc
 
 
-def calc_rdf(file_name, pairs=None, n_bins=100, max_frames=np.inf, opencl=False):
+def calc_rdf(file_name, pairs=None, n_bins=100, max_frames=np.inf, opencl=False,
+        max_memory=DEFAULT_MAX_MEMORY, checkpoint=None, resume=False):
     """Radial distribution function - g(r)
 
     Args:
@@ -12,6 +16,9 @@ def calc_rdf(file_name, pairs=None, n_bins=100, max_frames=np.inf, opencl=False)
         pairs (list): pair of types between which to calculate g(r)
         n_bins (int):
         max_frames (int):
+        max_memory (int): memory budget in bytes for the pair distance tiles
+        checkpoint (Checkpoint or str): periodically save progress here
+        resume (bool): continue from the saved checkpoint if there is one
     Returns:
         r (np.ndarray): radii values corresponding to bins
         g_r (np.ndarray): radial distribution functions at radii, r
@@ -31,20 +38,27 @@ def calc_rdf(file_name, pairs=None, n_bins=100, max_frames=np.inf, opencl=False)
     g_r, edges = np.histogram([0], bins=n_bins, range=r_range)
     g_r[0] = 0
     g_r = g_r.astype(np.float64)
-    total_volume = 0
+    histogram = DistanceHistogram(bins=n_bins, r_range=r_range)
     n_frames = 0
-    rho = 0
+    norm = 0.0
+    checkpoint = get_checkpoint(checkpoint)
 
     with open(file_name, 'r') as trj:
+        state = checkpoint.restore(trj) if checkpoint and resume else None
+        if state:
+            g_r = state['g_r']
+            histogram.counts = state['counts']
+            n_frames = state['n_frames']
+            norm = state['norm']
         while n_frames < max_frames:
             try:
                 xyz, types, _, box = read_frame_lammpstrj(trj)
             except:
-                print "Reach end of '" + file_name + "'"
+                print("Reach end of '" + file_name + "'")
                 break
             n_frames += 1
             n_atoms = xyz.shape[0]
-            print "read " + str(n_frames)
+            print("read " + str(n_frames))
 
             if opencl:
                 for pair in pairs:
@@ -72,59 +86,31 @@ def calc_rdf(file_name, pairs=None, n_bins=100, max_frames=np.inf, opencl=False)
                     g_buf = np.empty(x.shape[0] * x.shape[0], dtype=np.float32)
                     cl.enqueue_read_buffer(queue, g_buf, g).wait()
 
-                    pdb.set_trace()
-
                     temp_g_r, _ = np.histogram(d, bins=n_bins, range=r_range)
                     g_r += temp_g_r
 
-            # TODO: loop over multiple pairs for pure numpy version
             else:
-                #if pairs is None:
-                if pairs is 'asdfa':
-                    # in progress: perform histogram once per frame
-                    d = np.zeros(n_atoms * n_atoms)
-                    for i, xyz_i in enumerate(xyz):
-                        xyz_j = np.vstack([xyz[:i], xyz[i+1:]])
-                        temp_d = calc_distance_pbc(xyz_i, xyz_j, box.length)
-                        start = (n_atoms - 1) * i
-                        stop = (n_atoms - 1) * (i + 1)
-                        d[start:stop] = temp_d
-                    temp_g_r, _ = np.histogram(d, bins=n_bins, range=r_range)
-
-                    g_r += temp_g_r
-                    pdb.set_trace()
-                    if n_frames == 1:
-                        print g_r
-
+                volume = np.prod(box.lengths)
                 # all-all
                 if pairs is None:
-                    for i, xyz_i in enumerate(xyz):
-                        xyz_j = np.vstack([xyz[:i], xyz[i+1:]])
-                        d = calc_distance_pbc(xyz_i, xyz_j, box.length)
-                        temp_g_r, _ = np.histogram(d, bins=n_bins, range=r_range)
-                        g_r += temp_g_r
-
-                # type_i-type_i
-                elif pairs[0] == pairs[1]:
-                    xyz_0 = xyz[types == pairs[0]]
-                    for i, xyz_i in enumerate(xyz_0):
-                        xyz_j = np.vstack([xyz_0[:i], xyz_0[i+1:]])
-                        d = calc_distance_pbc(xyz_i, xyz_j, box.length)
-                        temp_g_r, _ = np.histogram(d, bins=n_bins, range=r_range)
-                        g_r += temp_g_r
-
-                # type_i-type_j
+                    xyz_0 = xyz_1 = xyz
+                # type_i-type_i or type_i-type_j
                 else:
-                    for i, xyz_i in enumerate(xyz[types == pairs[0]]):
-                        xyz_j = xyz[types == pairs[1]]
-                        d = calc_distance_pbc(xyz_i, xyz_j, box.length)
-                        temp_g_r, _ = np.histogram(d, bins=n_bins, range=r_range)
-                        g_r += temp_g_r
-            rho += (i + 1) / box.volume
-
+                    xyz_0 = xyz[types == pairs[0]]
+                    xyz_1 = xyz[types == pairs[1]]
+                same = pairs is None or pairs[0] == pairs[1]
+                pairwise_distance_pbc(xyz_0, xyz_1, box.lengths, histogram,
+                        exclude_self=same, max_memory=max_memory)
+                n_1 = xyz_1.shape[0] - 1 if same else xyz_1.shape[0]
+                norm += xyz_0.shape[0] * n_1 / volume
+
+            if checkpoint:
+                checkpoint.update(trj, n_frames, g_r=g_r,
+                        counts=histogram.counts, n_frames=n_frames, norm=norm)
+
+    if not opencl:
+        g_r += histogram.counts
     r = 0.5 * (edges[1:] + edges[:-1])
     V = 4./3. * np.pi * (np.power(edges[1:], 3) - np.power(edges[:-1], 3))
-    norm = rho * i
     g_r /= norm * V
     return r, g_r
-
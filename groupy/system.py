@@ -4,7 +4,6 @@ import collections
 from copy import deepcopy
 
 import numpy as np
-from scipy.spatial import cKDTree
 
 from groupy.box import *
 from groupy.gbb import Gbb
@@ -218,8 +217,9 @@ class System():
             for i, bond_type in enumerate(gbb.bonds[:, 0]):
                 try:
                     gbb.bonds[i, 0] = convert_bonds[bond_type]
-                except:
-                    pdb.set_trace()
+                except KeyError:
+                    raise KeyError('Bond type {0} is not in the system'.format(
+                        bond_type))
 
             # ...and angles
             gbb.angles[:, 1:] += n_sys_atoms
@@ -257,7 +257,6 @@ class System():
             self.atom_offset = 0
 
         # add offset to each atom that gets printed
-        import pdb
         for gbb in self.gbbs:
             for bond in gbb.bonds:
                 for i, atom in enumerate(bond[:-1]):
@@ -345,6 +344,7 @@ class System():
     def init_atom_kdtree(self):
         """
         """
+        from scipy.spatial import cKDTree
         self.atom_kdtree = cKDTree(self.xyz)
 
     def get_atoms_in_range(self, point, radius, max_items=50):
@@ -0,0 +1,306 @@
+"""Transport properties from trajectories: mean squared displacement,
+velocity autocorrelation and vibrational density of states.
+"""
+from __future__ import division, print_function
+
+import os
+import tempfile
+
+import numpy as np
+
+from groupy.mdio import LammpstrjTrajectory, _read_lammpstrj_frame
+
+# memory used by the FFTs of one chunk of atoms
+DEFAULT_MAX_MEMORY = 2 ** 28
+
+A2_PER_PS_TO_CM2_PER_S = 1e-4
+
+THZ_TO_INV_CM = 33.35641
+
+# numpy 2 renamed trapz to trapezoid
+_trapezoid = getattr(np, 'trapezoid', None) or np.trapz
+
+
+def _open_store(store_name, shape, dtype):
+    """Create a memory-mapped array, in a temporary file if no name is given.
+    """
+    if store_name is None:
+        fd, store_name = tempfile.mkstemp(suffix='.npy')
+        os.close(fd)
+    return np.lib.format.open_memmap(store_name, mode='w+', dtype=dtype,
+                                     shape=shape)
+
+
+def _remove_store(store):
+    """Delete the file of a store made by _open_store()."""
+    os.remove(store.filename)
+
+
+def _chunk_size(n_frames, max_memory):
+    """Number of atoms whose (n_frames, 3) series fit in 'max_memory'.
+
+    The zero padded real FFT of a series takes about 4 float64 copies of it.
+    """
+    return max(1, int(max_memory // (n_frames * 3 * 8 * 4)))
+
+
+def store_positions(file_name, atoms, store_name=None, unwrap=True,
+        max_frames=np.inf, dtype=np.float32):
+    """Write the positions of some atoms in every frame to a memory map.
+
+    Positions are unwrapped by adding up the minimum image displacements
+    between consecutive frames, so atoms may not move more than half a box
+    length between frames. Dumps of unwrapped coordinates (xu, yu, zu) are
+    read with unwrap=False.
+
+    Args:
+        file_name (str): name of lammpstrj trajectory to read
+        atoms (np.ndarray): indices of the atoms to store
+        store_name (str): name of the .npy file, a temporary file by default
+        unwrap (bool): undo the periodic wrapping of the positions
+        max_frames (int): maximum number of frames to read
+        dtype (np.dtype): type of the stored positions
+    Returns:
+        store (np.memmap): (n_frames, n_atoms, 3) positions
+        steps (np.ndarray): (n_frames,) timesteps
+    """
+    atoms = np.asarray(atoms)
+    with LammpstrjTrajectory(file_name) as traj:
+        n_frames = int(min(len(traj), max_frames))
+        store = _open_store(store_name, (n_frames, len(atoms), 3), dtype)
+        steps = np.empty(n_frames, dtype=int)
+        for i in range(n_frames):
+            xyz, _, steps[i], box = traj[i]
+            xyz = xyz[atoms]
+            if unwrap and i > 0:
+                delta = xyz - prev_xyz
+                delta -= box.lengths * np.round(delta / box.lengths)
+                position += delta
+            else:
+                position = xyz.copy()
+            prev_xyz = xyz
+            store[i] = position
+    store.flush()
+    return store, steps
+
+
+def store_velocities(file_name, atoms, store_name=None, max_frames=np.inf,
+        dtype=np.float32):
+    """Write the velocities of some atoms in every frame to a memory map.
+
+    Args:
+        file_name (str): name of lammpstrj trajectory with vx, vy, vz columns
+        atoms (np.ndarray): indices of the atoms to store
+        store_name (str): name of the .npy file, a temporary file by default
+        max_frames (int): maximum number of frames to read
+        dtype (np.dtype): type of the stored velocities
+    Returns:
+        store (np.memmap): (n_frames, n_atoms, 3) velocities
+        steps (np.ndarray): (n_frames,) timesteps
+    """
+    atoms = np.asarray(atoms)
+    with LammpstrjTrajectory(file_name) as traj:
+        offsets = traj.offsets
+    n_frames = int(min(len(offsets), max_frames))
+    store = _open_store(store_name, (n_frames, len(atoms), 3), dtype)
+    steps = np.empty(n_frames, dtype=int)
+    with open(file_name, 'rb') as f:
+        for i in range(n_frames):
+            f.seek(offsets[i])
+            _, _, steps[i], _, vxyz = _read_lammpstrj_frame(
+                f, read_velocities=True)
+            store[i] = vxyz[atoms]
+    store.flush()
+    return store, steps
+
+
+def _autocorrelation_fft(x):
+    """Autocorrelation of many series averaged over all time origins.
+
+    Args:
+        x (np.ndarray): (n_frames, n_atoms, n_dims) series
+    Returns:
+        acf (np.ndarray): (n_frames, n_dims) <x(t0) x(t0 + t)> of each
+            dimension summed over the atoms
+    """
+    n_frames = x.shape[0]
+    remaining = (n_frames - np.arange(n_frames))[:, np.newaxis]
+    n_fft = 2 * n_frames
+    f = np.fft.rfft(x, n=n_fft, axis=0)
+    acf = np.fft.irfft(f * f.conjugate(), n=n_fft, axis=0)[:n_frames]
+    return acf.sum(axis=1) / remaining
+
+
+def _chunked(store, columns, chunk):
+    """Yield (n_frames, chunk, 3) float64 blocks of the atoms in 'columns'."""
+    for start in range(0, len(columns), chunk):
+        part = columns[start:start + chunk]
+        if np.all(np.diff(part) == 1):
+            x = store[:, part[0]:part[-1] + 1]
+        else:
+            x = store[:, part]
+        yield np.asarray(x, dtype=np.float64)
+
+
+def msd_fft(x):
+    """Mean squared displacement of many series with the FFT algorithm.
+
+    Every frame is used as a time origin. With D(t) = |x(t)|^2 the MSD at
+    lag m is S1(m) - 2 S2(m), where S1 follows from cumulative sums of D and
+    S2 is the autocorrelation of x, computed by zero padded FFTs in
+    O(T log T) instead of O(T^2).
+
+    Args:
+        x (np.ndarray): (n_frames, n_atoms, n_dims) positions
+    Returns:
+        msd (np.ndarray): (n_frames, n_dims) MSD of each dimension summed over
+            the atoms
+    """
+    x = np.asarray(x, dtype=np.float64)
+    n_frames = x.shape[0]
+    remaining = (n_frames - np.arange(n_frames))[:, np.newaxis]
+
+    d = (x ** 2).sum(axis=1)
+    front = np.vstack([np.zeros((1, d.shape[1])), np.cumsum(d, axis=0)])
+    back = np.vstack([np.zeros((1, d.shape[1])),
+                      np.cumsum(d[::-1], axis=0)])
+    s1 = (2 * front[-1] - front[:-1] - back[:-1]) / remaining
+    return s1 - 2 * _autocorrelation_fft(x)
+
+
+def calc_msd(file_name, system_info, groups, unwrap=True, max_frames=np.inf,
+        timestep=1.0, store=None, max_memory=DEFAULT_MAX_MEMORY):
+    """Calculate the mean squared displacement of several groups.
+
+    The positions are first written to a memory-mapped store. The MSD of
+    each group is then computed for chunks of atoms that fit in
+    'max_memory', so memory stays bounded for any number of atoms and frames.
+    The MSD is returned per axis, e.g. in-plane is msd[:, 0] + msd[:, 1] and
+    normal is msd[:, 2].
+
+    Args:
+        file_name (str): name of lammpstrj trajectory to read
+        system_info (dict): dictionary containing indices of groups in system
+        groups (list): list of keys in system_info
+        unwrap (bool): undo the periodic wrapping of the positions
+        max_frames (int): maximum number of frames to read
+        timestep (float): MD timestep in fs
+        store (str): name of a .npy file to keep the unwrapped positions in,
+            a temporary file that is removed afterwards by default
+        max_memory (int): bytes used per chunk of atoms
+    Returns:
+        time (np.ndarray): (n_frames,) lag times in ps
+        msd (dict): {group: (n_frames, 3) array} of MSDs in A^2
+    """
+    atoms = np.unique(np.concatenate([system_info[group] for group in groups]))
+    positions, steps = store_positions(file_name, atoms, store_name=store,
+                                       unwrap=unwrap, max_frames=max_frames)
+    n_frames = positions.shape[0]
+    chunk = _chunk_size(n_frames, max_memory)
+
+    msd = dict()
+    for group in groups:
+        columns = np.searchsorted(atoms, system_info[group])
+        total = np.zeros(shape=(n_frames, 3))
+        for x in _chunked(positions, columns, chunk):
+            total += msd_fft(x)
+        msd[group] = total / len(columns)
+
+    if store is None:
+        _remove_store(positions)
+    dt = (steps[1] - steps[0]) * timestep / 1000. if n_frames > 1 else 0.0
+    time = np.arange(n_frames) * dt
+    return time, msd
+
+
+def diffusion_coefficient(time, msd, axes=(0, 1, 2), fit_range=(0.1, 0.5)):
+    """Self-diffusion coefficient from the slope of the MSD.
+
+    Uses the Einstein relation MSD = 2 d D t for the d axes in 'axes',
+    fitted over a fraction of the lag times because short lags are
+    ballistic and long lags have few time origins.
+
+    Args:
+        time (np.ndarray): lag times in ps
+        msd (np.ndarray): (n_frames, 3) MSD per axis in A^2
+        axes (tuple): axes to include, e.g. (0, 1) for in-plane diffusion
+        fit_range (tuple): first and last fraction of the lags to fit
+    Returns:
+        D (float): diffusion coefficient in cm^2/s
+    """
+    n_frames = len(time)
+    first = int(fit_range[0] * n_frames)
+    last = max(first + 2, int(fit_range[1] * n_frames))
+    total = np.asarray(msd)[:, list(axes)].sum(axis=1)
+    slope = np.polyfit(time[first:last], total[first:last], 1)[0]
+    return slope / (2 * len(axes)) * A2_PER_PS_TO_CM2_PER_S
+
+
+def calc_vacf(file_name, system_info, groups, max_frames=np.inf,
+        timestep=1.0, store=None, max_memory=DEFAULT_MAX_MEMORY):
+    """Calculate the velocity autocorrelation function of several groups.
+
+    Velocities are written to a memory-mapped store and correlated over all
+    time origins with FFTs, in chunks of atoms that fit in 'max_memory'.
+
+    Args:
+        file_name (str): name of lammpstrj trajectory with vx, vy, vz columns
+        system_info (dict): dictionary containing indices of groups in system
+        groups (list): list of keys in system_info
+        max_frames (int): maximum number of frames to read
+        timestep (float): MD timestep in fs
+        store (str): name of a .npy file to keep the velocities in, a
+            temporary file that is removed afterwards by default
+        max_memory (int): bytes used per chunk of atoms
+    Returns:
+        time (np.ndarray): (n_frames,) lag times in ps
+        vacf (dict): {group: (n_frames, 3) array} of <v(0) v(t)> per axis
+            in the velocity units of the dump squared
+    """
+    atoms = np.unique(np.concatenate([system_info[group] for group in groups]))
+    velocities, steps = store_velocities(file_name, atoms, store_name=store,
+                                         max_frames=max_frames)
+    n_frames = velocities.shape[0]
+    chunk = _chunk_size(n_frames, max_memory)
+
+    vacf = dict()
+    for group in groups:
+        columns = np.searchsorted(atoms, system_info[group])
+        total = np.zeros(shape=(n_frames, 3))
+        for v in _chunked(velocities, columns, chunk):
+            total += _autocorrelation_fft(v)
+        vacf[group] = total / len(columns)
+
+    if store is None:
+        _remove_store(velocities)
+    dt = (steps[1] - steps[0]) * timestep / 1000. if n_frames > 1 else 0.0
+    time = np.arange(n_frames) * dt
+    return time, vacf
+
+
+def calc_vdos(time, vacf, axes=(0, 1, 2), window=True):
+    """Vibrational density of states from a velocity autocorrelation.
+
+    The VACF is mirrored to negative times, which makes its Fourier
+    transform real, and tapered by half a Hann window so the cut off at the
+    longest lag does not ring.
+
+    Args:
+        time (np.ndarray): evenly spaced lag times in ps
+        vacf (np.ndarray): (n_frames, 3) VACF per axis
+        axes (tuple): axes to include
+        window (bool): taper the VACF before the transform
+    Returns:
+        freq (np.ndarray): frequencies in cm^-1
+        vdos (np.ndarray): density of states normalized to unit area
+    """
+    c = np.asarray(vacf)[:, list(axes)].sum(axis=1)
+    n_frames = len(c)
+    if window:
+        c = c * np.hanning(2 * n_frames - 1)[n_frames - 1:]
+    mirrored = np.concatenate([c, c[-2:0:-1]])
+    dt = time[1] - time[0]
+    vdos = np.fft.rfft(mirrored).real * dt
+    freq = np.fft.rfftfreq(len(mirrored), d=dt) * THZ_TO_INV_CM
+    vdos /= _trapezoid(vdos, freq)
+    return freq, vdos
@@ -1,7 +1,4 @@
 import numpy as np
-import matplotlib.pyplot as plt
-from mpl_toolkits.mplot3d import Axes3D
-import pdb
 
 # type: (color, vdw radius)
 a_info = {'C': ('teal', 1.7),
@@ -31,6 +28,9 @@ a_info_maya = {'C': (2, 1.7),
 def splat(xyz, types=None, direction=None, highlight=None, dims=None):
     """Dump coordinates into 3D plot and show it using matplotlib.
     """
+    import matplotlib.pyplot as plt
+    from mpl_toolkits.mplot3d import Axes3D  # registers the 3d projection
+
     fig = plt.figure()
     ax = fig.add_subplot(111, projection='3d')
 
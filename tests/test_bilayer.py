@@ -0,0 +1,82 @@
+from copy import deepcopy
+
+import numpy as np
+
+from groupy.builders.bilayer import Bilayer, FastBilayer
+from groupy.gbb import Gbb
+
+
+def molecule(xyz, types, masses):
+    gbb = Gbb()
+    gbb.xyz = np.array(xyz, dtype=float)
+    gbb.types = np.array(types)
+    gbb.masses = np.array(masses, dtype=float)
+    gbb.charges = np.zeros(len(types))
+    return gbb
+
+
+def prototypes():
+    head_tail = molecule([[0.1, 0.2, 0.0], [0.0, -0.1, 1.0], [0.2, 0.0, 2.5]],
+                         ['H', 'C', 'T'], [3.0, 1.0, 1.0])
+    bent = molecule([[0.0, 0.0, 0.0], [0.3, 0.1, 1.2]], ['P', 'T'], [2.0, 1.0])
+    water = molecule([[0.0, 0.0, 0.0], [0.1, 0.05, 0.0]], ['O', 'H'],
+                     [16.0, 1.0])
+    lipids = [(head_tail, 0.5, 1.5), (bent, 0.5, 1.0)]
+    return lipids, water
+
+
+def test_fast_bilayer_matches_bilayer():
+    n_x, n_y = 4, 3
+    positions = [[0, 2, 5, 7, 8, 11], [1, 3, 4, 6, 9, 10]]
+    lipids, water = prototypes()
+    slow = Bilayer(deepcopy(lipids), n_x=n_x, n_y=n_y, area_per_lipid=0.6,
+                   solvent=deepcopy(water), solvent_per_lipid=2,
+                   solvent_density=10.0, lipid_positions=positions)
+    fast = FastBilayer(deepcopy(lipids), n_x=n_x, n_y=n_y,
+                       area_per_lipid=0.6, solvent=deepcopy(water),
+                       solvent_per_lipid=2, solvent_density=10.0,
+                       lipid_positions=positions)
+
+    expected = np.vstack([m.xyz for m in slow.molecules])
+    assert fast.xyz.shape == expected.shape
+    assert np.allclose(fast.xyz, expected, rtol=0, atol=1e-12)
+    assert np.array_equal(fast.types,
+                          np.concatenate([m.types for m in slow.molecules]))
+    assert np.array_equal(fast.masses,
+                          np.concatenate([m.masses for m in slow.molecules]))
+    assert np.allclose(fast.box.mins, slow.box.mins)
+    assert np.allclose(fast.box.maxs, slow.box.maxs)
+    assert fast.n_molecules() == len(slow.molecules) == 2 * 12 + 2 * 24
+    assert fast.resids[-1] == len(slow.molecules)
+
+
+def test_fast_bilayer_random_mixing():
+    lipids, water = prototypes()
+    bilayer = FastBilayer(lipids, n_x=5, n_y=4, area_per_lipid=0.6,
+                          solvent=water, solvent_per_lipid=1,
+                          solvent_density=10.0)
+    n_per_layer = 20
+    top = np.vstack([p.positions for p in bilayer.placements[:2]])
+    bottom = np.vstack([p.positions for p in bilayer.placements[2:4]])
+    # every lattice site holds one lipid per leaflet, mirrored leaflets
+    for layer in (top, bottom):
+        assert len(layer) == n_per_layer
+        assert len(np.unique(layer[:, :2], axis=0)) == n_per_layer
+    assert np.array_equal(top, bottom)
+
+    # flipped copies are the prototype rotated by pi about x
+    flipped = bilayer.placements[2]
+    assert np.all(flipped.flip)
+    rotated = flipped.gbb.xyz.copy()
+    rotated = rotated - np.average(rotated, axis=0,
+                                   weights=flipped.gbb.masses)
+    rotated[:, 2] += lipids[0][2]
+    rotated[:, 1:] *= -1
+    start = len(bilayer.placements[0].positions) * 3 + len(
+        bilayer.placements[1].positions) * 2
+    assert np.allclose(bilayer.xyz[start:start + 3],
+                       rotated + flipped.positions[0])
+
+    blocks = np.vstack([xyz.reshape(-1, 3)
+                        for _, xyz in bilayer.iter_blocks(max_atoms=7)])
+    assert np.array_equal(blocks, bilayer.xyz)
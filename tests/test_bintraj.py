@@ -0,0 +1,123 @@
+import struct
+
+import numpy as np
+import pytest
+
+from groupy.bintraj import (DcdTrajectory, DcdWriter, GczTrajectory,
+                            GczWriter, encode_gcz_frame)
+from groupy.box import Box
+
+
+def random_frames(n_frames=5, n_atoms=20, seed=0):
+    rng = np.random.RandomState(seed)
+    return rng.uniform(-20, 20, size=(n_frames, n_atoms, 3))
+
+
+def test_dcd_round_trip(tmpdir):
+    file_name = str(tmpdir.join('traj.dcd'))
+    frames = random_frames()
+    boxes = [Box(lengths=[10.0 + i, 11.0, 12.0]) for i in range(len(frames))]
+    with DcdWriter(file_name, frames.shape[1]) as writer:
+        for i, (xyz, box) in enumerate(zip(frames, boxes)):
+            writer.write_frame(xyz, box=box, step=100 + 20 * i)
+    with DcdTrajectory(file_name) as traj:
+        assert len(traj) == len(frames)
+        assert traj.n_atoms == frames.shape[1]
+        assert np.array_equal(traj[:], frames.astype(np.float32))
+        assert np.array_equal(traj[2], frames[2].astype(np.float32))
+        assert list(traj.timesteps()) == [100, 120, 140, 160, 180]
+        for i, box in enumerate(boxes):
+            assert np.allclose(traj.box(i).lengths, box.lengths)
+
+
+def test_dcd_without_box(tmpdir):
+    file_name = str(tmpdir.join('traj.dcd'))
+    frames = random_frames(n_frames=2)
+    with DcdWriter(file_name, frames.shape[1]) as writer:
+        writer.write_frame(frames[0], box=Box(lengths=[5.0, 5.0, 5.0]))
+        writer.write_frame(frames[1])
+    with DcdTrajectory(file_name) as traj:
+        assert np.allclose(traj.box(0).lengths, 5.0)
+        assert traj.box(1) is None
+
+
+def test_dcd_rejects_4d(tmpdir):
+    file_name = str(tmpdir.join('traj.dcd'))
+    with DcdWriter(file_name, 3) as writer:
+        writer.write_frame(np.zeros(shape=(3, 3)))
+    with open(file_name, 'r+b') as f:
+        f.seek(8 + 4 * 11)  # icntrl[11], the 4D flag
+        f.write(struct.pack('<i', 1))
+    with pytest.raises(NotImplementedError):
+        DcdTrajectory(file_name)
+
+
+def test_gcz_round_trip(tmpdir):
+    file_name = str(tmpdir.join('traj.gcz'))
+    frames = random_frames()
+    with GczWriter(file_name, precision=1000.0) as writer:
+        for i, xyz in enumerate(frames):
+            box = Box(lengths=[40.0, 41.0, 42.0]) if i % 2 == 0 else None
+            writer.write_frame(xyz, step=10 * i, box=box)
+    with GczTrajectory(file_name) as traj:
+        assert len(traj) == len(frames)
+        for i, xyz in enumerate(frames):
+            read_xyz, step, box = traj[i]
+            assert np.allclose(read_xyz, xyz, atol=0.5e-3 + 1e-12)
+            assert np.array_equal(read_xyz, np.round(xyz * 1000) / 1000)
+            assert step == 10 * i
+            if i % 2 == 0:
+                assert np.allclose(box.lengths, [40.0, 41.0, 42.0])
+            else:
+                assert box is None
+
+
+def test_gcz_wide_deltas(tmpdir):
+    # deltas that need 8 byte integers
+    file_name = str(tmpdir.join('traj.gcz'))
+    xyz = np.array([[0.0, 0.0, 0.0], [1e9, -1e9, 5e8], [-1e9, 1e9, 0.0]])
+    with GczWriter(file_name, precision=100.0) as writer:
+        writer.write_frame(xyz, step=7)
+    with GczTrajectory(file_name) as traj:
+        read_xyz, step, box = traj[0]
+    assert np.array_equal(read_xyz, xyz)
+    assert step == 7
+    assert box is None
+
+
+def test_gcz_ignores_truncated_record(tmpdir):
+    file_name = str(tmpdir.join('traj.gcz'))
+    frames = random_frames(n_frames=2)
+    with open(file_name, 'wb') as f:
+        f.write(encode_gcz_frame(frames[0], step=0))
+        f.write(encode_gcz_frame(frames[1], step=1)[:-5])
+    with GczTrajectory(file_name) as traj:
+        assert len(traj) == 1
+
+
+def test_refresh_maps_completed_frames(tmpdir):
+    frames = random_frames(n_frames=3)
+    dcd_file = tmpdir.join('full.dcd')
+    with DcdWriter(str(dcd_file), frames.shape[1]) as writer:
+        for xyz in frames:
+            writer.write_frame(xyz)
+    gcz_file = tmpdir.join('full.gcz')
+    with GczWriter(str(gcz_file)) as writer:
+        for xyz in frames:
+            writer.write_frame(xyz)
+
+    for full, reader in ((dcd_file, DcdTrajectory),
+                         (gcz_file, GczTrajectory)):
+        data = full.read_binary()
+        growing = str(tmpdir.join('growing' + full.ext))
+        # the writer is half way through the file
+        with open(growing, 'wb') as f:
+            f.write(data[:len(data) // 2])
+        with reader(growing) as traj:
+            n_before = len(traj)
+            assert n_before < 3
+            with open(growing, 'ab') as f:
+                f.write(data[len(data) // 2:])
+            assert traj.refresh() == 3 - n_before
+            last = traj[2] if reader is DcdTrajectory else traj[2][0]
+            assert np.allclose(last, frames[2], atol=1e-3)
@@ -0,0 +1,92 @@
+import os
+
+import numpy as np
+
+from groupy.cache import PrototypeCache, cached_parse
+from groupy.gbb import Gbb
+
+EXAMPLE_DATA = os.path.join(os.path.dirname(__file__), '..', 'examples',
+                            'example_inputs', 'data.peg6_0.2')
+
+
+class CountingParser():
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, file_name):
+        self.calls += 1
+        return {'values': np.loadtxt(file_name, ndmin=1)}
+
+
+def test_hit_miss_and_invalidation(tmpdir):
+    source = tmpdir.join('values.txt')
+    source.write('1.0\n2.0\n')
+    cache = PrototypeCache(str(tmpdir.join('cache')))
+    parser = CountingParser()
+
+    first = cache.load(str(source), parser)
+    second = cache.load(str(source), parser)
+    assert (cache.misses, cache.hits, parser.calls) == (1, 1, 1)
+    assert np.array_equal(first['values'], second['values'])
+
+    # other parsers of the same file get their own entry
+    cache.load(str(source), parser, tag='other')
+    assert (cache.misses, parser.calls) == (2, 2)
+
+    source.write('1.0\n2.0\n3.0\n')
+    third = cache.load(str(source), parser)
+    assert (cache.misses, parser.calls) == (3, 3)
+    assert np.array_equal(third['values'], [1.0, 2.0, 3.0])
+
+
+def test_corrupt_entry_is_a_miss(tmpdir):
+    source = tmpdir.join('values.txt')
+    source.write('4.0\n')
+    cache = PrototypeCache(str(tmpdir.join('cache')))
+    parser = CountingParser()
+    with open(cache.entry(str(source)), 'w') as f:
+        f.write('not a zip file')
+    assert np.array_equal(cache.load(str(source), parser)['values'], [4.0])
+    assert (cache.misses, cache.hits) == (1, 0)
+    cache.load(str(source), parser)
+    assert cache.hits == 1
+
+
+def test_least_recently_used_entries_are_evicted(tmpdir):
+    cache = PrototypeCache(str(tmpdir.join('cache')))
+    parser = CountingParser()
+    sources = list()
+    for i in range(3):
+        source = tmpdir.join('values%d.txt' % i)
+        source.write('\n'.join(['%d.0' % i] * 100))
+        sources.append(str(source))
+        cache.load(sources[-1], parser)
+        os.utime(cache.entry(sources[-1]), (1000 + i, 1000 + i))
+    # reading the oldest entry makes it the most recently used
+    cache.load(sources[0], parser)
+    entry_size = os.path.getsize(cache.entry(sources[0]))
+    cache.max_bytes = 2 * entry_size
+    cache.evict()
+    assert os.path.exists(cache.entry(sources[0]))
+    assert not os.path.exists(cache.entry(sources[1]))
+    assert os.path.exists(cache.entry(sources[2]))
+
+    cache.clear()
+    assert cache.entries() == []
+
+
+def test_cached_gbb_matches_uncached(tmpdir):
+    cache = PrototypeCache(str(tmpdir.join('cache')))
+    plain = Gbb()
+    plain.load_lammps_data(EXAMPLE_DATA)
+    for _ in range(2):
+        cached = Gbb()
+        cached.load_lammps_data(EXAMPLE_DATA, cache=cache)
+        for name in ('xyz', 'types', 'masses', 'charges', 'bonds', 'angles',
+                     'dihedrals'):
+            assert np.array_equal(getattr(cached, name), getattr(plain, name))
+        assert cached.bond_types == plain.bond_types
+        assert cached.dihedral_types == plain.dihedral_types
+    assert (cache.misses, cache.hits) == (1, 1)
+    assert cached_parse(EXAMPLE_DATA, None, cache=cache,
+                        tag='lammps_data')['xyz'].shape == (4360, 3)
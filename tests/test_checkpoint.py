@@ -0,0 +1,73 @@
+import numpy as np
+
+from groupy.box import Box
+from groupy.checkpoint import Checkpoint, get_checkpoint
+from groupy.mdio import TrajectoryWriter
+from groupy.monolayers import calc_flux
+from groupy.rdf import calc_rdf
+
+N_FRAMES = 11
+
+
+def write_random_walk(file_name, n_frames, n_atoms=40, seed=0):
+    rng = np.random.RandomState(seed)
+    box = Box(mins=[0, 0, 0], maxs=[8.0, 8.0, 8.0])
+    xyz = rng.uniform(0, 8.0, (n_atoms, 3))
+    types = np.arange(n_atoms) % 2 + 1
+    with TrajectoryWriter(str(file_name)) as writer:
+        for i in range(n_frames):
+            writer.write_frame(xyz % 8.0, types, step=10 * i, box=box)
+            xyz += rng.normal(0, 0.8, xyz.shape)
+
+
+def test_save_and_load(tmpdir):
+    checkpoint = get_checkpoint(str(tmpdir.join('state')))
+    assert checkpoint.file_name.endswith('state.npz')
+    assert checkpoint.load() is None
+    trj = tmpdir.join('trj.txt')
+    trj.write('0123456789')
+    with open(str(trj), 'r') as f:
+        f.read(4)
+        checkpoint.save(f, counts=np.arange(3), norm=2.5)
+    with open(str(trj), 'r') as f:
+        state = checkpoint.restore(f)
+        assert f.read() == '456789'
+    assert np.array_equal(state['counts'], [0, 1, 2])
+    assert state['norm'] == 2.5
+    checkpoint.remove()
+    assert checkpoint.load() is None
+
+
+def interrupted_run(tmpdir, analysis, n_done, every):
+    """Run 'analysis' on the first n_done frames with checkpoints, as if the
+    job were killed there, then resume it on the whole trajectory."""
+    full = tmpdir.join('full.lammpstrj')
+    write_random_walk(full, N_FRAMES)
+    killed = tmpdir.join('killed.lammpstrj')
+    write_random_walk(killed, n_done)
+    checkpoint = Checkpoint(str(tmpdir.join('analysis.ckpt')), every=every)
+    analysis(str(killed), checkpoint=checkpoint)
+    assert checkpoint.load() is not None
+    resumed = analysis(str(full), checkpoint=checkpoint, resume=True)
+    uninterrupted = analysis(str(full))
+    return resumed, uninterrupted
+
+
+def test_calc_flux_resume_is_bit_identical(tmpdir):
+    def flux(file_name, **kwargs):
+        return calc_flux(file_name, {'water': np.arange(40)},
+                         planes=[1.0, 4.0, 6.5], area=64.0, **kwargs)
+    (fluxes, steps), (expected, expected_steps) = interrupted_run(
+        tmpdir, flux, n_done=7, every=3)
+    assert steps == expected_steps
+    assert fluxes.shape == (N_FRAMES - 1, 3)
+    assert np.array_equal(fluxes, expected)
+
+
+def test_calc_rdf_resume_is_bit_identical(tmpdir):
+    def rdf(file_name, **kwargs):
+        return calc_rdf(file_name, pairs=[1, 2], n_bins=20, **kwargs)
+    (r, g_r), (expected_r, expected) = interrupted_run(
+        tmpdir, rdf, n_done=6, every=4)
+    assert np.array_equal(r, expected_r)
+    assert np.array_equal(g_r, expected)
@@ -0,0 +1,59 @@
+import numpy as np
+
+from groupy.bintraj import DcdTrajectory
+from groupy.box import Box
+from groupy.convert import _parse_slice, convert, parse_atoms, select_atoms
+from groupy.mdio import LammpstrjTrajectory, TrajectoryWriter
+
+
+def test_parse_slice_negative_single_index():
+    assert list(range(5)[_parse_slice('-1')]) == [4]
+    assert list(range(5)[_parse_slice('-2')]) == [3]
+    assert list(range(5)[_parse_slice('2')]) == [2]
+    assert list(range(5)[_parse_slice('1:4:2')]) == [1, 3]
+
+
+def test_parse_atoms_negative_single_index():
+    xyz = np.arange(15, dtype=float).reshape(5, 3)
+    types = np.arange(5)
+    _, selected = select_atoms(xyz, types, parse_atoms('-1'))
+    assert list(selected) == [4]
+    _, selected = select_atoms(xyz, types, parse_atoms('0:2,-2:'))
+    assert list(selected) == [0, 1, 3, 4]
+
+
+def test_convert_last_frame(tmpdir):
+    in_file = str(tmpdir.join('in.lammpstrj'))
+    out_file = str(tmpdir.join('out.lammpstrj'))
+    box = Box(mins=[0, 0, 0], maxs=[10, 10, 10])
+    with TrajectoryWriter(in_file) as writer:
+        for step in range(3):
+            writer.write_frame(np.full((4, 3), float(step)),
+                               np.ones(4, dtype=int), step=step, box=box)
+    assert convert(in_file, out_file, frames=_parse_slice('-1'),
+                   atoms=parse_atoms('-1')) == 1
+    with LammpstrjTrajectory(out_file) as traj:
+        assert len(traj) == 1
+        xyz, _, step, _ = traj[0]
+    assert step == 2
+    assert xyz.shape == (1, 3)
+
+
+def test_parallel_dcd_steps_match_serial(tmpdir):
+    in_file = str(tmpdir.join('in.lammpstrj'))
+    box = Box(mins=[0, 0, 0], maxs=[10, 10, 10])
+    with TrajectoryWriter(in_file) as writer:
+        for step in (10, 30, 50):
+            writer.write_frame(np.full((4, 3), step / 10.0),
+                               np.ones(4, dtype=int), step=step, box=box)
+    serial = str(tmpdir.join('serial.dcd'))
+    parallel = str(tmpdir.join('parallel.dcd'))
+    convert(in_file, serial)
+    # every worker gets a single frame
+    convert(in_file, parallel, workers=3)
+    with DcdTrajectory(serial) as a, DcdTrajectory(parallel) as b:
+        assert list(a.timesteps()) == [10, 30, 50]
+        assert list(b.timesteps()) == [10, 30, 50]
+        assert np.array_equal(a[:], b[:])
+    with open(serial, 'rb') as a, open(parallel, 'rb') as b:
+        assert a.read() == b.read()
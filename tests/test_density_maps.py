@@ -0,0 +1,93 @@
+import numpy as np
+import pytest
+
+from groupy.box import Box
+from groupy.density_maps import density_map, load_density_map, \
+    save_density_map
+from groupy.mdio import TrajectoryWriter
+
+UNITS = 1.660538
+TYPE_MASS = {1: 12.011, 2: 15.999}
+
+
+@pytest.fixture
+def trajectory(tmpdir):
+    rng = np.random.RandomState(7)
+    types = rng.randint(1, 3, 150)
+    frames = list()
+    file_name = str(tmpdir.join('map.lammpstrj'))
+    with TrajectoryWriter(file_name) as writer:
+        for step in range(6):
+            box = Box(mins=[0, 0, 0], maxs=[10.0, 8.0 + 0.5 * step, 12.0])
+            xyz = rng.uniform([-2, 0, 0], [12, 8, 12], (150, 3))
+            writer.write_frame(xyz, types, step=step, box=box)
+            frames.append((np.round(xyz, 4), box))
+    return file_name, frames, types
+
+
+def test_planar_map_matches_histogram2d(trajectory):
+    file_name, frames, types = trajectory
+    groups = {'all': np.arange(150), 'half': np.arange(75)}
+    maps, edges = density_map(file_name, groups, ['all', 'half'], kind='xz',
+                              bins=(5, 6), masses=TYPE_MASS)
+    assert np.allclose(edges[0], np.linspace(0, 10, 6))
+    assert np.allclose(edges[1], np.linspace(0, 12, 7))
+    weights = np.array([TYPE_MASS[t] for t in types])
+    for group, atoms in groups.items():
+        total = np.zeros(shape=(5, 6))
+        for xyz, box in frames:
+            wrapped = box.mins + np.mod(xyz - box.mins, box.lengths)
+            hist, _, _ = np.histogram2d(wrapped[atoms, 0], wrapped[atoms, 2],
+                                        bins=edges,
+                                        weights=weights[atoms])
+            total += hist / box.lengths[1]
+        volumes = np.outer(np.diff(edges[0]), np.diff(edges[1]))
+        expected = total * UNITS / volumes / len(frames)
+        assert np.allclose(maps[group], expected, rtol=1e-12, atol=0)
+
+
+def test_cylindrical_map_matches_histogram2d(trajectory):
+    file_name, frames, _ = trajectory
+    center = (5.0, 4.0)
+    ranges = ((0.0, 4.0), (0.0, 12.0))
+    maps, edges = density_map(file_name, {'all': np.arange(150)}, ['all'],
+                              kind='rz', bins=(4, 3), ranges=ranges,
+                              center=center)
+    total = np.zeros(shape=(4, 3))
+    for xyz, box in frames:
+        d = xyz[:, :2] - center
+        d -= box.lengths[:2] * np.round(d / box.lengths[:2])
+        r = np.sqrt((d ** 2).sum(axis=1))
+        hist, _, _ = np.histogram2d(r, xyz[:, 2], bins=edges)
+        total += hist
+    r = edges[0]
+    volumes = np.outer(np.pi * (r[1:] ** 2 - r[:-1] ** 2), np.diff(edges[1]))
+    assert np.allclose(maps['all'], total / volumes / len(frames),
+                       rtol=1e-12, atol=0)
+
+
+def test_parallel_matches_serial(trajectory):
+    file_name, _, _ = trajectory
+    groups = {'all': np.arange(150)}
+    serial, _ = density_map(file_name, groups, ['all'], kind='xy',
+                            masses=TYPE_MASS, max_frames=5)
+    parallel, _ = density_map(file_name, groups, ['all'], kind='xy',
+                              masses=TYPE_MASS, max_frames=5, workers=3)
+    assert np.allclose(parallel['all'], serial['all'], rtol=1e-12, atol=0)
+
+
+def test_save_and_load(tmpdir, trajectory):
+    file_name, _, _ = trajectory
+    maps, edges = density_map(file_name, {'all': np.arange(150)}, ['all'],
+                              kind='yz', bins=(3, 4))
+    saved = str(tmpdir.join('maps.npz'))
+    save_density_map(saved, maps, edges)
+    loaded, loaded_edges = load_density_map(saved)
+    assert list(loaded) == ['all']
+    assert np.array_equal(loaded['all'], maps['all'])
+    assert all(np.array_equal(a, b) for a, b in zip(loaded_edges, edges))
+
+
+def test_unknown_kind(trajectory):
+    with pytest.raises(ValueError):
+        density_map(trajectory[0], {'all': [0]}, ['all'], kind='zz')
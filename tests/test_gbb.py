@@ -0,0 +1,14 @@
+import numpy as np
+import pytest
+
+from groupy.gbb import _parse_xml_block
+
+
+def test_parse_xml_block():
+    bonds = _parse_xml_block('0 0 1\n0 1 2\n', 3, int)
+    assert np.array_equal(bonds, [[0, 0, 1], [0, 1, 2]])
+
+
+def test_parse_xml_block_rejects_named_types():
+    with pytest.raises(ValueError):
+        _parse_xml_block('A 0 1\nB 1 2\n', 3, int)
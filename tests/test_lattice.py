@@ -0,0 +1,113 @@
+import numpy as np
+
+from groupy.box import Box
+from groupy.lattice import Lattice
+
+
+def old_grid_mask_2d(n, m, center='origin', box=None):
+    """The nested loops Lattice.grid_mask_2d was written with."""
+    mask = np.zeros(shape=(n*m, 3), dtype=float)
+    for i in range(n):
+        for j in range(m):
+            mask[i*m + j, 0] = float(i) / float(n) + 0.5/n
+            if center == 'origin':
+                mask[i*m + j, 0] -= 0.5
+            mask[i*m + j, 1] = float(j) / float(m) + 0.5/m
+            if center == 'origin':
+                mask[i*m + j, 1] -= 0.5
+    if box:
+        mask = np.multiply(box.lengths, mask)
+        mask[:] += box.mins - mask.min(axis=0) + np.array(
+            [0.5*box.lengths[0]/float(n), 0.5*box.lengths[1]/float(m), 0.0])
+        mask[:, 2] = 0.0
+    return mask
+
+
+def old_grid_mask_3d(n, m, l, center='origin', box=None):
+    """The nested loops Lattice.grid_mask_3d was written with."""
+    mask = np.zeros(shape=(n*m*l, 3), dtype=float)
+    for i in range(n):
+        for j in range(m):
+            for k in range(l):
+                row = i*m*l + j*l + k
+                mask[row] = [float(i) / n + 0.5/n, float(j) / m + 0.5/m,
+                             float(k) / l + 0.5/l]
+                if center == 'origin':
+                    mask[row] -= 0.5
+    if box:
+        mask = np.multiply(box.lengths, mask)
+        mask[:] += box.mins - mask.min(axis=0) + 0.5 * np.asarray(
+            box.lengths) / np.array([n, m, l], dtype=float)
+    return mask
+
+
+def min_image_distances(points, lengths):
+    d = np.abs(points[:, np.newaxis, :] - points[np.newaxis, :, :])
+    d = np.minimum(d, lengths - d)
+    dist = np.sqrt((d ** 2).sum(axis=-1))
+    return dist[np.triu_indices(len(points), 1)]
+
+
+def test_grid_mask_2d_matches_loops():
+    box = Box(lengths=np.array([12.0, 7.0, 3.0]))
+    for center in ('origin', 'corner'):
+        for b in (None, box):
+            lattice = Lattice()
+            lattice.grid_mask_2d(5, 4, center=center, box=b)
+            assert np.allclose(lattice.points,
+                               old_grid_mask_2d(5, 4, center, b),
+                               rtol=0, atol=1e-12)
+
+
+def test_grid_mask_3d_matches_loops():
+    box = Box(mins=np.array([1.0, -2.0, 0.5]), maxs=np.array([9.0, 4.0, 3.5]))
+    for center in ('origin', 'corner'):
+        for b in (None, box):
+            lattice = Lattice()
+            lattice.grid_mask_3d(3, 4, 5, center=center, box=b)
+            assert np.allclose(lattice.points,
+                               old_grid_mask_3d(3, 4, 5, center, b),
+                               rtol=0, atol=1e-12)
+
+
+def test_hexagonal_mask_2d_is_regular():
+    n, m = 6, 8
+    lengths = np.array([6.0, 6.0 * np.sqrt(3) / 2 * m / n, 1.0])
+    lattice = Lattice()
+    lattice.hexagonal_mask_2d(n, m, box=Box(lengths=lengths))
+    points = lattice.points
+    assert points.shape == (n * m, 3)
+    dist = min_image_distances(points[:, :2], lengths[:2])
+    # every point has six nearest neighbours at the lattice spacing
+    assert np.isclose(dist.min(), 1.0)
+    assert np.sum(np.isclose(dist, 1.0)) == 3 * n * m
+
+
+def test_fcc_mask_3d_is_regular():
+    n = 3
+    lengths = np.array([n * 2.0] * 3)
+    lattice = Lattice()
+    lattice.fcc_mask_3d(n, n, n, box=Box(lengths=lengths))
+    points = lattice.points
+    assert points.shape == (4 * n ** 3, 3)
+    dist = min_image_distances(points, lengths)
+    # twelve nearest neighbours at a / sqrt(2)
+    assert np.isclose(dist.min(), 2.0 / np.sqrt(2))
+    assert np.sum(np.isclose(dist, 2.0 / np.sqrt(2))) == 6 * len(points)
+
+
+def test_rsa_mask_2d_respects_r_min():
+    lengths = np.array([30.0, 20.0, 1.0])
+    box = Box(lengths=lengths)
+    lattice = Lattice()
+    lattice.rsa_mask_2d(150, 1.5, box, random_seed=3)
+    points = lattice.points
+    assert points.shape == (150, 3)
+    assert np.all(points[:, 2] == 0)
+    assert np.all(points[:, :2] >= box.mins[:2])
+    assert np.all(points[:, :2] < box.maxs[:2])
+    assert min_image_distances(points[:, :2], lengths[:2]).min() >= 1.5
+
+    again = Lattice()
+    again.rsa_mask_2d(150, 1.5, box, random_seed=3)
+    assert np.array_equal(points, again.points)
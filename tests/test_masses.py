@@ -0,0 +1,67 @@
+import os
+
+import numpy as np
+import pytest
+
+from groupy.masses import MassTable, as_mass_table
+from groupy.mdio import read_lammps_data
+
+EXAMPLE_DATA = os.path.join(os.path.dirname(__file__), '..', 'examples',
+                            'example_inputs', 'data.peg6_0.2')
+
+
+def test_integer_types_match_dict_lookup():
+    type_mass = {1: 12.011, 2: 1.008, 5: 15.999}
+    table = MassTable(type_mass)
+    types = np.random.RandomState(0).choice([1, 2, 5], 1000)
+    assert np.array_equal(table.masses(types),
+                          [type_mass[t] for t in types])
+    assert table[5] == 15.999
+    assert len(table) == 3
+
+
+def test_named_types_match_dict_lookup():
+    type_mass = {'C': 12.011, 'H': 1.008, 'OW': 15.999}
+    table = MassTable(type_mass)
+    assert table.lookup is None
+    types = np.array(['H', 'OW', 'C', 'H'])
+    assert np.array_equal(table.masses(types),
+                          [type_mass[t] for t in types])
+
+
+@pytest.mark.parametrize('types', [[1, 3], [1, 9], [-1], [0]])
+def test_missing_integer_type_raises(types):
+    table = MassTable({1: 1.0, 2: 2.0})
+    with pytest.raises(KeyError):
+        table.masses(np.array(types))
+
+
+def test_missing_named_type_raises():
+    table = MassTable({'C': 12.011, 'H': 1.008})
+    for types in (['C', 'N'], ['A'], ['Z']):
+        with pytest.raises(KeyError):
+            table.masses(np.array(types))
+
+
+def test_update_and_load_types():
+    table = MassTable({1: 1.0})
+    table.update({1: 2.0, 3: 3.0})
+    assert np.array_equal(table.masses(np.array([1, 3])), [2.0, 3.0])
+    table.load_types([4, 4, 6], [4.0, 4.0, 6.0])
+    assert np.array_equal(table.masses(np.array([6, 4, 1])), [6.0, 4.0, 2.0])
+
+
+def test_load_lammps_data():
+    table = MassTable()
+    table.load_lammps_data(EXAMPLE_DATA)
+    data, _ = read_lammps_data(EXAMPLE_DATA)
+    assert np.array_equal(table.masses(data['types']), data['masses'])
+
+
+def test_as_mass_table():
+    table = MassTable({1: 1.0})
+    assert as_mass_table(table) is table
+    assert as_mass_table({2: 4.0})[2] == 4.0
+    # array indexed by type - offset
+    from_array = as_mass_table([12.0, 1.0], type_offset=1)
+    assert np.array_equal(from_array.masses(np.array([2, 1])), [1.0, 12.0])
@@ -0,0 +1,354 @@
+import io
+import os
+
+import numpy as np
+import pytest
+
+from groupy.box import Box
+from groupy.gbb import Gbb
+from groupy.mdio import GroTrajectory, LammpstrjTrajectory, XyzTrajectory, \
+    _format_lammpstrj_frame, _format_rows, follow, read_gro, \
+    read_lammps_data, read_xyz, write_gro, write_lammpsdata_stream, write_pdb
+
+
+def test_format_rows():
+    text = _format_rows('%d %.1f\n', [[1, 2], np.array([0.5, 1.5])])
+    assert text == '1 0.5\n2 1.5\n'
+
+
+def test_format_rows_rejects_ragged_columns():
+    with pytest.raises(ValueError):
+        _format_rows('%d %d\n', [[1, 2], [1]])
+
+
+def test_write_gro_without_resids(tmpdir):
+    gbb = Gbb()
+    gbb.xyz = np.zeros(shape=(2, 3))
+    gbb.types = np.array([b'C', b'C'])
+    gbb.resnames = np.array([b'RES', b'RES'])
+    gbb.vel = np.zeros(shape=(2, 3))
+    box = np.array([[0, 1], [0, 1], [0, 1]], dtype=float)
+    grofile = str(tmpdir.join('system.gro'))
+    with pytest.raises(ValueError):
+        write_gro(gbb, box, grofile=grofile)
+    assert not os.path.exists(grofile)
+
+
+def test_write_pdb_without_resids(tmpdir):
+    gbb = Gbb()
+    gbb.xyz = np.zeros(shape=(2, 3))
+    gbb.types = np.array(['C', 'H'])
+    gbb.resnames = np.array(['RES', 'RES'])
+    box = np.zeros(shape=(3, 2))
+    pdbfile = str(tmpdir.join('out.pdb'))
+    with pytest.raises(ValueError):
+        write_pdb(gbb, box, pdbfile=pdbfile)
+    assert not os.path.exists(pdbfile)
+
+
+DATA_FILE = """LAMMPS data file with optional and unknown sections
+
+3 atoms
+2 bonds
+1 angles
+
+2 atom types
+1 bond types
+1 angle types
+
+0.0 10.0 xlo xhi
+-5.0 5.0 ylo yhi
+0.0 20.0 zlo zhi
+
+Masses
+
+1 12.011
+2 1.008
+
+Pair Coeffs # lj/cut
+
+1 0.066 3.5
+2 0.030 2.5
+
+PairIJ Coeffs # lj/cut
+
+1 1 0.066 3.5
+1 2 0.044 3.0
+2 2 0.030 2.5
+
+Bond Coeffs # harmonic
+
+1 340.0 1.09
+
+BondBond Coeffs
+
+1 0.0 1.09 1.09
+
+Atoms # full
+
+3 1 2 0.06 1.0 2.0 3.0
+1 1 1 -0.18 0.0 0.0 0.0
+2 1 2 0.06 1.0 0.0 0.0
+
+Velocities
+
+1 0.1 0.0 0.0
+2 0.0 0.1 0.0
+3 0.0 0.0 0.1
+
+Ellipsoids
+
+1 1.0 1.0 1.0
+
+Bonds
+
+2 1 1 3
+1 1 1 2
+
+Angles
+
+1 1 2 1 3
+"""
+
+
+def test_read_lammps_data_skips_unknown_sections(tmpdir):
+    data_file = tmpdir.join('system.data')
+    data_file.write(DATA_FILE)
+    data, box = read_lammps_data(str(data_file))
+    assert np.array_equal(data['types'], [1, 2, 2])
+    assert np.allclose(data['charges'], [-0.18, 0.06, 0.06])
+    assert np.allclose(data['xyz'], [[0, 0, 0], [1, 0, 0], [1, 2, 3]])
+    assert np.allclose(data['masses'], [12.011, 1.008, 1.008])
+    assert np.array_equal(data['bonds'], [[1, 1, 2], [1, 1, 3]])
+    assert np.array_equal(data['angles'], [[1, 2, 1, 3]])
+    assert data['pair_types'] == {1: (0.066, 3.5), 2: (0.030, 2.5)}
+    assert data['bond_types'] == {1: [340.0, 1.09]}
+    assert np.allclose(box.mins, [0, -5, 0])
+    assert np.allclose(box.maxs, [10, 5, 20])
+
+
+def test_read_lammps_data_example():
+    data_file = os.path.join(os.path.dirname(__file__), '..', 'examples',
+                             'example_inputs', 'data.peg6_0.2')
+    data, box = read_lammps_data(data_file)
+    assert data['xyz'].shape == (4360, 3)
+    assert data['bonds'].shape == (5360, 3)
+    assert data['angles'].shape == (9540, 4)
+    assert data['dihedrals'].shape == (1680, 5)
+    assert len(data['bond_types']) <= 16
+    assert not np.isnan(data['masses']).any()
+    assert np.allclose(box.maxs, [47.6892, 41.3, 68])
+
+
+def test_write_lammpsdata_stream_round_trip(tmpdir):
+    chain = Gbb()
+    chain.xyz = np.array([[0, 0, 0], [1, 0, 0], [1, 1, 0]], dtype=float)
+    chain.types = np.array([1, 2, 2])
+    chain.masses = np.array([12.011, 1.008, 1.008])
+    chain.charges = np.array([-0.2, 0.1, 0.1])
+    chain.bonds = np.array([[1, 0, 1], [1, 0, 2]])
+    chain.angles = np.array([[1, 1, 0, 2]])
+    pair = Gbb()
+    pair.xyz = np.array([[0, 0, 0], [0, 0, 1]], dtype=float)
+    pair.types = np.array([4, 4])
+    pair.masses = np.array([16.0, 16.0])
+    pair.charges = np.zeros(2)
+    pair.bonds = np.array([[2, 0, 1]])
+    prototypes = [(chain, 5), (pair, 3)]
+    shifts = np.arange(8)[:, np.newaxis] * [2.0, 0.5, 0.25]
+    blocks = [(0, chain.xyz + shifts[0:2, np.newaxis]),
+              (0, chain.xyz + shifts[2:5, np.newaxis]),
+              (1, pair.xyz + shifts[5:8, np.newaxis])]
+    box = Box(mins=[-1, -1, -1], maxs=[20, 10, 10])
+    data_file = str(tmpdir.join('stream.data'))
+    write_lammpsdata_stream(prototypes, blocks, box, filename=data_file,
+                            chunk_size=4)
+
+    # the same system molecule by molecule
+    xyz, types, charges, bonds, angles = [], [], [], [], []
+    offset = 0
+    for k in range(8):
+        gbb = chain if k < 5 else pair
+        xyz.extend(gbb.xyz + shifts[k])
+        types.extend(gbb.types)
+        charges.extend(gbb.charges)
+        for bond in gbb.bonds:
+            bonds.append([bond[0], bond[1] + offset + 1, bond[2] + offset + 1])
+        for angle in getattr(gbb, 'angles', []):
+            angles.append([angle[0]] + [a + offset + 1 for a in angle[1:]])
+        offset += len(gbb.xyz)
+
+    data, data_box = read_lammps_data(data_file)
+    assert np.allclose(data['xyz'], xyz, atol=1e-5)
+    assert np.array_equal(data['types'], types)
+    assert np.allclose(data['charges'], charges)
+    assert np.array_equal(data['bonds'], bonds)
+    assert np.array_equal(data['angles'], angles)
+    assert np.allclose(data['masses'],
+                       [{1: 12.011, 2: 1.008, 4: 16.0}[t] for t in types])
+    assert np.allclose(data_box.mins, box.mins)
+    assert np.allclose(data_box.maxs, box.maxs)
+
+
+def test_write_lammpsdata_stream_checks_order(tmpdir):
+    gbb = Gbb()
+    gbb.xyz = np.zeros(shape=(1, 3))
+    gbb.types = np.array([1])
+    gbb.masses = np.array([1.0])
+    gbb.charges = np.zeros(1)
+    blocks = [(1, np.zeros(shape=(1, 1, 3))), (0, np.zeros(shape=(1, 1, 3)))]
+    with pytest.raises(AssertionError):
+        write_lammpsdata_stream([(gbb, 1), (gbb, 1)], blocks,
+                                Box(lengths=[1, 1, 1]),
+                                filename=str(tmpdir.join('bad.data')))
+
+
+def old_read_xyz_frame(f):
+    """The line by line xyz parser XyzTrajectory replaced."""
+    n_atoms = int(f.readline())
+    f.readline()
+    xyz = np.empty(shape=(n_atoms, 3))
+    types = np.empty(shape=(n_atoms), dtype='object')
+    for i in range(n_atoms):
+        temp = f.readline().split()
+        types[i] = temp[0]
+        xyz[i] = [float(x) for x in temp[1:4]]
+    return xyz, types
+
+
+def old_read_gro_frame(f):
+    """The line by line gro parser GroTrajectory replaced, in float64."""
+    f.readline()
+    n_atoms = int(f.readline())
+    resids = np.empty(shape=(n_atoms), dtype='u4')
+    resnames = np.empty(shape=(n_atoms), dtype='a5')
+    types = np.empty(shape=(n_atoms), dtype='a5')
+    xyz = np.empty(shape=(n_atoms, 3))
+    vel = np.zeros(shape=(n_atoms, 3))
+    for i in range(n_atoms):
+        line = f.readline()
+        resids[i] = int(line[:5])
+        resnames[i] = line[5:10].strip()
+        types[i] = line[10:15].strip()
+        xyz[i] = [float(line[20 + 8 * k:28 + 8 * k]) for k in range(3)]
+        try:
+            vel[i] = [float(line[44 + 8 * k:52 + 8 * k]) for k in range(3)]
+        except ValueError:
+            pass
+    box = np.zeros(shape=(3, 2))
+    line = list(map(float, f.readline().split()))
+    if len(line) == 3:
+        box[:, 1] = line
+    return resids, resnames, types, xyz, vel, box
+
+
+def xyz_text(n_frames, n_atoms, seed=0):
+    rng = np.random.RandomState(seed)
+    frames = list()
+    for i in range(n_frames):
+        lines = ['%d' % n_atoms, 'frame %d' % i]
+        for j in range(n_atoms):
+            x, y, z = rng.uniform(-9, 9, 3)
+            lines.append('%s %.5f %.5f %.5f' % (('C', 'OW', 'H')[j % 3],
+                                                x, y, z))
+        frames.append('\n'.join(lines) + '\n')
+    return frames
+
+
+def gro_text(n_frames, n_atoms, seed=0):
+    rng = np.random.RandomState(seed)
+    frames = list()
+    for i in range(n_frames):
+        lines = ['frame %d' % i, '%d' % n_atoms]
+        for j in range(n_atoms):
+            line = '%5d%-5s%5s%5d%8.3f%8.3f%8.3f' % (
+                (j // 3 + 1, 'SOL', ('OW', 'HW1', 'HW2')[j % 3], j + 1)
+                + tuple(rng.uniform(0, 5, 3)))
+            if i % 2:
+                line += '%8.4f%8.4f%8.4f' % tuple(rng.uniform(-1, 1, 3))
+            lines.append(line)
+        lines.append('%10.5f%10.5f%10.5f' % (5, 5, 5))
+        frames.append('\n'.join(lines) + '\n')
+    return frames
+
+
+def test_xyz_trajectory_matches_old_parser(tmpdir):
+    frames = xyz_text(5, 7)
+    traj_file = tmpdir.join('traj.xyz')
+    traj_file.write(''.join(frames))
+    expected = [old_read_xyz_frame(io.StringIO(frame)) for frame in frames]
+    with XyzTrajectory(str(traj_file)) as traj:
+        assert len(traj) == 5
+        for (xyz, types), (old_xyz, old_types) in zip(traj, expected):
+            assert np.array_equal(xyz, old_xyz)
+            assert np.array_equal(types, old_types)
+        assert np.array_equal(traj[-1][0], expected[-1][0])
+        odd = traj[1::2]
+        assert len(odd) == 2
+        assert np.array_equal(odd[1][0], expected[3][0])
+    xyz, types = read_xyz(str(traj_file))
+    assert np.array_equal(xyz, expected[0][0])
+
+
+def test_gro_trajectory_matches_old_parser(tmpdir):
+    frames = gro_text(4, 6)
+    traj_file = tmpdir.join('traj.gro')
+    traj_file.write(''.join(frames))
+    expected = [old_read_gro_frame(io.StringIO(frame)) for frame in frames]
+    with GroTrajectory(str(traj_file)) as traj:
+        assert len(traj) == 4
+        for frame, old_frame in zip(traj, expected):
+            for field, old_field in zip(frame, old_frame):
+                assert np.array_equal(field, old_field)
+        # odd frames carry velocities
+        assert np.any(traj[1][4]) and not np.any(traj[2][4])
+    frame = read_gro(str(traj_file))
+    assert np.array_equal(frame[3], expected[0][3])
+
+
+def test_indexed_trajectory_skips_incomplete_frame(tmpdir):
+    frames = xyz_text(3, 4)
+    traj_file = tmpdir.join('traj.xyz')
+    # the last frame is still being written
+    traj_file.write(''.join(frames[:2]) + frames[2][:-12])
+    with XyzTrajectory(str(traj_file)) as traj:
+        assert len(traj) == 2
+
+
+def lammpstrj_frames(n_frames, n_atoms=5):
+    rng = np.random.RandomState(1)
+    box = Box(mins=[0, 0, 0], maxs=[10, 10, 10])
+    return [_format_lammpstrj_frame(rng.uniform(0, 10, (n_atoms, 3)),
+                                    np.ones(n_atoms, dtype=int), 10 * i, box)
+            for i in range(n_frames)]
+
+
+def test_refresh_indexes_new_frames_only(tmpdir):
+    frames = lammpstrj_frames(4)
+    traj_file = tmpdir.join('dump.lammpstrj')
+    traj_file.write(frames[0] + frames[1][:40])
+    with LammpstrjTrajectory(str(traj_file)) as traj:
+        assert len(traj) == 1
+        assert traj.refresh() == 0
+        traj_file.write(frames[1][40:] + frames[2], mode='a')
+        assert traj.refresh() == 2
+        assert [traj[i][2] for i in range(len(traj))] == [0, 10, 20]
+        offsets = list(traj.offsets)
+    traj_file.write(frames[3], mode='a')
+    # resuming from saved offsets gives the same index as a full scan
+    with LammpstrjTrajectory(str(traj_file), offsets=offsets) as resumed:
+        with LammpstrjTrajectory(str(traj_file)) as scanned:
+            assert resumed.offsets == scanned.offsets
+            assert len(resumed) == 4
+
+
+def test_follow_yields_frames_as_they_complete(tmpdir):
+    frames = lammpstrj_frames(3)
+    traj_file = tmpdir.join('dump.lammpstrj')
+    traj_file.write(frames[0] + frames[1][:-3])
+    with LammpstrjTrajectory(str(traj_file)) as traj:
+        followed = follow(traj, poll_interval=0.01, timeout=0.05)
+        assert next(followed)[2] == 0
+        traj_file.write(frames[1][-3:] + frames[2], mode='a')
+        steps = [frame[2] for frame in followed]
+    assert steps == [10, 20]
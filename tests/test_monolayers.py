@@ -0,0 +1,318 @@
+import numpy as np
+import pytest
+
+from groupy.box import Box
+from groupy.checkpoint import Checkpoint
+from groupy.masses import MassTable
+from groupy.mdio import TrajectoryWriter, read_frame_lammpstrj
+from groupy.monolayers import _rayleigh_quantile, binned_density, \
+    binned_vel_profile, calc_bidirectional_flux, calc_density, calc_flux, \
+    calc_vel_profile, film_heights, fit_residence_time, \
+    residence_correlation, voxel_density
+
+
+def write_trajectory(file_name, frames, length=10.0):
+    box = Box(mins=[0, 0, 0], maxs=[length, length, length])
+    with TrajectoryWriter(str(file_name)) as writer:
+        for step, z in enumerate(frames):
+            xyz = np.zeros(shape=(len(z), 3))
+            xyz[:, 2] = z
+            writer.write_frame(xyz, np.ones(len(z), dtype=int), step=step,
+                               box=box)
+
+
+def test_molecule_split_across_boundary(tmpdir):
+    # center of geometry moves from 9.9 to 10.2, through no plane image
+    trj = tmpdir.join('split.lammpstrj')
+    write_trajectory(trj, [[9.8, 0.0], [0.1, 0.3]])
+    up, down, _ = calc_bidirectional_flux(str(trj), {'water': [0, 1]},
+                                          planes=[5.0], area=1.0,
+                                          molecules=2)
+    assert up.sum() == 0
+    assert down.sum() == 0
+
+
+def test_molecule_split_across_boundary_crossing(tmpdir):
+    # center of geometry moves from 9.9 to 10.2 through the plane at 10
+    trj = tmpdir.join('split.lammpstrj')
+    write_trajectory(trj, [[9.8, 0.0], [0.1, 0.3]])
+    up, down, _ = calc_bidirectional_flux(str(trj), {'water': [0, 1]},
+                                          planes=[0.0], area=1.0,
+                                          molecules=2)
+    assert up.sum() == 1
+    assert down.sum() == 0
+
+
+def test_resume_refuses_short_event_log(tmpdir):
+    trj = tmpdir.join('flux.lammpstrj')
+    write_trajectory(trj, [[4.0], [6.0], [4.0], [6.0]])
+    log = str(tmpdir.join('events.bin'))
+    checkpoint = Checkpoint(str(tmpdir.join('flux.ckpt')), every=3)
+    calc_bidirectional_flux(str(trj), {'water': [0]}, planes=[5.0], area=1.0,
+                            event_log=log, checkpoint=checkpoint)
+    with open(log, 'r+b') as f:
+        f.truncate(0)
+    with pytest.raises(IOError):
+        calc_bidirectional_flux(str(trj), {'water': [0]}, planes=[5.0],
+                                area=1.0, event_log=log,
+                                checkpoint=checkpoint, resume=True)
+
+
+def old_calc_flux(file_name, system_info, planes, area):
+    """The plane by plane loop calc_flux was written with."""
+    steps = list()
+    fluxes_over_time = np.empty(shape=(0, len(planes)))
+    with open(file_name, 'r') as trj:
+        while True:
+            try:
+                xyz, _, step, _ = read_frame_lammpstrj(trj)
+            except Exception:
+                break
+            water = xyz[system_info['water']][:, 2]
+            if step > 0:
+                steps.append(step)
+                fluxes = np.empty(shape=(1, len(planes)))
+                for i, plane in enumerate(planes):
+                    were_above = np.where(prev_water > plane)[0]
+                    are_above = np.where(water > plane)[0]
+                    n_fluxed = (len(were_above) -
+                                len(np.intersect1d(are_above, were_above)))
+                    fluxes[0, i] = n_fluxed / (area * (step - prev_step))
+                fluxes_over_time = np.vstack((fluxes_over_time, fluxes))
+            prev_water = water
+            prev_step = step
+    return fluxes_over_time, steps
+
+
+def test_calc_flux_matches_plane_loop(tmpdir):
+    rng = np.random.RandomState(4)
+    # coarse coordinates so that atoms also sit exactly on planes
+    frames = np.round(rng.uniform(0, 10, (12, 60)), 1)
+    trj = tmpdir.join('flux.lammpstrj')
+    write_trajectory(trj, frames)
+    system_info = {'water': np.arange(5, 60)}
+    # unsorted and repeated planes
+    planes = [7.5, 2.0, 5.0, 5.0, 0.3, 9.9]
+    fluxes, steps = calc_flux(str(trj), system_info, planes, area=4.0)
+    expected, expected_steps = old_calc_flux(str(trj), system_info, planes,
+                                             area=4.0)
+    assert steps == expected_steps
+    assert fluxes.shape == expected.shape
+    assert np.allclose(fluxes, expected, rtol=0, atol=1e-15)
+    assert fluxes.sum() > 0
+
+
+def test_voxel_density_matches_histogramdd(tmpdir):
+    rng = np.random.RandomState(5)
+    box = Box(mins=[0, 0, 0], maxs=[10.0, 10.0, 10.0])
+    types = rng.randint(1, 4, 300)
+    type_mass = {1: 12.011, 2: 1.008, 3: 15.999}
+    n_grid = [5, 4, 4]
+    z_bounds = [1.0, 9.0]
+    frames = list()
+    trj = str(tmpdir.join('voxel.lammpstrj'))
+    with TrajectoryWriter(trj) as writer:
+        for step in range(4):
+            # some atoms outside the box in x and y, to be wrapped
+            xyz = rng.uniform([-5, -5, 0], [15, 15, 10], (300, 3))
+            writer.write_frame(xyz, types, step=step, box=box)
+            frames.append(np.round(xyz, 4))
+
+    density, vol_per_voxel = voxel_density(
+        trj, None, box, n_grid=n_grid, z_bounds=z_bounds,
+        masses=MassTable(type_mass))
+
+    count = np.zeros(n_grid)
+    weights = np.array([type_mass[t] for t in types])
+    for xyz in frames:
+        inside = (xyz[:, 2] > z_bounds[0]) & (xyz[:, 2] < z_bounds[1])
+        wrapped = xyz[inside].copy()
+        wrapped[:, :2] %= 10.0
+        hist, _ = np.histogramdd(wrapped, bins=n_grid,
+                                 range=[(0, 10), (0, 10), z_bounds],
+                                 weights=weights[inside])
+        count += hist
+    assert vol_per_voxel == 10.0 * 10.0 * 8.0 / 80
+    expected = count * 1.660538 / vol_per_voxel / len(frames)
+    assert np.allclose(density, expected, rtol=1e-12, atol=0)
+    assert density.sum() > 0
+
+
+def old_layer_density(frames, types, indices, masses, type_offset, axis,
+                      planes, area):
+    """The plane by plane loop of the old calc_density, along any axis."""
+    densities = list()
+    for xyz, box in frames:
+        planes = np.array(planes, dtype=float)
+        planes[0] = box.mins[axis]
+        planes[-1] = box.maxs[axis]
+        selected = xyz[indices][:, axis]
+        selected_types = types[indices]
+        volumes = area * np.diff(planes)
+        row = np.empty(len(planes) - 1)
+        for i, plane in enumerate(planes[:-1]):
+            in_layer = np.where((selected > plane)
+                                & (selected < planes[i + 1]))[0]
+            row[i] = np.sum(masses[selected_types[in_layer] - type_offset])
+            row[i] /= volumes[i]
+        densities.append(row)
+    return np.array(densities)
+
+
+def test_binned_density_matches_layer_loop(tmpdir):
+    rng = np.random.RandomState(6)
+    types = rng.randint(20, 23, 200)
+    masses = np.array([12.011, 1.008, 15.999])
+    frames = list()
+    trj = str(tmpdir.join('density.lammpstrj'))
+    with TrajectoryWriter(trj) as writer:
+        for step in range(5):
+            box = Box(mins=[0, -1.0 - 0.1 * step, 0], maxs=[10, 9.0, 10])
+            # coarse coordinates so that atoms also sit exactly on planes
+            xyz = np.round(rng.uniform(box.mins, box.maxs, (200, 3)), 1)
+            writer.write_frame(xyz, types, step=step, box=box)
+            frames.append((xyz, box))
+    groups = {'all': np.arange(200), 'some': np.arange(0, 200, 3)}
+    planes = [0.0, 2.0, 2.5, 6.0, 9.0]
+
+    densities = binned_density(trj, groups, ['all', 'some'], masses, axis=1,
+                               planes=planes, area=25.0, type_offset=20)
+    assert planes == [0.0, 2.0, 2.5, 6.0, 9.0]
+    for group in groups:
+        expected = old_layer_density(frames, types, groups[group], masses, 20,
+                                     1, planes, 25.0)
+        assert densities[group].shape == (5, 4)
+        assert np.allclose(densities[group], expected, rtol=1e-12, atol=0)
+
+    first = calc_density(trj, groups, 'some', {20: 12.011, 21: 1.008,
+                                              22: 15.999}, 1, planes, 25.0,
+                         max_frames=2)
+    assert np.allclose(first, densities['some'][:2], rtol=1e-12, atol=0)
+
+
+def brute_force_survival(z, slabs, start_slabs, max_lag, origin_interval,
+                         continuous):
+    """Survival functions from explicit loops over origins, lags and atoms."""
+    n_frames = len(z)
+    survival = np.zeros(shape=(len(slabs), max_lag + 1))
+    for k, ((lo, hi), (start_lo, start_hi)) in enumerate(
+            zip(slabs, start_slabs)):
+        survived = np.zeros(max_lag + 1)
+        started = np.zeros(max_lag + 1)
+        for t0 in range(0, n_frames, origin_interval):
+            for lag in range(min(max_lag + 1, n_frames - t0)):
+                for i in range(z.shape[1]):
+                    if not start_lo < z[t0, i] < start_hi:
+                        continue
+                    started[lag] += 1
+                    if continuous:
+                        frames = z[t0:t0 + lag + 1, i]
+                    else:
+                        frames = z[t0 + lag:t0 + lag + 1, i]
+                    if np.all((frames > lo) & (frames < hi)):
+                        survived[lag] += 1
+        survival[k] = survived / started
+    return survival
+
+
+def test_residence_correlation_matches_loops(tmpdir):
+    rng = np.random.RandomState(8)
+    z = np.cumsum(rng.normal(0, 0.4, (40, 30)), axis=0) + rng.uniform(
+        0, 10, 30)
+    z = np.round(z, 4)
+    trj = tmpdir.join('res.lammpstrj')
+    write_trajectory(trj, z, length=40.0)
+    slabs = [(0.0, 5.0), (4.0, 9.0)]
+    start_slabs = [(1.0, 4.0), (4.0, 9.0)]
+    for continuous in (True, False):
+        time, survival = residence_correlation(
+            str(trj), {'water': np.arange(30)}, slabs,
+            start_slabs=start_slabs, max_lag=12, origin_interval=3,
+            continuous=continuous)
+        expected = brute_force_survival(z, slabs, start_slabs, 12, 3,
+                                        continuous)
+        assert np.allclose(survival, expected, rtol=1e-12, atol=0)
+    assert np.allclose(time, np.arange(13) / 1000.)
+
+
+def test_fit_residence_time_of_exponential():
+    rng = np.random.RandomState(9)
+    t = np.linspace(0, 50, 200)
+    y = 0.9 * np.exp(-t / 7.5) + 0.1 + rng.normal(0, 0.01, t.size)
+    y[-5:] = np.nan
+    res_time, (A, K, C) = fit_residence_time(t, y)
+    assert abs(res_time - 7.5) < 0.3
+    assert abs(A - 0.9) < 0.05 and abs(C - 0.1) < 0.02
+
+
+def test_binned_vel_profile_matches_samples(tmpdir):
+    rng = np.random.RandomState(10)
+    box = Box(mins=[0, 0, 0], maxs=[20.0, 20.0, 20.0])
+    xyz = rng.uniform(0, 20, (80, 3))
+    trj = str(tmpdir.join('vel.lammpstrj'))
+    with TrajectoryWriter(trj) as writer:
+        for step in range(0, 70, 10):
+            writer.write_frame(xyz, np.ones(80, dtype=int), step=step,
+                               box=box)
+            # drift in x that grows with z, without crossing the box
+            xyz = xyz + rng.normal(0, 0.05, xyz.shape)
+            xyz[:, 0] += 0.01 * xyz[:, 2]
+            xyz[:, 2] = np.clip(xyz[:, 2], 0.1, 19.9)
+    system_info = {'low': np.arange(40), 'high': np.arange(40, 80)}
+    profiles, edges = binned_vel_profile(trj, system_info, n_bins=8,
+                                         z_range=(2.0, 18.0))
+    samples = calc_vel_profile(trj, system_info)
+    assert np.allclose(edges, np.linspace(2, 18, 9))
+    for region, z_vx in samples.items():
+        count, mean, std = profiles[region]
+        assert mean.shape == std.shape == (8, 1)
+        expected_count, _ = np.histogram(z_vx[:, 0], bins=edges)
+        assert np.array_equal(count, expected_count)
+        for i in range(8):
+            vx = z_vx[(z_vx[:, 0] >= edges[i]) & (z_vx[:, 0] < edges[i + 1]),
+                      1]
+            if len(vx) == 0:
+                assert np.isnan(mean[i, 0])
+                continue
+            assert np.isclose(mean[i, 0], vx.mean(), rtol=1e-9, atol=1e-12)
+            assert np.isclose(std[i, 0], vx.std(), rtol=1e-6, atol=1e-9)
+
+
+def test_rayleigh_quantile_matches_scipy():
+    import scipy.stats
+    rng = np.random.RandomState(11)
+    z = scipy.stats.rayleigh.rvs(loc=3.0, scale=1.5, size=(4, 20000),
+                                 random_state=rng)
+    for q in (0.1, 0.9):
+        quantile = _rayleigh_quantile(z, q)
+        for row, value in zip(z, quantile):
+            scale = row.std() / scipy.stats.rayleigh.std()
+            loc = row.mean() - scale * scipy.stats.rayleigh.mean()
+            assert np.isclose(value, scipy.stats.rayleigh.ppf(q, loc, scale))
+        true = scipy.stats.rayleigh.ppf(q, 3.0, 1.5)
+        assert np.allclose(quantile, true, rtol=0.02)
+
+
+def test_film_heights_match_per_frame_bounds(tmpdir):
+    rng = np.random.RandomState(12)
+    z = np.column_stack((rng.uniform(1, 5, (6, 50)),
+                         rng.uniform(15, 19, (6, 40))))
+    z = np.round(z, 4)
+    trj = tmpdir.join('films.lammpstrj')
+    write_trajectory(trj, z, length=20.0)
+    system_info = {'botfilm': np.arange(50), 'topfilm': np.arange(50, 90)}
+    top, bot = film_heights(str(trj), system_info, method='percentile',
+                            cut=0.2)
+    for i, frame in enumerate(z):
+        top_z, bot_z = frame[50:], frame[:50]
+        assert np.allclose(top[i], [np.percentile(top_z, 20), top_z.max()])
+        assert np.allclose(bot[i], [bot_z.min(), np.percentile(bot_z, 80)])
+
+    top, bot = film_heights(str(trj), system_info, max_frames=4)
+    assert top.shape == bot.shape == (4, 2)
+    assert np.allclose(top[:, 0], np.clip(
+        _rayleigh_quantile(z[:4, 50:], 0.1), z[:4, 50:].min(axis=1),
+        z[:4, 50:].max(axis=1)))
+    assert np.allclose(bot[:, 1], _rayleigh_quantile(z[:4, :50], 0.9))
+    with pytest.raises(ValueError):
+        film_heights(str(trj), system_info, method='median')
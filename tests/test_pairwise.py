@@ -0,0 +1,79 @@
+import numpy as np
+
+from groupy.pairwise import ContactCount, DistanceHistogram, MinimumDistance, \
+    pairwise_distance_pbc, tile_shape
+
+DIMENSIONS = np.array([10.0, 12.0, 9.0])
+
+
+def brute_force_distances(x0, x1, dimensions):
+    d = np.empty(shape=(len(x0), len(x1)))
+    for i in range(len(x0)):
+        for j in range(len(x1)):
+            delta = np.abs(x0[i] - x1[j])
+            delta = np.minimum(delta, dimensions - delta)
+            d[i, j] = np.sqrt(np.sum(delta ** 2))
+    return d
+
+
+def points(n, seed):
+    return np.random.RandomState(seed).uniform(0, 1, (n, 3)) * DIMENSIONS
+
+
+class Collect():
+    """Reducer that copies every tile into a full matrix."""
+    def __init__(self, n_i, n_j):
+        self.d = np.full((n_i, n_j), np.nan)
+        self.tiles = 0
+
+    def __call__(self, d, i_start, j_start):
+        self.d[i_start:i_start + d.shape[0],
+               j_start:j_start + d.shape[1]] = d
+        self.tiles += 1
+
+
+def test_tile_shape_fits_budget():
+    block_i, block_j = tile_shape(1000, 300, max_memory=8 * 7 * 1000)
+    assert block_i * block_j <= 1000
+    assert tile_shape(5, 3) == (5, 3)
+
+
+def test_tiles_match_brute_force():
+    x0, x1 = points(37, 0), points(23, 1)
+    expected = brute_force_distances(x0, x1, DIMENSIONS)
+    # a budget of 50 pairs per tile gives many uneven tiles
+    collect = pairwise_distance_pbc(x0, x1, DIMENSIONS, Collect(37, 23),
+                                    max_memory=8 * 7 * 50)
+    assert collect.tiles > 1
+    assert np.allclose(collect.d, expected, rtol=0, atol=1e-12)
+
+
+def test_exclude_self():
+    x = points(31, 2)
+    expected = brute_force_distances(x, x, DIMENSIONS)
+    np.fill_diagonal(expected, np.inf)
+    collect = pairwise_distance_pbc(x, x, DIMENSIONS, Collect(31, 31),
+                                    exclude_self=True, max_memory=8 * 7 * 40)
+    assert np.allclose(collect.d, expected, rtol=0, atol=1e-12)
+
+
+def test_reducers_match_brute_force():
+    x0, x1 = points(40, 3), points(55, 4)
+    expected = brute_force_distances(x0, x1, DIMENSIONS)
+    budget = 8 * 7 * 60
+
+    histogram = pairwise_distance_pbc(
+        x0, x1, DIMENSIONS, DistanceHistogram(bins=20, r_range=(1.0, 6.0)),
+        max_memory=budget)
+    counts, _ = np.histogram(expected, bins=20, range=(1.0, 6.0))
+    assert np.array_equal(histogram.counts, counts)
+
+    nearest = pairwise_distance_pbc(x0, x1, DIMENSIONS, MinimumDistance(40),
+                                    max_memory=budget)
+    assert np.array_equal(nearest.index, expected.argmin(axis=1))
+    assert np.allclose(nearest.distance, expected.min(axis=1))
+
+    contacts = pairwise_distance_pbc(x0, x1, DIMENSIONS, ContactCount(40, 3.0),
+                                     max_memory=budget)
+    assert np.array_equal(contacts.counts, (expected < 3.0).sum(axis=1))
+    assert contacts.total == int((expected < 3.0).sum())
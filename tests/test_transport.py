@@ -0,0 +1,101 @@
+import numpy as np
+
+from groupy.box import Box
+from groupy.mdio import TrajectoryWriter
+from groupy.transport import THZ_TO_INV_CM, _autocorrelation_fft, calc_msd, \
+    calc_vacf, calc_vdos, diffusion_coefficient, msd_fft
+
+
+def direct_msd(x):
+    """MSD summed over the atoms and averaged over all time origins, with an
+    O(T^2) loop."""
+    n_frames = x.shape[0]
+    msd = np.zeros(shape=(n_frames, x.shape[2]))
+    for lag in range(n_frames):
+        d = x[lag:] - x[:n_frames - lag]
+        msd[lag] = (d ** 2).sum(axis=1).mean(axis=0)
+    return msd
+
+
+def test_msd_fft_matches_direct():
+    x = np.cumsum(np.random.RandomState(0).normal(size=(64, 7, 3)), axis=0)
+    assert np.allclose(msd_fft(x), direct_msd(x), rtol=1e-10, atol=1e-10)
+    # odd number of frames and a single frame
+    assert np.allclose(msd_fft(x[:33]), direct_msd(x[:33]), atol=1e-10)
+    assert np.allclose(msd_fft(x[:1]), 0)
+
+
+def test_calc_msd_unwraps_positions(tmpdir):
+    rng = np.random.RandomState(1)
+    length = 6.0
+    box = Box(mins=[0, 0, 0], maxs=[length] * 3)
+    positions = np.cumsum(rng.normal(0, 0.7, (30, 10, 3)), axis=0)
+    trj = str(tmpdir.join('msd.lammpstrj'))
+    with TrajectoryWriter(trj) as writer:
+        for i, xyz in enumerate(positions):
+            writer.write_frame(xyz % length, np.ones(10, dtype=int),
+                               step=20 * i, box=box)
+    system_info = {'a': np.arange(0, 10, 2), 'b': np.arange(10)}
+    time, msd = calc_msd(trj, system_info, ['a', 'b'], timestep=2.0,
+                         max_memory=30 * 3 * 8 * 4 * 3)
+    assert np.allclose(time, np.arange(30) * 0.04)
+    for group, atoms in system_info.items():
+        # positions are written with 4 decimals
+        expected = direct_msd(positions[:, atoms]) / len(atoms)
+        assert np.allclose(msd[group], expected, rtol=1e-3, atol=1e-3)
+
+
+def test_diffusion_coefficient_of_linear_msd():
+    time = np.linspace(0, 100, 101)
+    # D = 0.5 A^2/ps in every direction
+    msd = np.outer(time, [1.0, 1.0, 1.0])
+    assert np.isclose(diffusion_coefficient(time, msd), 0.5e-4)
+    assert np.isclose(diffusion_coefficient(time, msd, axes=(0, 1)), 0.5e-4)
+
+
+def direct_autocorrelation(x):
+    """<x(t0) x(t0 + t)> summed over the atoms, with an O(T^2) loop."""
+    n_frames = x.shape[0]
+    acf = np.zeros(shape=(n_frames, x.shape[2]))
+    for lag in range(n_frames):
+        acf[lag] = (x[lag:] * x[:n_frames - lag]).sum(axis=1).mean(axis=0)
+    return acf
+
+
+def test_autocorrelation_fft_matches_direct():
+    v = np.random.RandomState(2).normal(size=(50, 6, 3))
+    assert np.allclose(_autocorrelation_fft(v), direct_autocorrelation(v),
+                       rtol=1e-10, atol=1e-10)
+
+
+def test_calc_vacf_reads_velocities(tmpdir):
+    rng = np.random.RandomState(3)
+    velocities = rng.normal(size=(20, 8, 3))
+    trj = tmpdir.join('vel.lammpstrj')
+    lines = list()
+    for i, v in enumerate(velocities):
+        lines += ['ITEM: TIMESTEP', str(5 * i), 'ITEM: NUMBER OF ATOMS', '8',
+                  'ITEM: BOX BOUNDS pp pp pp', '0 10', '0 10', '0 10',
+                  'ITEM: ATOMS id type x y z vx vy vz']
+        # atoms in reverse order, they are sorted by id
+        for j in reversed(range(8)):
+            lines.append('%d 1 1.0 2.0 3.0 %.8f %.8f %.8f'
+                         % ((j + 1,) + tuple(v[j])))
+    trj.write('\n'.join(lines) + '\n')
+    time, vacf = calc_vacf(str(trj), {'all': np.arange(8)}, ['all'],
+                           timestep=2.0)
+    assert np.allclose(time, np.arange(20) * 0.01)
+    assert np.allclose(vacf['all'], direct_autocorrelation(velocities) / 8,
+                       atol=1e-7)
+
+
+def test_vdos_peaks_at_oscillator_frequency():
+    # VACF of a harmonic oscillator at 15 THz
+    time = np.arange(2000) * 0.002
+    frequency = 15.0
+    vacf = np.cos(2 * np.pi * frequency * time)[:, np.newaxis] * [1, 1, 1]
+    freq, vdos = calc_vdos(time, vacf)
+    peak = freq[np.argmax(vdos)]
+    assert abs(peak - frequency * THZ_TO_INV_CM) < freq[1]
+    assert np.isclose(np.sum(0.5 * (vdos[1:] + vdos[:-1]) * np.diff(freq)),
+                      1.0)